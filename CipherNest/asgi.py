@@ -9,8 +9,20 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CipherNest.settings')
 
-application = get_asgi_application()
+django.setup(set_prefix=False)
+
+# Like get_asgi_application(), but client disconnects cancel the running view
+from utils.cancellation import CancellableASGIHandler  # noqa: E402
+
+application = CancellableASGIHandler()
+
+from django.conf import settings  # noqa: E402
+
+if settings.LSB_WARM_UP:
+    from lsb.registry import warm_up
+
+    warm_up()
@@ -44,16 +44,22 @@ INSTALLED_APPS = [
     "corsheaders",
     "cover_file",
     "lsb",
-    "embedded_file"
+    "embedded_file",
+    "upload",
+    "artifact",
 ]
 
 MIDDLEWARE = [
+    "utils.cancellation.CancellationMiddleware",
+    "utils.memory.MemoryMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    # After authentication: X-Profile is only honoured for staff users
+    "utils.profiling.ProfilingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -142,8 +148,92 @@ REST_FRAMEWORK = {
     "EXCEPTION_HANDLER": "utils.response.custom_exception_handler",
 }
 
+# LSB engine used for embedding and extraction: "loop", "bytes", "parallel"
+# (worker processes), or "auto" to pick one per call from the size thresholds
+# calibrated at warm-up (see /diagnostics/dispatch/)
+LSB_ENGINE = os.environ.get("LSB_ENGINE", "auto")
+
+# Build the shared LSB engines, calibrate "auto" and run a warm-up round trip
+# at worker boot
+LSB_WARM_UP = os.environ.get("LSB_WARM_UP", "true").lower() == "true"
+
+# Decoder for covers without a native parser: "ffmpeg" (pipes) or "pydub".
+# The ffmpeg backend falls back to pydub when the binary is missing or fails.
+AUDIO_BACKEND = os.environ.get("AUDIO_BACKEND", "ffmpeg")
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+# FLAC covers longer than this many interleaved samples (or of unknown length)
+# are decoded by ffmpeg when it is available; the native decoder is pure Python.
+FLAC_NATIVE_MAX_SAMPLES = int(os.environ.get("FLAC_NATIVE_MAX_SAMPLES", 256 * 1024))
+
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "false").lower() == "true"
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", 0))
+PROFILING_INTERVAL = float(os.environ.get("PROFILING_INTERVAL", 0.005))
+PROFILING_DIR = os.environ.get("PROFILING_DIR", BASE_DIR / "profiles")
+# Oldest profiles are deleted past this many files in PROFILING_DIR
+PROFILING_MAX_FILES = int(os.environ.get("PROFILING_MAX_FILES", 200))
+# X-Profile is honoured for staff users, or for anyone sending this value in it
+PROFILING_SECRET = os.environ.get("PROFILING_SECRET", "")
+# "collapsed" or "speedscope"
+PROFILING_FORMAT = os.environ.get("PROFILING_FORMAT", "collapsed")
+
+MEMORY_TRACKING = os.environ.get("MEMORY_TRACKING", "false").lower() == "true"
+# Per-request ceiling in bytes, checked as each stage ends; 0 disables it
+MEMORY_BUDGET = int(os.environ.get("MEMORY_BUDGET", 0))
+
+SCHEDULER_LIGHT_WORKERS = int(os.environ.get("SCHEDULER_LIGHT_WORKERS", 8))
+SCHEDULER_LIGHT_QUEUE = int(os.environ.get("SCHEDULER_LIGHT_QUEUE", 64))
+SCHEDULER_HEAVY_WORKERS = int(os.environ.get("SCHEDULER_HEAVY_WORKERS", 2))
+SCHEDULER_HEAVY_QUEUE = int(os.environ.get("SCHEDULER_HEAVY_QUEUE", 4))
+# Estimated milliseconds of work from which a request counts as heavy
+SCHEDULER_HEAVY_COST = float(os.environ.get("SCHEDULER_HEAVY_COST", 200))
+
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", BASE_DIR / "uploads")
+UPLOAD_MAX_SIZE = int(os.environ.get("UPLOAD_MAX_SIZE", 1024 * 1024 * 1024))
+# Seconds a reader of an unfinished upload may spend waiting for chunks in total
+UPLOAD_WAIT_TIMEOUT = float(os.environ.get("UPLOAD_WAIT_TIMEOUT", 30))
+UPLOAD_TTL = int(os.environ.get("UPLOAD_TTL", 24 * 60 * 60))
+
+# Finished stego covers, kept for resumable and cacheable downloads for
+# ARTIFACT_TTL seconds
+ARTIFACT_DIR = os.environ.get("ARTIFACT_DIR", BASE_DIR / "artifacts")
+ARTIFACT_TTL = int(os.environ.get("ARTIFACT_TTL", 60 * 60))
+
+# Compressed secret files by SHA-256 of their bytes: a per-process LRU plus,
+# when PAYLOAD_CACHE_DIR is set, a directory shared by the workers, each
+# bounded in bytes. Files embedded with a password are never cached, not
+# even compressed.
+PAYLOAD_CACHE_MEMORY_BYTES = int(os.environ.get("PAYLOAD_CACHE_MEMORY_BYTES", 64 * 1024 * 1024))
+PAYLOAD_CACHE_DIR = os.environ.get("PAYLOAD_CACHE_DIR", "")
+PAYLOAD_CACHE_DISK_BYTES = int(os.environ.get("PAYLOAD_CACHE_DISK_BYTES", 1024 * 1024 * 1024))
+
+# Keeps the test suite off shared directories such as the payload cache
+TEST_RUNNER = "testing.runner.TestRunner"
+
+# Seconds between checks of the client sockets of running requests for a
+# disconnect (gunicorn), 0 disables the checks
+DISCONNECT_POLL_INTERVAL = float(os.environ.get("DISCONNECT_POLL_INTERVAL", 0.5))
+
+# Payloads prepared speculatively by /covers/ for the /embed/ that follows.
+# Seconds a preparation token stays valid, 0 disables the preparation.
+PREPARATION_TTL = float(os.environ.get("PREPARATION_TTL", 120))
+PREPARATION_CACHE_ENTRIES = int(os.environ.get("PREPARATION_CACHE_ENTRIES", 32))
+PREPARATION_CACHE_BYTES = int(os.environ.get("PREPARATION_CACHE_BYTES", 256 * 1024 * 1024))
+PREPARATION_WORKERS = int(os.environ.get("PREPARATION_WORKERS", 2))
+
+# Audio file fields are checked and spooled by the first handler as they arrive
+FILE_UPLOAD_HANDLERS = [
+    "upload.handlers.AudioUploadHandler",
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "django.core.files.uploadhandler.TemporaryFileUploadHandler",
+]
+
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_EXPOSE_HEADERS = [
     'Content-Disposition',
+    'X-Preparation-Token',
+    'Content-Location',
+    'Content-Range',
+    'Accept-Ranges',
+    'ETag',
 ]
 
@@ -18,8 +18,19 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from lsb.views import DispatchDiagnosticsView
+from utils.metrics import MetricsView
+
 urlpatterns = [
     path("", include("cover_file.urls")),
     path("", include("embedded_file.urls")),
+    path("", include("upload.urls")),
+    path("", include("artifact.urls")),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
+    path(
+        "diagnostics/dispatch/",
+        DispatchDiagnosticsView.as_view(),
+        name="dispatch-diagnostics",
+    ),
     path("admin/", admin.site.urls),
 ]
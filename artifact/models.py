@@ -0,0 +1,267 @@
+import hashlib
+import io
+import json
+import os
+import re
+import secrets
+import tempfile
+import time
+from typing import Iterable
+
+from django.conf import settings
+from django.urls import reverse
+
+from lsb.cancel import checkpoint
+from utils.exceptions import ArtifactNotFoundError
+
+ARTIFACT_ID = re.compile(r"^[0-9a-f]{64}$")
+COPY_BLOCK_SIZE = 256 * 1024
+
+
+class Artifact:
+    """
+    A finished stego cover or extraction zip kept in ``ARTIFACT_DIR``.
+
+    ``<id>.bin`` holds the bytes and ``<id>.json`` the download metadata.
+    The id of a stored artifact is the SHA-256 of the bytes, so the same
+    result is stored once; an artifact streamed while it is written gets a
+    random id up front instead. Either way the bytes behind an id never
+    change and it doubles as a strong ETag. Artifacts older than
+    ``ARTIFACT_TTL`` are purged whenever a new one is stored.
+    """
+
+    def __init__(
+        self,
+        artifact_id: str,
+        filename: str,
+        content_type: str,
+        size: int,
+        created_at: float = None,
+    ) -> None:
+        self.artifact_id = artifact_id
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size
+        self.created_at = created_at or time.time()
+
+    @staticmethod
+    def directory() -> str:
+        os.makedirs(settings.ARTIFACT_DIR, exist_ok=True)
+        return str(settings.ARTIFACT_DIR)
+
+    @property
+    def data_path(self) -> str:
+        return os.path.join(self.directory(), f"{self.artifact_id}.bin")
+
+    @property
+    def state_path(self) -> str:
+        return os.path.join(self.directory(), f"{self.artifact_id}.json")
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.artifact_id}"'
+
+    @property
+    def expires_at(self) -> float:
+        return self.created_at + settings.ARTIFACT_TTL
+
+    @property
+    def url(self) -> str:
+        return reverse("artifact-download", args=[self.artifact_id])
+
+    def to_dict(self) -> dict:
+        return {
+            "artifact_id": self.artifact_id,
+            "filename": self.filename,
+            "content_type": self.content_type,
+            "size": self.size,
+            "url": self.url,
+            "expires_at": self.expires_at,
+        }
+
+    def save(self) -> None:
+        state = {
+            "filename": self.filename,
+            "content_type": self.content_type,
+            "size": self.size,
+            "created_at": self.created_at,
+        }
+        # Unique per call: threads of one process can save the same artifact
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory(), prefix=".tmp-")
+        try:
+            with os.fdopen(descriptor, "w") as file:
+                json.dump(state, file)
+            os.replace(temporary, self.state_path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    @classmethod
+    def store(cls, chunks: Iterable[bytes], filename: str, content_type: str) -> "Artifact":
+        """Write ``chunks`` to the store, hashing them on the way."""
+        cls.purge_expired()
+        digest = hashlib.sha256()
+        size = 0
+        descriptor, temporary = tempfile.mkstemp(dir=cls.directory(), prefix=".tmp-")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                for chunk in chunks:
+                    checkpoint()
+                    file.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            artifact = cls(digest.hexdigest(), filename, content_type, size)
+            # An identical result already stored is replaced by the same bytes
+            os.replace(temporary, artifact.data_path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+        artifact.save()
+        return artifact
+
+    @classmethod
+    def stream(cls, chunks: Iterable[bytes], filename: str, content_type: str) -> "ArtifactStream":
+        """``chunks``, written to a new artifact while the caller sends them."""
+        cls.purge_expired()
+        artifact = cls(secrets.token_hex(32), filename, content_type, 0)
+        return ArtifactStream(artifact, chunks)
+
+    @classmethod
+    def store_file(cls, file, filename: str, content_type: str) -> "Artifact":
+        blocks = iter(lambda: file.read(COPY_BLOCK_SIZE), b"")
+        return cls.store(blocks, filename, content_type)
+
+    @classmethod
+    def get(cls, artifact_id: str) -> "Artifact":
+        if not ARTIFACT_ID.match(artifact_id or ""):
+            raise ArtifactNotFoundError()
+        try:
+            with open(os.path.join(cls.directory(), f"{artifact_id}.json")) as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            raise ArtifactNotFoundError()
+        artifact = cls(artifact_id, **state)
+        if artifact.expires_at < time.time() or not os.path.exists(artifact.data_path):
+            raise ArtifactNotFoundError()
+        return artifact
+
+    @classmethod
+    def purge_expired(cls) -> None:
+        deadline = time.time() - settings.ARTIFACT_TTL
+        for name in os.listdir(cls.directory()):
+            path = os.path.join(cls.directory(), name)
+            try:
+                if os.path.getmtime(path) < deadline:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def open_range(self, start: int, length: int) -> "RangeReader":
+        return RangeReader(open(self.data_path, "rb"), start, length)
+
+
+class ArtifactStream:
+    """
+    Chunks passed on to a response while they are written to ``artifact``.
+
+    The artifact is saved once the chunks run out. A client that goes away
+    early does not leave a partial file: ``close`` writes the rest so the
+    download can resume, and runs the ``on_close`` callbacks afterwards.
+    A failing source discards the file.
+    """
+
+    def __init__(self, artifact: Artifact, chunks: Iterable[bytes]) -> None:
+        self.artifact = artifact
+        self.chunks = iter(chunks)
+        self.on_close = []
+        self.finished = False
+        descriptor, self.temporary = tempfile.mkstemp(dir=artifact.directory(), prefix=".tmp-")
+        self.file = os.fdopen(descriptor, "wb")
+
+    def _write(self, chunk: bytes) -> None:
+        checkpoint()
+        self.file.write(chunk)
+        self.artifact.size += len(chunk)
+
+    def _finish(self) -> None:
+        self.finished = True
+        self.file.close()
+        os.replace(self.temporary, self.artifact.data_path)
+        self.artifact.save()
+
+    def _discard(self) -> None:
+        self.finished = True
+        self.file.close()
+        os.remove(self.temporary)
+
+    def __iter__(self):
+        try:
+            for chunk in self.chunks:
+                self._write(chunk)
+                yield chunk
+        except GeneratorExit:
+            # The response stopped reading; close() writes the rest
+            raise
+        except BaseException:
+            self._discard()
+            raise
+        self._finish()
+
+    def close(self) -> None:
+        try:
+            if not self.finished:
+                try:
+                    for chunk in self.chunks:
+                        self._write(chunk)
+                except BaseException:
+                    self._discard()
+                    raise
+                self._finish()
+        finally:
+            for callback in self.on_close:
+                callback()
+
+
+class RangeReader(io.RawIOBase):
+    """
+    ``length`` bytes of ``file`` from ``start``, as a file of their own.
+
+    FileResponse measures a file object by seeking to its end, so the
+    window has to look like a whole file for Content-Length to come out
+    right.
+    """
+
+    def __init__(self, file, start: int, length: int) -> None:
+        super().__init__()
+        self.file = file
+        self.start = start
+        self.length = length
+        self.position = 0
+        self.file.seek(start)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.length}[whence]
+        self.position = min(max(base + offset, 0), self.length)
+        self.file.seek(self.start + self.position)
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self.length - self.position)
+        if size <= 0:
+            return 0
+        read = self.file.readinto(memoryview(buffer)[:size])
+        self.position += read
+        return read
+
+    def close(self) -> None:
+        self.file.close()
+        super().close()
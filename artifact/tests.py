@@ -0,0 +1,189 @@
+import io
+import os
+import tempfile
+import threading
+import time
+
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from testing.audio import make_wav
+from utils.constants import Code
+from utils.exceptions import ArtifactNotFoundError
+from .models import Artifact
+from .views import RangeNotSatisfiable, parse_range
+
+
+class ArtifactTests(APITestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        settings = override_settings(ARTIFACT_DIR=self.tmpdir.name, ARTIFACT_TTL=60)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.data = bytes(range(256)) * 40
+        self.artifact = Artifact.store([self.data[:5000], self.data[5000:]], "a.bin", "audio/wav")
+
+    def download(self, **headers):
+        return self.client.get(self.artifact.url, **headers)
+
+    def test_store_is_content_addressed(self):
+        again = Artifact.store_file(io.BytesIO(self.data), "b.bin", "audio/wav")
+        self.assertEqual(again.artifact_id, self.artifact.artifact_id)
+        self.assertEqual(Artifact.get(again.artifact_id).filename, "b.bin")
+        self.assertEqual(len(os.listdir(self.tmpdir.name)), 2)
+
+    def test_concurrent_saves(self):
+        errors = []
+
+        def save():
+            try:
+                for _ in range(50):
+                    self.artifact.save()
+            except OSError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=save) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(os.listdir(self.tmpdir.name)), 2)
+        self.assertEqual(Artifact.get(self.artifact.artifact_id).filename, "a.bin")
+
+    def test_full_download(self):
+        response = self.download()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(response.streaming_content), self.data)
+        self.assertEqual(response["Content-Length"], str(len(self.data)))
+        self.assertEqual(response["ETag"], self.artifact.etag)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertIn('filename="a.bin"', response["Content-Disposition"])
+
+    def test_range(self):
+        response = self.download(HTTP_RANGE="bytes=100-199")
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b"".join(response.streaming_content), self.data[100:200])
+        self.assertEqual(response["Content-Length"], "100")
+        self.assertEqual(response["Content-Range"], f"bytes 100-199/{len(self.data)}")
+
+        response = self.download(HTTP_RANGE="bytes=10000-")
+        self.assertEqual(b"".join(response.streaming_content), self.data[10000:])
+
+        response = self.download(HTTP_RANGE="bytes=-10")
+        self.assertEqual(b"".join(response.streaming_content), self.data[-10:])
+
+    def test_unsatisfiable_range(self):
+        response = self.download(HTTP_RANGE=f"bytes={len(self.data)}-")
+        self.assertEqual(
+            response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+        self.assertEqual(response["Content-Range"], f"bytes */{len(self.data)}")
+
+    def test_if_range_of_another_version_sends_everything(self):
+        response = self.download(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(response.streaming_content), self.data)
+
+    def test_if_none_match(self):
+        response = self.download(HTTP_IF_NONE_MATCH=self.artifact.etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], self.artifact.etag)
+
+        response = self.download(HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_expired_and_unknown(self):
+        with override_settings(ARTIFACT_TTL=0):
+            time.sleep(0.01)
+            response = self.download()
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+            self.assertEqual(response.json()["code"], Code.ARTIFACT_NOT_FOUND.value)
+
+            Artifact.purge_expired()
+            self.assertEqual(os.listdir(self.tmpdir.name), [])
+
+        response = self.client.get(reverse("artifact-download", args=["not-an-artifact"]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_parse_range(self):
+        self.assertIsNone(parse_range(None, 10))
+        self.assertIsNone(parse_range("bytes=0-1,4-5", 10))
+        self.assertEqual(parse_range("bytes=2-100", 10), (2, 8))
+        self.assertEqual(parse_range("bytes=-100", 10), (0, 10))
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range("bytes=5-4", 10)
+
+    def test_embed_links_the_artifact(self):
+        cover_file = io.BytesIO(make_wav(bytes(40000)))
+        cover_file.name = "cover.wav"
+        secret_file = io.BytesIO(b"secret")
+        secret_file.name = "secret.txt"
+        response = self.client.post(
+            reverse("embed"),
+            {"cover_file": cover_file, "output_quality": "low", "secret_files": [secret_file]},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        stego = b"".join(response.streaming_content)
+
+        response = self.client.get(response["Content-Location"], HTTP_RANGE="bytes=0-43")
+        self.assertEqual(b"".join(response.streaming_content), stego[:44])
+
+    def test_stream_writes_the_artifact_while_it_is_sent(self):
+        stream = Artifact.stream([self.data[:5000], self.data[5000:]], "c.bin", "audio/wav")
+        closed = []
+        stream.on_close.append(lambda: closed.append(True))
+        chunks = iter(stream)
+        self.assertEqual(next(chunks), self.data[:5000])
+        with self.assertRaises(ArtifactNotFoundError):
+            Artifact.get(stream.artifact.artifact_id)
+        self.assertEqual(next(chunks, None), self.data[5000:])
+        self.assertEqual(next(chunks, None), None)
+        stream.close()
+        self.assertEqual(closed, [True])
+        artifact = Artifact.get(stream.artifact.artifact_id)
+        self.assertEqual(artifact.size, len(self.data))
+        with open(artifact.data_path, "rb") as file:
+            self.assertEqual(file.read(), self.data)
+
+    def test_stream_closed_early_still_finishes_the_artifact(self):
+        stream = Artifact.stream([self.data[:5000], self.data[5000:]], "c.bin", "audio/wav")
+        self.assertEqual(next(iter(stream)), self.data[:5000])
+        stream.close()
+        with open(Artifact.get(stream.artifact.artifact_id).data_path, "rb") as file:
+            self.assertEqual(file.read(), self.data)
+
+    def test_stream_discards_a_failed_artifact(self):
+        def chunks():
+            yield self.data[:5000]
+            raise ValueError("encoder failed")
+
+        before = set(os.listdir(self.tmpdir.name))
+        stream = Artifact.stream(chunks(), "c.bin", "audio/wav")
+        with self.assertRaises(ValueError):
+            list(stream)
+        stream.close()
+        self.assertEqual(set(os.listdir(self.tmpdir.name)), before)
+
+    def test_embed_as_json(self):
+        cover_file = io.BytesIO(make_wav(bytes(40000)))
+        cover_file.name = "cover.wav"
+        secret_file = io.BytesIO(b"secret")
+        secret_file.name = "secret.txt"
+        response = self.client.post(
+            reverse("embed"),
+            {"cover_file": cover_file, "output_quality": "low", "secret_files": [secret_file]},
+            format="multipart",
+            HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.json()["data"]
+        self.assertEqual(data["filename"], "cover.wav")
+        self.assertEqual(response["Location"], data["url"])
+
+        response = self.client.get(data["url"])
+        self.assertEqual(len(b"".join(response.streaming_content)), data["size"])
@@ -0,0 +1,11 @@
+from django.urls import path
+
+from .views import ArtifactDownloadView
+
+urlpatterns = [
+    path(
+        "artifacts/<str:artifact_id>/",
+        ArtifactDownloadView.as_view(),
+        name="artifact-download",
+    ),
+]
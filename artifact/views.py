@@ -0,0 +1,131 @@
+import re
+import time
+
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from rest_framework import status
+from rest_framework.views import APIView
+
+from utils.constants import Code
+from utils.response import standard_response
+from .models import Artifact, ArtifactStream
+
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: str, size: int):
+    """
+    ``(start, length)`` of a single-range ``Range`` header, or None to send
+    the whole file (no header, a syntax we do not serve, or several ranges).
+    """
+    match = RANGE.match(header.strip()) if header else None
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        # A suffix: the last N bytes
+        length = min(int(last), size)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return size - length, length
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, end - start + 1
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    tags = [tag.strip() for tag in header.split(",")]
+    # Weak comparison, as RFC 9110 asks for If-None-Match
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def cache_headers(response: HttpResponse, artifact: Artifact) -> HttpResponse:
+    response["ETag"] = artifact.etag
+    response["Accept-Ranges"] = "bytes"
+    response["Content-Location"] = artifact.url
+    max_age = max(int(artifact.expires_at - time.time()), 0)
+    response["Cache-Control"] = f"public, max-age={max_age}, immutable"
+    return response
+
+
+def wants_json(request) -> bool:
+    return "application/json" in request.META.get("HTTP_ACCEPT", "")
+
+
+def artifact_response(request, artifact: Artifact, content_disposition: str):
+    """
+    The response of a POST that produced ``artifact``: its bytes, or, for a
+    client that asks for JSON, where to download them.
+    """
+    if wants_json(request):
+        data = artifact.to_dict()
+        data["url"] = request.build_absolute_uri(artifact.url)
+        response = standard_response(
+            code=Code.SUCCESS.value,
+            message="Your file is ready to download",
+            data=data,
+            status=status.HTTP_201_CREATED,
+        )
+        response["Location"] = data["url"]
+        return response
+
+    response = FileResponse(
+        open(artifact.data_path, "rb"), content_type=artifact.content_type
+    )
+    response["Content-Disposition"] = content_disposition
+    return cache_headers(response, artifact)
+
+
+def streaming_artifact_response(
+    stream: ArtifactStream, content_disposition: str, content_length: int = None
+):
+    """The bytes of an artifact being written, sent as they are produced."""
+    response = StreamingHttpResponse(stream, content_type=stream.artifact.content_type)
+    response["Content-Disposition"] = content_disposition
+    if content_length is not None:
+        response["Content-Length"] = str(content_length)
+    return cache_headers(response, stream.artifact)
+
+
+class ArtifactDownloadView(APIView):
+    def get(self, request, artifact_id):
+        artifact = Artifact.get(artifact_id)
+
+        if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+        if if_none_match and etag_matches(if_none_match, artifact.etag):
+            return cache_headers(HttpResponse(status=status.HTTP_304_NOT_MODIFIED), artifact)
+
+        byte_range = None
+        if_range = request.META.get("HTTP_IF_RANGE")
+        # A range of another version of the file would corrupt the download
+        if not if_range or if_range.strip() == artifact.etag:
+            try:
+                byte_range = parse_range(request.META.get("HTTP_RANGE"), artifact.size)
+            except RangeNotSatisfiable:
+                response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+                response["Content-Range"] = f"bytes */{artifact.size}"
+                return cache_headers(response, artifact)
+
+        if byte_range is None:
+            response = FileResponse(
+                open(artifact.data_path, "rb"),
+                as_attachment=True,
+                filename=artifact.filename,
+                content_type=artifact.content_type,
+            )
+        else:
+            start, length = byte_range
+            response = FileResponse(
+                artifact.open_range(start, length),
+                as_attachment=True,
+                filename=artifact.filename,
+                content_type=artifact.content_type,
+                status=status.HTTP_206_PARTIAL_CONTENT,
+            )
+            response["Content-Range"] = f"bytes {start}-{start + length - 1}/{artifact.size}"
+        return cache_headers(response, artifact)
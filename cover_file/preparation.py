@@ -0,0 +1,178 @@
+"""
+Speculative payload preparation between /covers/ and /embed/.
+
+The UI checks the free space with the secret files and password, then
+embeds the same files a few seconds later. Once /covers/ knows they fit,
+it starts compressing and encrypting them in the background and returns
+a preparation token; /embed/ hands the token back and, if the entry is
+still cached and was made from the same files, flags and password, skips
+straight to bit-packing.
+
+Entries are single use and live for ``PREPARATION_TTL`` seconds, in a
+cache bounded by entry count and bytes. Like the scheduler lanes the
+cache is per process: a token that lands on another worker, expired or
+was evicted is a miss, and the embed prepares the payload itself.
+"""
+
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List
+
+from django.conf import settings
+from django.core.signals import setting_changed
+
+from lsb.file import File
+from utils.metrics import metrics
+
+PREPARATION_HEADER = "X-Preparation-Token"
+
+metrics.describe("preparation_total", "Embed requests by preparation cache outcome")
+
+
+class Preparation:
+    def __init__(self, fingerprint: bytes, secret_files: List[File], size: int) -> None:
+        self.fingerprint = fingerprint
+        self.secret_files = secret_files
+        self.size = size
+        self.created_at = time.monotonic()
+        self.future: Future = None
+
+
+class PreparationCache:
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int, workers: int) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, Preparation]" = OrderedDict()
+        self.size = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="preparation"
+        )
+        # Fingerprints are keyed per process so they reveal nothing about the password
+        self._key = os.urandom(32)
+        self._lock = threading.Lock()
+
+    def fingerprint(
+        self, secret_files: List[File], compressed: bool, passphrase: str, solid: bool = False
+    ) -> bytes:
+        digest = hmac.new(self._key, digestmod=hashlib.sha256)
+        digest.update(b"2" if solid else b"1" if compressed else b"0")
+        digest.update(b"-" if passphrase is None else b"+" + passphrase.encode())
+        for secret_file in secret_files:
+            digest.update(b"\0" + secret_file.name.encode() + b"\0")
+            digest.update(hashlib.sha256(secret_file.raw_data).digest())
+        return digest.digest()
+
+    def _expire(self, now: float) -> None:
+        # Entries are kept in creation order, so the expired ones come first
+        while self.entries:
+            token, entry = next(iter(self.entries.items()))
+            if now - entry.created_at < self.ttl:
+                break
+            self._drop(token)
+
+    def _drop(self, token: str) -> Preparation:
+        entry = self.entries.pop(token)
+        self.size -= entry.size
+        return entry
+
+    def prepare(
+        self,
+        algorithm,
+        secret_files: List[File],
+        compressed: bool,
+        passphrase: str,
+        solid: bool = False,
+    ) -> str:
+        """Start preparing the payloads in the background, or None if they cannot be cached."""
+        # Raw data plus the prepared copy
+        size = 2 * File.total_size(secret_files)
+        if not self.ttl or not secret_files or size > self.max_bytes:
+            return None
+        fingerprint = self.fingerprint(secret_files, compressed, passphrase, solid)
+        entry = Preparation(fingerprint, secret_files, size)
+        token = secrets.token_urlsafe(16)
+        with self._lock:
+            self._expire(time.monotonic())
+            while self.entries and (
+                len(self.entries) >= self.max_entries or self.size + size > self.max_bytes
+            ):
+                self._drop(next(iter(self.entries)))
+            self.entries[token] = entry
+            self.size += size
+        entry.future = self._executor.submit(
+            algorithm.prepare_payloads, secret_files, compressed, passphrase, solid
+        )
+        return token
+
+    def take(
+        self,
+        token: str,
+        secret_files: List[File],
+        compressed: bool,
+        passphrase: str,
+        solid: bool = False,
+    ):
+        """
+        The prepared files and payloads for ``token``, waiting for them if
+        the work is still running, or None when the embed has to prepare
+        them itself.
+        """
+        with self._lock:
+            self._expire(time.monotonic())
+            entry = self._drop(token) if token in self.entries else None
+        if entry is None:
+            metrics.inc("preparation_total", {"result": "miss"})
+            return None
+        if not hmac.compare_digest(
+            entry.fingerprint,
+            self.fingerprint(secret_files, compressed, passphrase, solid),
+        ):
+            metrics.inc("preparation_total", {"result": "mismatch"})
+            return None
+        try:
+            payloads = entry.future.result()
+        except Exception:
+            metrics.inc("preparation_total", {"result": "failed"})
+            return None
+        metrics.inc("preparation_total", {"result": "hit"})
+        # The cached files carry their compressed data for the header
+        return entry.secret_files, payloads
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+            self.size = 0
+
+
+_cache = None
+_lock = threading.Lock()
+
+
+def get_preparations() -> PreparationCache:
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = PreparationCache(
+                    ttl=settings.PREPARATION_TTL,
+                    max_entries=settings.PREPARATION_CACHE_ENTRIES,
+                    max_bytes=settings.PREPARATION_CACHE_BYTES,
+                    workers=settings.PREPARATION_WORKERS,
+                )
+    return _cache
+
+
+def _reset(setting, **kwargs):
+    global _cache
+    if setting.startswith("PREPARATION_"):
+        _cache = None
+
+
+setting_changed.connect(_reset)
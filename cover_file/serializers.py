@@ -1,11 +1,15 @@
 from rest_framework import serializers
 
+from upload.models import Upload
 from utils.constants import EXTENSIONS_OF_SUPPORTED_FILE_FORMATS, OUTPUT_QUALITY
 
 
 class CoverUploadSerializer(serializers.Serializer):
-    cover_file = serializers.FileField()
+    cover_file = serializers.FileField(required=False)
+    upload_id = serializers.CharField(required=False)
     compressed = serializers.BooleanField(required=False, default=False)
+    # All secret files in one compressed stream, for many small, similar files
+    solid = serializers.BooleanField(required=False, default=False)
     output_quality = serializers.ChoiceField(choices=OUTPUT_QUALITY)
     password = serializers.CharField(required=False, default=None)
     secret_files = serializers.ListField(
@@ -23,8 +27,29 @@ class CoverUploadSerializer(serializers.Serializer):
 
         return value
 
+    def validate(self, attrs):
+        # A finished or still running resumable upload stands in for the file
+        upload_id = attrs.pop("upload_id", None)
+        if upload_id:
+            reader = Upload.get(upload_id).open()
+            try:
+                attrs["cover_file"] = self.validate_cover_file(reader)
+            except serializers.ValidationError:
+                reader.close()
+                raise
+        if "cover_file" not in attrs:
+            raise serializers.ValidationError(
+                {"cover_file": "Either cover_file or upload_id is required."}
+            )
+        return attrs
+
 class EmbedSerializer(CoverUploadSerializer):
     algorithm = serializers.CharField(required=False, default=None)
+    preparation_token = serializers.CharField(required=False, default=None)
     secret_files = serializers.ListField(
         child=serializers.FileField(), required=True, allow_empty=False
     )
+
+
+class CapacitySerializer(CoverUploadSerializer):
+    output_quality = None
@@ -1,18 +1,25 @@
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
 import io
+from django.test import TestCase
 from django.urls import reverse
 from pydub import AudioSegment
 from unittest.mock import patch
 from utils.constants import Code
 from utils.exceptions import RunOutOfFreeSpaceError
+from utils.audio import read_samples
+from lsb.file import File
+from lsb.registry import get_steganography
+from testing.artifacts import TemporaryArtifactsMixin
+from .preparation import PREPARATION_HEADER, PreparationCache
 
-class EmbeddedFileTests(APITestCase):
+class EmbeddedFileTests(TemporaryArtifactsMixin, APITestCase):
 
     def setUp(self):
         self.client = APIClient()
         self.cover_upload_url = reverse('cover-upload')  
         self.embed_url = reverse('embed')  
+        self.capacity_url = reverse('cover-capacity')
         self.mock_audio_file = io.BytesIO()
         self.mock_audio_file.name = 'test.wav'
 
@@ -44,6 +51,23 @@ class EmbeddedFileTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(response.json().get('code'), Code.RUN_OUT_OF_FREE_SPACE.value)
     
+    def test_cover_capacity(self):
+        secret_file = io.BytesIO(b"This is secret data")
+        secret_file.name = 'secret.txt'
+        data = {
+            'cover_file': self.mock_audio_file,
+            'compressed': False,
+            'secret_files': [secret_file],
+        }
+        response = self.client.post(self.capacity_url, data, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json().get('code'), Code.SUCCESS.value)
+        capacities = response.json()['data']['capacities']
+        self.assertEqual(len(capacities), 24)
+        self.assertEqual(sum(entry['solid'] for entry in capacities), 8)
+        self.assertEqual(response.json()['data']['recommended_quality'], 'high')
+
     @patch('lsb.lsb.LSBSteganography.embed')
     def test_embed_success(self, mock_embed):
         secret_file = io.BytesIO(b"This is secret data")
@@ -77,3 +101,86 @@ class EmbeddedFileTests(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(response.json().get('code'), Code.RUN_OUT_OF_FREE_SPACE.value)
+
+    def post_with_secret(self, url, data=b"This is secret data", **extra):
+        self.mock_audio_file.seek(0)
+        secret_file = io.BytesIO(data)
+        secret_file.name = 'secret.txt'
+        payload = {
+            'cover_file': self.mock_audio_file,
+            'output_quality': "low",
+            'compressed': True,
+            'secret_files': [secret_file],
+            'password': 'testpassword',
+            **extra,
+        }
+        return self.client.post(url, payload, format='multipart')
+
+    @patch('lsb.lsb.LSBSteganography.embed')
+    def test_embed_reuses_prepared_payloads(self, mock_embed):
+        response = self.post_with_secret(self.cover_upload_url)
+        token = response[PREPARATION_HEADER]
+
+        response = self.post_with_secret(self.embed_url, preparation_token=token)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        payloads = mock_embed.call_args.kwargs['payloads']
+        self.assertEqual(len(payloads), 1)
+        self.assertEqual(
+            File.decompress_decrypt('testpassword', payloads[0]), b"This is secret data"
+        )
+
+        # Tokens are single use
+        self.post_with_secret(self.embed_url, preparation_token=token)
+        self.assertIsNone(mock_embed.call_args.kwargs['payloads'])
+
+    @patch('lsb.lsb.LSBSteganography.embed')
+    def test_embed_ignores_token_for_other_files(self, mock_embed):
+        token = self.post_with_secret(self.cover_upload_url)[PREPARATION_HEADER]
+        response = self.post_with_secret(
+            self.embed_url, data=b"Other secret data", preparation_token=token
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(mock_embed.call_args.kwargs['payloads'])
+
+    def test_embed_with_prepared_payloads_round_trip(self):
+        token = self.post_with_secret(self.cover_upload_url)[PREPARATION_HEADER]
+        response = self.post_with_secret(self.embed_url, preparation_token=token)
+        stego = io.BytesIO(b"".join(response.streaming_content))
+
+        samples = read_samples(stego, "wav")
+        payload = get_steganography().extract_data(samples, passphrase='testpassword')
+        [(name, data)] = payload.extracted_files
+        self.assertEqual(name, 'secret.txt')
+        self.assertEqual(File.decompress_decrypt('testpassword', data), b"This is secret data")
+
+    def test_solid_embed_with_prepared_payload_round_trip(self):
+        token = self.post_with_secret(self.cover_upload_url, solid=True)[PREPARATION_HEADER]
+        response = self.post_with_secret(self.embed_url, preparation_token=token, solid=True)
+        stego = io.BytesIO(b"".join(response.streaming_content))
+
+        samples = read_samples(stego, "wav")
+        payload = get_steganography().extract_data(samples, passphrase='testpassword')
+        self.assertTrue(payload.is_solid())
+        self.assertEqual(payload.extracted_files, [('secret.txt', b"This is secret data")])
+
+
+class PreparationCacheTests(TestCase):
+    def setUp(self):
+        self.algorithm = get_steganography()
+        self.files = [File(name='a.txt', size=4, data=b"data")]
+
+    def test_entries_expire(self):
+        cache = PreparationCache(ttl=60, max_entries=4, max_bytes=1024, workers=1)
+        token = cache.prepare(self.algorithm, self.files, False, None)
+        cache.entries[token].created_at -= 61
+        self.assertIsNone(cache.take(token, self.files, False, None))
+        self.assertEqual(cache.size, 0)
+
+    def test_cache_is_bounded(self):
+        cache = PreparationCache(ttl=60, max_entries=2, max_bytes=1024, workers=1)
+        tokens = [cache.prepare(self.algorithm, self.files, False, None) for _ in range(3)]
+        self.assertEqual(list(cache.entries), tokens[1:])
+        large = [File(name='b.bin', size=600, data=bytes(600))]
+        self.assertIsNone(cache.prepare(self.algorithm, large, False, None))
+        files, payloads = cache.take(tokens[2], self.files, False, None)
+        self.assertEqual(payloads, [b"data"])
@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import CoverUploadView, EmbedView
+from .views import CapacityView, CoverUploadView, EmbedView
 
 urlpatterns = [
     path("covers/", CoverUploadView.as_view(), name="cover-upload"),
+    path("covers/capacity/", CapacityView.as_view(), name="cover-capacity"),
     path("embed/", EmbedView.as_view(), name="embed"),
 ]
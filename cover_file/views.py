@@ -1,4 +1,5 @@
-from django.http import HttpResponse
+from contextlib import ExitStack, closing
+
 from rest_framework.views import APIView
 from rest_framework import status
 
@@ -6,18 +7,22 @@ from utils.exceptions import (
     RunOutOfFreeSpaceError,
 )
 from utils.constants import Algorithm, Code
+from artifact.models import Artifact
+from artifact.views import artifact_response, streaming_artifact_response, wants_json
 from lsb.file import File
 from utils.format import file_extension
 from utils.response import standard_response
-from .serializers import CoverUploadSerializer, EmbedSerializer
-from lsb.lsb import LSBSteganography
-from pydub import AudioSegment
-import io
+from .preparation import PREPARATION_HEADER, get_preparations
+from .serializers import CapacitySerializer, CoverUploadSerializer, EmbedSerializer
+from lsb.registry import get_steganography
+from utils.audio import open_cover_file, read_samples
+from utils.memory import stage
+from utils.scheduler import admit, estimate_cost
 
 
 class CoverUploadView(APIView):
     def __init__(self, **kwargs):
-        self.algorithm = LSBSteganography()
+        self.algorithm = get_steganography()
         super().__init__(**kwargs)
 
     def post(self, request):
@@ -26,62 +31,123 @@ class CoverUploadView(APIView):
         cover_file = serializer.validated_data["cover_file"]
         output_quality = serializer.validated_data["output_quality"]
         compressed = serializer.validated_data["compressed"] or False
+        solid = serializer.validated_data["solid"]
         secret_files_data = serializer.validated_data.get("secret_files", [])
         password = serializer.validated_data.get("password")
 
-        file_bytes = cover_file.read()
-        audio = AudioSegment.from_file(io.BytesIO(file_bytes), format=file_extension(cover_file))
+        # Only header probing and size estimates: no key derivation happens here
+        cost = estimate_cost(upload_size=cover_file.size)
+        with admit(cost), closing(cover_file):
+            with stage("decode"):
+                samples = read_samples(cover_file, file_extension(cover_file))
+
+            if header := self.algorithm.get_header(samples=samples, passphrase=password):
+                sizes = header.sizes.tolist()
+                filenames = list(header.filenames)
+                version = header.version
+                return standard_response(
+                    code=Code.IS_EMBEDDED_BY_SYSTEM.value,
+                    message=f"Your embedded file is on version {version} and includes {len(filenames)} secret file(s)",
+                    data={
+                        "filenames": filenames,
+                        "sizes": sizes,
+                        "version": version,
+                    },
+                    status=status.HTTP_200_OK,
+                )
 
-        samples = audio.get_array_of_samples()
+            secret_files = []
+            for secret_file in secret_files_data:
+                secret_file_bytes = secret_file.read()
+                secret_files.append(
+                    File(
+                        name=secret_file.name,
+                        size=secret_file.size,
+                        data=secret_file_bytes,
+                    )
+                )
 
-        if header_blocks := self.algorithm.get_header_blocks(
-            samples=samples, passphrase=password
-        ):
-            sizes = File.str_sizes_to_array(header_blocks["EMBEDDED_SIZES"])
-            filenames = File.str_filenames_to_array(header_blocks["FILENAMES"])
-            version = header_blocks["VERSION"]
-            return standard_response(
-                code=Code.IS_EMBEDDED_BY_SYSTEM.value,
-                message=f"Your embedded file is on version {version} and includes {len(filenames)} secret file(s)",
-                data={
-                    "filenames": filenames,
-                    "sizes": sizes,
-                    "version": version,
-                },
-                status=status.HTTP_200_OK,
+            free_space = self.algorithm.get_free_space(
+                samples=samples,
+                secret_files=secret_files,
+                quality=output_quality,
+                compressed=compressed,
+                passphrase=password,
+                solid=solid,
             )
+            if free_space >= 0:
+                response = standard_response(
+                    code=Code.SUCCESS.value,
+                    message=f"Your free space is {free_space} Bytes",
+                    data=free_space,
+                )
+                # The embed that usually follows can reuse the prepared payloads
+                token = get_preparations().prepare(
+                    self.algorithm, secret_files, compressed, password, solid
+                )
+                if token:
+                    response[PREPARATION_HEADER] = token
+                return response
+            else:
+                raise RunOutOfFreeSpaceError()
+
+
+class CapacityView(APIView):
+    def __init__(self, **kwargs):
+        self.algorithm = get_steganography()
+        super().__init__(**kwargs)
+
+    def post(self, request):
+        serializer = CapacitySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cover_file = serializer.validated_data["cover_file"]
+        compressed = serializer.validated_data["compressed"] or False
+        solid = serializer.validated_data["solid"]
+        secret_files_data = serializer.validated_data.get("secret_files", [])
+        password = serializer.validated_data.get("password")
 
-        secret_files = []
-        for secret_file in secret_files_data:
-            secret_file_bytes = secret_file.read()
-            secret_files.append(
-                File(
-                    name=secret_file.name,
-                    size=secret_file.size,
-                    data=secret_file_bytes,
+        cost = estimate_cost(upload_size=cover_file.size)
+        with admit(cost), closing(cover_file):
+            with stage("decode"):
+                samples = read_samples(cover_file, file_extension(cover_file))
+
+            secret_files = []
+            for secret_file in secret_files_data:
+                secret_file_bytes = secret_file.read()
+                secret_files.append(
+                    File(
+                        name=secret_file.name,
+                        size=secret_file.size,
+                        data=secret_file_bytes,
+                    )
                 )
-            )
 
-        free_space = self.algorithm.get_free_space(
-            samples=samples,
-            secret_files=secret_files,
-            quality=output_quality,
-            compressed=compressed,
-            passphrase=password,
-        )
-        if free_space >= 0:
+            capacities = self.algorithm.get_capacity_report(
+                samples=samples, secret_files=secret_files, passphrase=password
+            )
+            recommended_quality = self.algorithm.recommend_quality(
+                capacities,
+                compressed=compressed,
+                encrypted=password is not None,
+                solid=solid,
+            )
             return standard_response(
                 code=Code.SUCCESS.value,
-                message=f"Your free space is {free_space} Bytes",
-                data=free_space,
+                message=(
+                    f"Recommended quality is {recommended_quality}"
+                    if recommended_quality
+                    else "Your secret files do not fit at any quality"
+                ),
+                data={
+                    "capacities": capacities,
+                    "recommended_quality": recommended_quality,
+                },
             )
-        else:
-            raise RunOutOfFreeSpaceError()
 
 
 class EmbedView(APIView):
     def __init__(self, **kwargs):
-        self.algorithm = LSBSteganography()
+        self.algorithm = get_steganography()
         super().__init__(**kwargs)
 
     def post(self, request):
@@ -91,40 +157,68 @@ class EmbedView(APIView):
         output_quality = serializer.validated_data["output_quality"]
         compressed = serializer.validated_data["compressed"] or False
         algorithm = serializer.validated_data["algorithm"] or Algorithm.LSB
+        solid = serializer.validated_data["solid"]
         secret_files_data = serializer.validated_data.get("secret_files", [])
         password = serializer.validated_data.get("password")
-
-        file_bytes = cover_file.read()
-        audio = AudioSegment.from_file(io.BytesIO(file_bytes), format=file_extension(cover_file))
-
-        samples = audio.get_array_of_samples()
-
-        secret_files = []
-        for secret_file in secret_files_data:
-            secret_file_bytes = secret_file.read()
-            secret_files.append(
-                File(
-                    name=secret_file.name,
-                    size=secret_file.size,
-                    data=secret_file_bytes,
-                )
-            )
-
-        self.algorithm.embed(
-            samples=samples,  
-            secret_files=secret_files,
-            quality=output_quality,
-            compressed=compressed,
-            passphrase=password,
+        preparation_token = serializer.validated_data["preparation_token"]
+
+        payload_size = sum(secret_file.size for secret_file in secret_files_data)
+        cost = estimate_cost(
+            upload_size=cover_file.size + payload_size,
+            payload_size=payload_size,
+            bits_per_sample=self.algorithm.qualities[output_quality],
+            file_count=len(secret_files_data),
+            encrypted=password is not None,
         )
+        with ExitStack() as resources:
+            resources.enter_context(admit(cost))
+            resources.enter_context(closing(cover_file))
+            with stage("decode"):
+                cover = open_cover_file(cover_file, file_extension(cover_file))
+            samples = cover.samples
+
+            secret_files = []
+            for secret_file in secret_files_data:
+                secret_file_bytes = secret_file.read()
+                secret_files.append(
+                    File(
+                        name=secret_file.name,
+                        size=secret_file.size,
+                        data=secret_file_bytes,
+                    )
+                )
 
-        embedded_audio = audio._spawn(samples.tobytes())
-
-        buffer = io.BytesIO()
-        embedded_audio.export(buffer, format=file_extension(cover_file))
-        buffer.seek(0)  
-
-        resp = HttpResponse(buffer, content_type='audio/wav')
-        resp['Content-Disposition'] = f'attachment; filename="{cover_file.name}"'
+            payloads = None
+            if preparation_token:
+                prepared = get_preparations().take(
+                    preparation_token, secret_files, compressed, password, solid
+                )
+                if prepared:
+                    secret_files, payloads = prepared
+
+            with stage("embed"):
+                self.algorithm.embed(
+                    samples=samples,  
+                    secret_files=secret_files,
+                    quality=output_quality,
+                    compressed=compressed,
+                    passphrase=password,
+                    payloads=payloads,
+                    solid=solid,
+                )
 
-        return resp
+            # Kept on disk so an interrupted download resumes instead of re-embedding
+            content_disposition = f'attachment; filename="{cover_file.name}"'
+            if wants_json(request):
+                with stage("encode"):
+                    artifact = Artifact.store(cover.chunks(), cover_file.name, "audio/wav")
+                return artifact_response(request, artifact, content_disposition)
+
+            # Encoded while it is sent; the upload stays open and the request
+            # admitted until the last chunk is written
+            with stage("encode"):
+                stream = Artifact.stream(cover.chunks(), cover_file.name, "audio/wav")
+            stream.on_close.append(resources.pop_all().close)
+            return streaming_artifact_response(
+                stream, content_disposition, cover.content_length()
+            )
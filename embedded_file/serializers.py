@@ -1,10 +1,12 @@
 from rest_framework import serializers
 
+from upload.models import Upload
 from utils.constants import EXTENSIONS_OF_SUPPORTED_FILE_FORMATS
 
 
 class EmbeddedFileUploadSerializer(serializers.Serializer):
-    embedded_file = serializers.FileField()
+    embedded_file = serializers.FileField(required=False)
+    upload_id = serializers.CharField(required=False)
     password = serializers.CharField(required=False, default=None)
 
     def validate_embedded_file(self, value):
@@ -17,3 +19,18 @@ class EmbeddedFileUploadSerializer(serializers.Serializer):
             )
 
         return value
+
+    def validate(self, attrs):
+        upload_id = attrs.pop("upload_id", None)
+        if upload_id:
+            reader = Upload.get(upload_id).open()
+            try:
+                attrs["embedded_file"] = self.validate_embedded_file(reader)
+            except serializers.ValidationError:
+                reader.close()
+                raise
+        if "embedded_file" not in attrs:
+            raise serializers.ValidationError(
+                {"embedded_file": "Either embedded_file or upload_id is required."}
+            )
+        return attrs
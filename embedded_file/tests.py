@@ -17,12 +17,13 @@ class EmbeddedUploadViewTests(TestCase):
         self.mock_audio_file = io.BytesIO(b"dummy audio file content")  
         self.mock_audio_file.name = 'test_audio.wav'
     
-    @patch('embedded_file.views.LSBSteganography.extract_data')
-    @patch('embedded_file.views.Zip.create_zip')
+    @patch('lsb.lsb.LSBSteganography.extract_data')
+    @patch('utils.zip.Zip.create_zip')
     @patch('pydub.AudioSegment.from_file')
     def test_upload_embedded_file_success(self, mock_from_file, mock_create_zip, mock_extract_data):
         mock_audio = MagicMock(spec=AudioSegment)
-        mock_audio.get_array_of_samples.return_value = [10] * 2000 
+        mock_audio.raw_data = bytes(4000)
+        mock_audio.sample_width = 2
         mock_from_file.return_value = mock_audio
 
         mock_extract_data.return_value = {
@@ -46,12 +47,16 @@ class EmbeddedUploadViewTests(TestCase):
         self.assertEqual(response['Content-Type'], 'application/zip')
         self.assertTrue('Content-Disposition' in response)
         self.assertIn('attachment; filename=%s' % zip_filename, response['Content-Disposition'])
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-store', response['Cache-Control'])
+        self.assertNotIn('Content-Location', response)
 
-    @patch('embedded_file.views.LSBSteganography.extract_data')
+    @patch('lsb.lsb.LSBSteganography.extract_data')
     @patch('pydub.AudioSegment.from_file')
     def test_upload_file_without_password(self, mock_extract_data, mock_from_file):
         mock_audio = MagicMock(spec=AudioSegment)
-        mock_audio.get_array_of_samples.return_value = [10] * 2000 
+        mock_audio.raw_data = bytes(4000)
+        mock_audio.sample_width = 2
         mock_from_file.return_value = mock_audio
 
         mock_extract_data.side_effect = RequirePasswordError()
@@ -68,11 +73,12 @@ class EmbeddedUploadViewTests(TestCase):
             'message' : "Password is required to proceed."
         }, json.loads(response.content.decode()))
 
-    @patch('embedded_file.views.LSBSteganography.extract_data')
+    @patch('lsb.lsb.LSBSteganography.extract_data')
     @patch('pydub.AudioSegment.from_file')
     def test_upload_file_with_invalid_password(self, mock_extract_data, mock_from_file):
         mock_audio = MagicMock(spec=AudioSegment)
-        mock_audio.get_array_of_samples.return_value = [10] * 2000 
+        mock_audio.raw_data = bytes(4000)
+        mock_audio.sample_width = 2
         mock_from_file.return_value = mock_audio
 
         mock_extract_data.side_effect = WrongPasswordError()
@@ -1,20 +1,22 @@
-from django.http import HttpResponse 
+from contextlib import closing
+
+from django.http import FileResponse
+from django.utils.cache import add_never_cache_headers
 from rest_framework.views import APIView
 import datetime
-from rest_framework.views import APIView
 
 from utils.format import file_extension
-from utils.zip import Zip
 from .serializers import EmbeddedFileUploadSerializer
-from lsb.lsb import LSBSteganography
-from pydub import AudioSegment
-import io
+from lsb.registry import get_steganography, get_zip
+from utils.audio import read_samples
+from utils.memory import stage
+from utils.scheduler import admit, estimate_cost
 
 
 class EmbeddedUploadView(APIView):
     def __init__(self, **kwargs):
-        self.algorithm = LSBSteganography()
-        self.zip = Zip()
+        self.algorithm = get_steganography()
+        self.zip = get_zip()
         super().__init__(**kwargs)
 
     def post(self, request):
@@ -23,18 +25,26 @@ class EmbeddedUploadView(APIView):
         embedded_file = serializer.validated_data["embedded_file"]
         password = serializer.validated_data.get("password")
 
-        file_bytes = embedded_file.read()
-        audio = AudioSegment.from_file(io.BytesIO(file_bytes), format=file_extension(embedded_file))
-
-        samples = audio.get_array_of_samples()
-
-        data = self.algorithm.extract_data(samples=samples, passphrase=password)
-
-        zip_buffer = self.zip.create_zip(response_data=data, password=password)
-        extracted_date = datetime.datetime.now().strftime("%Y%m%d")
-        zip_filename = f"extracted_files_{extracted_date}.zip"
-
-        resp = HttpResponse(zip_buffer, content_type='application/zip')
-        resp['Content-Disposition'] = 'attachment; filename=%s' % zip_filename
-        return resp
+        # The number of secret files, and so of key derivations, is unknown
+        cost = estimate_cost(
+            upload_size=embedded_file.size, encrypted=password is not None
+        )
+        with admit(cost), closing(embedded_file):
+            with stage("decode"):
+                samples = read_samples(embedded_file, file_extension(embedded_file))
+
+            with stage("extract"):
+                data = self.algorithm.extract_data(samples=samples, passphrase=password)
+
+            with stage("zip"):
+                zip_buffer = self.zip.create_zip(response_data=data, password=password)
+            extracted_date = datetime.datetime.now().strftime("%Y%m%d")
+            zip_filename = f"extracted_files_{extracted_date}.zip"
+
+            # Decrypted secret files are never stored or cached as artifacts
+            zip_buffer.seek(0)
+            resp = FileResponse(zip_buffer, content_type="application/zip")
+            resp["Content-Disposition"] = "attachment; filename=%s" % zip_filename
+            add_never_cache_headers(resp)
+            return resp
 
@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.core.signals import setting_changed
+
+
+def _reset(setting, **kwargs):
+    if setting.startswith("PAYLOAD_CACHE_"):
+        from . import registry
+
+        registry.reset("payload_cache")
 
 
 class LsbConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "lsb"
+
+    def ready(self):
+        setting_changed.connect(_reset)
@@ -0,0 +1,172 @@
+import mmap
+import os
+import shutil
+from contextlib import contextmanager
+from typing import Callable, Iterable, List, Tuple
+
+from utils.constants import EXTENSIONS_OF_SUPPORTED_FILE_FORMATS
+from utils.audio import open_cover
+from utils.exceptions import BaseCustomException
+from utils.pcm import PCM_FORMATS, parse_pcm
+from .file import File
+from .lsb import LSBSteganography
+from .registry import get_steganography, get_zip
+from .samples import SampleBuffer
+
+def steganography() -> LSBSteganography:
+    return get_steganography()
+
+
+def extension(path: str) -> str:
+    return os.path.splitext(path)[1][1:].lower()
+
+
+def collect_covers(paths: Iterable[str]) -> List[str]:
+    return [cover for cover, _ in collect_named_covers(paths)]
+
+
+def collect_named_covers(paths: Iterable[str]) -> List[Tuple[str, str]]:
+    """
+    ``(cover, name)`` pairs, where ``name`` is the cover's path relative to
+    the directory it was found in, or its basename for a file given directly.
+    """
+    covers = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, filenames in os.walk(path):
+                for filename in sorted(filenames):
+                    if extension(filename) in EXTENSIONS_OF_SUPPORTED_FILE_FORMATS:
+                        cover = os.path.join(root, filename)
+                        covers.append((cover, os.path.relpath(cover, path)))
+        else:
+            covers.append((path, os.path.basename(path)))
+    return covers
+
+
+@contextmanager
+def open_samples(path: str, writable: bool = False):
+    """
+    Yield ``(samples, cover)`` for a cover file.
+
+    PCM WAV/AIFF files are memory-mapped and ``samples`` is a SampleBuffer
+    over the sample data, so writes go straight to the file. Other formats
+    are opened through ``utils.audio.open_cover`` and ``cover`` is the Cover
+    to export.
+    """
+    if extension(path) in PCM_FORMATS:
+        with open(path, "r+b" if writable else "rb") as file:
+            access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+            with mmap.mmap(file.fileno(), 0, access=access) as mapped:
+                pcm = parse_pcm(mapped, extension(path))
+                with memoryview(mapped) as view:
+                    samples = SampleBuffer(
+                        view[pcm.data_offset : pcm.data_end],
+                        sample_width=pcm.sample_width,
+                        byteorder=pcm.byteorder,
+                    )
+                    try:
+                        yield samples, None
+                    finally:
+                        samples.release()
+                if writable:
+                    mapped.flush()
+                return
+
+    with open(path, "rb") as file:
+        cover = open_cover(file.read(), extension(path))
+    yield cover.samples, cover
+
+
+def read_secret_files(paths: Iterable[str]) -> List[File]:
+    return [File(path=path) for path in paths]
+
+
+def embed_file(
+    cover: str,
+    output: str,
+    secret_paths: List[str],
+    quality: str = "medium",
+    compressed: bool = False,
+    password: str = None,
+    solid: bool = False,
+) -> str:
+    secret_files = read_secret_files(secret_paths)
+    if extension(cover) in PCM_FORMATS:
+        shutil.copyfile(cover, output)
+        cover = output
+
+    with open_samples(cover, writable=True) as (samples, audio_cover):
+        steganography().embed(
+            samples=samples,
+            secret_files=secret_files,
+            quality=quality,
+            compressed=compressed,
+            passphrase=password,
+            solid=solid,
+        )
+        if audio_cover is not None:
+            with open(output, "wb") as file:
+                file.write(audio_cover.export().getbuffer())
+    return f"{output}: embedded {len(secret_files)} secret file(s)"
+
+
+def extract_file(cover: str, output: str, password: str = None) -> str:
+    with open_samples(cover) as (samples, _):
+        payload = steganography().extract_data(samples=samples, passphrase=password)
+    zip_buffer = get_zip().create_zip(response_data=payload, password=password)
+    with open(output, "wb") as file:
+        file.write(zip_buffer.getbuffer())
+    return f"{cover}: extracted {len(payload.extracted_files)} file(s) to {output}"
+
+
+def capacity_file(
+    cover: str,
+    secret_paths: List[str],
+    quality: str = "medium",
+    compressed: bool = False,
+    password: str = None,
+    solid: bool = False,
+) -> str:
+    secret_files = read_secret_files(secret_paths)
+    with open_samples(cover) as (samples, _):
+        free_space = steganography().get_free_space(
+            samples=samples,
+            secret_files=secret_files,
+            quality=quality,
+            compressed=compressed,
+            passphrase=password,
+            solid=solid,
+        )
+    return f"{cover}: {free_space} Bytes free at {quality} quality"
+
+
+def detect_file(cover: str, password: str = None) -> str:
+    with open_samples(cover) as (samples, _):
+        header = steganography().get_header(samples=samples, passphrase=password)
+    if not header:
+        return f"{cover}: not embedded"
+    filenames = header.filenames
+    return (
+        f"{cover}: embedded by version {header.version} "
+        f"with {len(filenames)} secret file(s): {', '.join(filenames)}"
+    )
+
+
+def _run_task(task):
+    func, kwargs = task
+    try:
+        return True, func(**kwargs)
+    except (BaseCustomException, ValueError, OSError) as e:
+        return False, f"{kwargs.get('cover')}: {e}"
+
+
+def run(func: Callable, tasks: List[dict], jobs: int = 1):
+    """Run ``func`` once per task, yielding ``(ok, message)`` in task order."""
+    items = [(func, kwargs) for kwargs in tasks]
+    if jobs <= 1 or len(items) <= 1:
+        yield from map(_run_task, items)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(_run_task, items)
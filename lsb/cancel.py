@@ -0,0 +1,83 @@
+"""
+Cooperative cancellation of long-running work.
+
+A CancelToken is made active for a block of code with ``cancel_scope``;
+the loops of the core (bit-packing, extraction chunks, key derivation,
+zip entries, ffmpeg pipes) call ``checkpoint()`` between units of work,
+which raises RequestCancelledError once the token is cancelled. Nothing
+is interrupted in the middle of a unit: a PBKDF2 derivation or a 1 MiB
+chunk always finishes first.
+
+The active token lives in a context variable, so it follows the request
+into ``sync_to_async`` threads; thread pools have to pass it on
+explicitly (see ``bind``).
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.exceptions import RequestCancelledError
+
+# Payload bytes packed between two checkpoints
+CANCEL_CHUNK_SIZE = 1024 * 1024
+
+_current = contextvars.ContextVar("cancel_token", default=None)
+
+
+class CancelToken:
+    def __init__(self) -> None:
+        self.reason = None
+        self.cancelled_at = None
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self.cancelled_at = time.monotonic()
+            self._event.set()
+
+    def check(self) -> None:
+        if self._event.is_set():
+            raise RequestCancelledError()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._event.wait(timeout)
+
+
+def current_token() -> CancelToken:
+    return _current.get()
+
+
+@contextmanager
+def cancel_scope(token: CancelToken):
+    reset = _current.set(token)
+    try:
+        yield token
+    finally:
+        _current.reset(reset)
+
+
+def checkpoint() -> None:
+    """Raise RequestCancelledError if the current work has been cancelled."""
+    token = _current.get()
+    if token is not None:
+        token.check()
+
+
+def bind(function):
+    """``function`` running under the caller's token, for use in another thread."""
+    token = _current.get()
+    if token is None:
+        return function
+
+    def bound(*args, **kwargs):
+        with cancel_scope(token):
+            return function(*args, **kwargs)
+
+    return bound
@@ -0,0 +1,58 @@
+"""
+Configuration of the steganography core.
+
+``lsb`` and the audio/crypto helpers in ``utils`` also work as a plain
+library (batch CLI, scripts, worker warm-up) without the Django project.
+Values passed to ``configure`` win; otherwise they come from the Django
+settings when a settings module is in use, and from the environment as a
+last resort. Django is only imported when a value is read from it.
+"""
+
+import os
+import sys
+
+DEFAULTS = {
+    "SECRET_KEY": None,
+    "LSB_ENGINE": "auto",
+    "AUDIO_BACKEND": "ffmpeg",
+    "FFMPEG_BINARY": "ffmpeg",
+    # Longer FLAC streams are decoded by ffmpeg instead of the native decoder
+    "FLAC_NATIVE_MAX_SAMPLES": 256 * 1024,
+    "PAYLOAD_CACHE_MEMORY_BYTES": 64 * 1024 * 1024,
+    # No directory keeps the payload cache in memory only
+    "PAYLOAD_CACHE_DIR": None,
+    "PAYLOAD_CACHE_DISK_BYTES": 1024 * 1024 * 1024,
+}
+
+_overrides = {}
+
+
+def configure(**values) -> None:
+    """Inject settings, e.g. ``configure(SECRET_KEY=..., LSB_ENGINE="loop")``."""
+    unknown = set(values) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+    _overrides.update(values)
+
+
+def reset() -> None:
+    _overrides.clear()
+
+
+def _django_settings():
+    if "django.conf" not in sys.modules and not os.environ.get("DJANGO_SETTINGS_MODULE"):
+        return None
+    from django.conf import settings
+
+    if settings.configured or os.environ.get("DJANGO_SETTINGS_MODULE"):
+        return settings
+    return None
+
+
+def get_setting(name: str):
+    if name in _overrides:
+        return _overrides[name]
+    settings = _django_settings()
+    if settings is not None:
+        return getattr(settings, name, DEFAULTS[name])
+    return os.environ.get(name, DEFAULTS[name])
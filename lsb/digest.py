@@ -0,0 +1,55 @@
+import hashlib
+import hmac
+
+from utils.exceptions import DataCorruptedError
+
+CHUNK_SIZE = 64 * 1024
+DIGEST_SIZE = 16
+
+
+def digest_chunk(chunk: bytes) -> bytes:
+    return hashlib.sha256(chunk).digest()[:DIGEST_SIZE]
+
+
+class PayloadDigest:
+    """Streaming digest of the embedded payload: one truncated SHA-256 per chunk."""
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE) -> None:
+        self.chunk_size = chunk_size
+        self.pending = bytearray()
+        self.digests = []
+
+    def update(self, data: bytes) -> None:
+        self.pending += data
+        while len(self.pending) >= self.chunk_size:
+            self.digests.append(digest_chunk(self.pending[: self.chunk_size]))
+            del self.pending[: self.chunk_size]
+
+    def digest(self) -> bytes:
+        digests = list(self.digests)
+        if self.pending:
+            digests.append(digest_chunk(self.pending))
+        return b"".join(digests)
+
+    @staticmethod
+    def length(payload_length: int, chunk_size: int = CHUNK_SIZE) -> int:
+        return -(-payload_length // chunk_size) * DIGEST_SIZE
+
+
+class PayloadVerifier:
+    """Checks payload chunks against the digests recorded in the header."""
+
+    def __init__(self, digests: bytes) -> None:
+        self.digests = digests
+        self.index = 0
+
+    def verify(self, chunk: bytes) -> None:
+        start = self.index * DIGEST_SIZE
+        expected = self.digests[start : start + DIGEST_SIZE]
+        if not hmac.compare_digest(expected, digest_chunk(chunk)):
+            raise DataCorruptedError()
+        self.index += 1
+
+    def finish(self) -> None:
+        if self.index * DIGEST_SIZE != len(self.digests):
+            raise DataCorruptedError()
@@ -0,0 +1,207 @@
+"""
+Per-call choice of the embedding engine from a calibration run.
+
+Which engine is fastest depends on the payload size and the machine: the
+pure Python loop has no setup cost, the bytes engine wins once the packing
+dominates, and the process-parallel engine only pays for its copying on
+large payloads with spare cores. ``Dispatcher.calibrate`` times each engine
+on synthetic covers at a few payload sizes (at worker boot, from
+``registry.warm_up``), separately for embedding and extraction and at the
+chunk sizes each is actually called with, and derives the size thresholds
+at which the winner changes; ``DispatchEngine`` then routes every embed
+and extract call by its size. Until calibrated, everything goes to the
+bytes engine.
+"""
+
+import array
+import math
+import os
+import threading
+import time
+from collections import Counter
+from typing import Dict, List
+
+from .cancel import CANCEL_CHUNK_SIZE
+from .digest import CHUNK_SIZE
+from .engines import ENGINES, LoopEngine, ParallelEngine, get_engine
+
+EMBED = "embed"
+EXTRACT = "extract"
+# Embedding is called in cancellation chunks and extraction in digest
+# chunks, so larger sizes never reach the engines
+CALIBRATION_SIZES = {
+    EMBED: (64, 4 * 1024, 64 * 1024, CANCEL_CHUNK_SIZE),
+    EXTRACT: (64, 4 * 1024, CHUNK_SIZE),
+}
+CALIBRATION_LSB = 2
+# A later (more elaborate) engine has to be this much faster to be picked
+MARGIN = 0.1
+# The loop takes about a second per MiB; past this it cannot win
+LOOP_MAX_SIZE = 4 * 1024
+FALLBACK_ENGINE = "bytes"
+
+
+def available_engines() -> List[str]:
+    names = list(ENGINES)
+    if (os.cpu_count() or 1) < 2:
+        # Extra processes only compete for the one core
+        names.remove(ParallelEngine.name)
+    return names
+
+
+class Dispatcher:
+    def __init__(self, engines: List[str] = None) -> None:
+        self.engines = {name: get_engine(name) for name in engines or available_engines()}
+        # Operation -> payload size -> engine -> best time in seconds
+        self.timings: Dict[str, Dict[int, Dict[str, float]]] = {}
+        # Operation -> ascending (largest payload size, engine) pairs
+        self.thresholds: Dict[str, list] = {}
+        self.calibrated_at = None
+        self.calibration_seconds = None
+        self.decisions = {EMBED: Counter(), EXTRACT: Counter()}
+        self._lock = threading.Lock()
+
+    def _time(self, engine: LoopEngine, operation: str, size: int, repeat: int) -> float:
+        payload = os.urandom(size)
+        per_byte = 8 // CALIBRATION_LSB
+        samples = array.array("h", bytes(size * per_byte * 2))
+        if operation == EXTRACT:
+            engine.embed(samples, payload, CALIBRATION_LSB, 0)
+        best = math.inf
+        # Small sizes are cheap to repeat and the noisiest
+        for _ in range(repeat if size >= 64 * 1024 else 5 * repeat):
+            start = time.perf_counter()
+            if operation == EMBED:
+                engine.embed(samples, payload, CALIBRATION_LSB, 0)
+            else:
+                engine.extract(samples, CALIBRATION_LSB, 0, size * per_byte)
+            best = min(best, time.perf_counter() - start)
+        if engine.extract(samples, CALIBRATION_LSB, 0, size * per_byte) != payload:
+            raise RuntimeError(f"Engine {engine.name} failed the calibration round trip")
+        return best
+
+    @staticmethod
+    def _worth_timing(engine: LoopEngine, size: int) -> bool:
+        if engine.name == LoopEngine.name:
+            return size <= LOOP_MAX_SIZE
+        if engine.name == ParallelEngine.name:
+            # Below two parts it runs the bytes engine in-process
+            return engine.parts(size) > 1
+        return True
+
+    @staticmethod
+    def _winner(times: Dict[str, float]) -> str:
+        fastest = min(times.values())
+        # Engines are in order of setup cost; timing noise should not flip them
+        return next(name for name, seconds in times.items() if seconds <= fastest * (1 + MARGIN))
+
+    @classmethod
+    def _thresholds(cls, timings: Dict[int, Dict[str, float]]) -> list:
+        thresholds = []
+        ordered = sorted(timings)
+        for index, size in enumerate(ordered):
+            winner = cls._winner(timings[size])
+            if thresholds and thresholds[-1][1] == winner:
+                thresholds.pop()
+            # The winner changes somewhere between two measured sizes
+            limit = (
+                math.inf
+                if index == len(ordered) - 1
+                else int(math.sqrt(size * ordered[index + 1]))
+            )
+            thresholds.append((limit, winner))
+        return thresholds
+
+    def calibrate(self, sizes: Dict[str, tuple] = None, repeat: int = 2) -> dict:
+        started = time.perf_counter()
+        sizes = sizes or CALIBRATION_SIZES
+        parallel = self.engines.get(ParallelEngine.name)
+        if parallel is not None and any(
+            self._worth_timing(parallel, size) for operation in sizes for size in sizes[operation]
+        ):
+            # Spawning the workers is a one-off cost, not a per-call one
+            list(ParallelEngine.pool().map(abs, range(ParallelEngine.workers)))
+        timings = {
+            operation: {
+                size: {
+                    name: self._time(engine, operation, size, repeat)
+                    for name, engine in self.engines.items()
+                    if self._worth_timing(engine, size)
+                }
+                for size in operation_sizes
+            }
+            for operation, operation_sizes in sizes.items()
+        }
+        thresholds = {
+            operation: self._thresholds(operation_timings)
+            for operation, operation_timings in timings.items()
+        }
+
+        with self._lock:
+            self.timings = timings
+            self.thresholds = thresholds
+            self.calibrated_at = time.time()
+            self.calibration_seconds = time.perf_counter() - started
+        return self.diagnostics()
+
+    def choose(self, operation: str, size: int) -> str:
+        name = FALLBACK_ENGINE
+        for limit, engine in self.thresholds.get(operation, ()):
+            if size <= limit:
+                name = engine
+                break
+        with self._lock:
+            self.decisions[operation][name] += 1
+        return name
+
+    def engine_for(self, operation: str, size: int) -> LoopEngine:
+        name = self.choose(operation, size)
+        return self.engines.get(name) or get_engine(name)
+
+    def diagnostics(self) -> dict:
+        with self._lock:
+            decisions = {operation: dict(counts) for operation, counts in self.decisions.items()}
+        return {
+            "engines": list(self.engines),
+            "cpu_count": os.cpu_count(),
+            "calibrated": self.calibrated_at is not None,
+            "calibrated_at": self.calibrated_at,
+            "calibration_seconds": self.calibration_seconds,
+            "calibration_lsb": CALIBRATION_LSB,
+            "timings": {
+                operation: {
+                    str(size): {name: round(seconds * 1e6, 1) for name, seconds in times.items()}
+                    for size, times in operation_timings.items()
+                }
+                for operation, operation_timings in self.timings.items()
+            },
+            "thresholds": {
+                operation: [
+                    {"max_payload_size": None if limit == math.inf else limit, "engine": engine}
+                    for limit, engine in operation_thresholds
+                ]
+                for operation, operation_thresholds in self.thresholds.items()
+            },
+            "decisions": decisions,
+        }
+
+
+class DispatchEngine(LoopEngine):
+    """Engine that hands each call to the dispatcher's pick for its payload size."""
+
+    name = "auto"
+
+    def __init__(self, dispatcher: Dispatcher = None) -> None:
+        from .registry import get_dispatcher
+
+        self.dispatcher = dispatcher or get_dispatcher()
+
+    def embed(self, samples: List[int], data: bytes, lsb: int, start_index=0) -> int:
+        engine = self.dispatcher.engine_for(EMBED, len(data))
+        return engine.embed(samples, data, lsb, start_index)
+
+    def extract(
+        self, samples: List[int], lsb: int, start_index: int, count: int
+    ) -> bytearray:
+        engine = self.dispatcher.engine_for(EXTRACT, count * lsb // 8)
+        return engine.extract(samples, lsb, start_index, count)
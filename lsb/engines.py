@@ -0,0 +1,266 @@
+import array
+import os
+import sys
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from .samples import LazySamples, SampleBuffer
+
+
+class LoopEngine:
+    """Reference engine that reads and writes one sample at a time."""
+
+    name = "loop"
+
+    def embed(self, samples: List[int], data: bytes, lsb: int, start_index=0) -> int:
+        end_index = len(data) * 8 // lsb + start_index
+        data_index = 0
+        bit_index = 0
+        for i in range(start_index, end_index):
+            if data_index >= len(data):
+                break
+            byte_to_embed = data[data_index]
+            bits_in_data_index = 8 - lsb - bit_index
+            bits_to_embed = (byte_to_embed >> bits_in_data_index) & ((1 << lsb) - 1)
+            samples[i] = (samples[i] & ~((1 << lsb) - 1)) | bits_to_embed
+            bit_index += lsb
+            if bit_index >= 8:
+                bit_index = 0
+                data_index += 1
+        return end_index
+
+    def extract(
+        self, samples: List[int], lsb: int, start_index: int, count: int
+    ) -> bytearray:
+        bits = []
+        for i in range(start_index, start_index + count):
+            extracted_bits = samples[i] & ((1 << lsb) - 1)
+            bits.append(format(extracted_bits, f"0{lsb}b"))
+
+        bits_str = "".join(bits)
+
+        data_bytes = bytearray()
+        for i in range(0, len(bits_str), 8):
+            byte = bits_str[i : i + 8]
+            data_bytes.append(int(byte, 2))
+
+        return data_bytes
+
+
+def _tables(lsb: int):
+    mask = (1 << lsb) - 1
+    low_bits = bytes(b & mask for b in range(256))
+    clear_bits = bytes(b & ~mask & 0xFF for b in range(256))
+    split = [
+        bytes((b >> (8 - lsb * (part + 1))) & mask for b in range(256))
+        for part in range(8 // lsb)
+    ]
+    return low_bits, clear_bits, split
+
+
+TABLES = {lsb: _tables(lsb) for lsb in (1, 2, 4, 8)}
+
+
+def merge_low_bytes(current: bytes, data: bytes, lsb: int) -> bytes:
+    """Low bytes of ``len(data) * 8 // lsb`` samples rewritten to carry ``data``."""
+    _, clear_bits, split = TABLES[lsb]
+    per_byte = len(split)
+    bits = bytearray(len(data) * per_byte)
+    for part, table in enumerate(split):
+        bits[part::per_byte] = data.translate(table)
+    current = current.translate(clear_bits)
+    merged = int.from_bytes(current, "big") | int.from_bytes(bits, "big")
+    return merged.to_bytes(len(bits), "big")
+
+
+def unpack_low_bytes(values: bytes, lsb: int) -> bytes:
+    """The bytes carried by the low bytes of whole groups of ``8 // lsb`` samples."""
+    low_bits, _, split = TABLES[lsb]
+    per_byte = len(split)
+    values = values.translate(low_bits)
+    packed = 0
+    for part in range(per_byte):
+        shift = 8 - lsb * (part + 1)
+        packed |= int.from_bytes(values[part::per_byte], "big") << shift
+    return packed.to_bytes(len(values) // per_byte, "big")
+
+
+class BytesEngine(LoopEngine):
+    """
+    Dependency-free engine working on whole byte buffers.
+
+    The low byte of every sample is gathered with a strided slice of the raw
+    sample buffer, masked with a 256-entry ``bytes.translate`` table and then
+    packed or unpacked with big-integer shifts, so the per-sample work runs in
+    C. Samples that do not expose a buffer (plain lists) use the loops.
+    """
+
+    name = "bytes"
+    tables = TABLES
+
+    def sample_bytes(
+        self, samples, end: int = 0, writable: bool = False
+    ) -> Optional[Tuple[memoryview, int, int]]:
+        if isinstance(samples, LazySamples):
+            samples = samples.region(end, writable=writable)
+        if isinstance(samples, SampleBuffer):
+            return samples.raw, samples.width, samples.offset
+        if not isinstance(samples, (array.array, memoryview)):
+            return None
+        view = memoryview(samples)
+        if view.ndim != 1 or view.format not in ("b", "B", "h", "H", "i", "I", "l", "L"):
+            return None
+        width = view.itemsize
+        offset = 0 if sys.byteorder == "little" else width - 1
+        return view.cast("B"), width, offset
+
+    def embed(self, samples: List[int], data: bytes, lsb: int, start_index=0) -> int:
+        per_byte = 8 // lsb
+        end_index = start_index + len(data) * per_byte
+        if lsb not in self.tables or end_index > len(samples):
+            return super().embed(samples, data, lsb, start_index)
+        view = self.sample_bytes(samples, end_index, writable=True)
+        if view is None:
+            return super().embed(samples, data, lsb, start_index)
+        if not data:
+            return end_index
+
+        raw, width, offset = view
+        positions = slice(start_index * width + offset, end_index * width, width)
+        raw[positions] = merge_low_bytes(bytes(raw[positions]), data, lsb)
+        return end_index
+
+    def extract(
+        self, samples: List[int], lsb: int, start_index: int, count: int
+    ) -> bytearray:
+        if lsb not in self.tables or start_index + count > len(samples):
+            return super().extract(samples, lsb, start_index, count)
+        view = self.sample_bytes(samples, start_index + count)
+        if view is None:
+            return super().extract(samples, lsb, start_index, count)
+
+        raw, width, offset = view
+        per_byte = 8 // lsb
+        end_index = start_index + count // per_byte * per_byte
+
+        positions = slice(start_index * width + offset, end_index * width, width)
+        data_bytes = bytearray(unpack_low_bytes(bytes(raw[positions]), lsb))
+
+        if end_index < start_index + count:
+            data_bytes += super().extract(
+                samples, lsb, end_index, start_index + count - end_index
+            )
+        return data_bytes
+
+
+def _merge_part(job) -> bytes:
+    return merge_low_bytes(*job)
+
+
+def _unpack_part(job) -> bytes:
+    return unpack_low_bytes(*job)
+
+
+class ParallelEngine(BytesEngine):
+    """
+    Bytes engine that spreads large payloads over worker processes.
+
+    The payload is cut at byte boundaries, so each part owns its own run of
+    samples, and only the low bytes of those samples travel to the workers
+    and back. Whether that copying pays off depends on the payload size and
+    the core count, which is what the dispatcher measures.
+    """
+
+    name = "parallel"
+    min_part_size = 64 * 1024
+    workers = max(2, min(4, os.cpu_count() or 1))
+    _pool = None
+    _pool_lock = threading.Lock()
+
+    @classmethod
+    def pool(cls):
+        if cls._pool is None:
+            with cls._pool_lock:
+                if cls._pool is None:
+                    import multiprocessing
+                    from concurrent.futures import ProcessPoolExecutor
+
+                    # Workers only need this module; never fork a threaded server
+                    cls._pool = ProcessPoolExecutor(
+                        max_workers=cls.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+        return cls._pool
+
+    def parts(self, size: int) -> int:
+        return max(1, min(self.workers, size // self.min_part_size))
+
+    def _split(self, size: int, start_index: int, width: int, offset: int, per_byte: int):
+        step = -(-size // self.parts(size))
+        for start in range(0, size, step):
+            end = min(start + step, size)
+            first = start_index + start * per_byte
+            last = start_index + end * per_byte
+            yield start, end, slice(first * width + offset, last * width, width)
+
+    def embed(self, samples: List[int], data: bytes, lsb: int, start_index=0) -> int:
+        per_byte = 8 // lsb
+        end_index = start_index + len(data) * per_byte
+        if self.parts(len(data)) < 2 or lsb not in self.tables or end_index > len(samples):
+            return super().embed(samples, data, lsb, start_index)
+        view = self.sample_bytes(samples, end_index, writable=True)
+        if view is None:
+            return super().embed(samples, data, lsb, start_index)
+
+        raw, width, offset = view
+        ranges = list(self._split(len(data), start_index, width, offset, per_byte))
+        jobs = [(bytes(raw[positions]), bytes(data[start:end]), lsb) for start, end, positions in ranges]
+        for (_, _, positions), merged in zip(ranges, self.pool().map(_merge_part, jobs)):
+            raw[positions] = merged
+        return end_index
+
+    def extract(
+        self, samples: List[int], lsb: int, start_index: int, count: int
+    ) -> bytearray:
+        per_byte = 8 // lsb
+        full_bytes = count // per_byte
+        if self.parts(full_bytes) < 2 or lsb not in self.tables or start_index + count > len(samples):
+            return super().extract(samples, lsb, start_index, count)
+        view = self.sample_bytes(samples, start_index + count)
+        if view is None:
+            return super().extract(samples, lsb, start_index, count)
+
+        raw, width, offset = view
+        jobs = [
+            (bytes(raw[positions]), lsb)
+            for _, _, positions in self._split(full_bytes, start_index, width, offset, per_byte)
+        ]
+        data_bytes = bytearray(b"".join(self.pool().map(_unpack_part, jobs)))
+        end_index = start_index + full_bytes * per_byte
+        if end_index < start_index + count:
+            data_bytes += LoopEngine.extract(
+                self, samples, lsb, end_index, start_index + count - end_index
+            )
+        return data_bytes
+
+
+ENGINES: Dict[str, type] = {
+    LoopEngine.name: LoopEngine,
+    BytesEngine.name: BytesEngine,
+    ParallelEngine.name: ParallelEngine,
+}
+
+DEFAULT_ENGINE = BytesEngine.name
+# Picks one of ENGINES per call from the calibration in lsb.dispatch
+AUTO_ENGINE = "auto"
+
+
+def get_engine(name: str = None) -> LoopEngine:
+    name = name or DEFAULT_ENGINE
+    if name == AUTO_ENGINE:
+        from .dispatch import DispatchEngine
+
+        return DispatchEngine()
+    if name not in ENGINES:
+        raise ValueError(f"Invalid engine {name}")
+    return ENGINES[name]()
@@ -1,10 +1,6 @@
 import os
 from typing import List
-from utils.codec import CoDec
-from utils.endec import EnDec
-
-codec = CoDec()
-endec = EnDec()
+from .registry import get_codec, get_endec, get_payload_cache
 
 
 class File:
@@ -12,7 +8,7 @@ class File:
         self, path: str = None, name: str = None, size: int = None, data: bytes = None
     ) -> None:
         self._compressed_data = None
-        self._compressed_size = None
+        self._cache_key = None
         if path:
             self.name = os.path.basename(path)
             self.size = os.path.getsize(path)
@@ -26,18 +22,35 @@ class File:
             raise ValueError("Invalid arguments provided for initialization")
 
     @property
-    def compressed_data(self):
-        if self._compressed_data:
-            return self._compressed_data
-        self._compressed_data = codec.compress_data(self.raw_data)
+    def cache_key(self) -> str:
+        if self._cache_key is None:
+            self._cache_key = get_payload_cache().key(self.raw_data)
+        return self._cache_key
+
+    def compressed(self, shared: bool = True) -> bytes:
+        """
+        The compressed bytes, through the cache shared across requests
+        unless ``shared`` is False. Secrets that are going to be encrypted
+        must not leave their compressed plaintext in the cache.
+        """
+        if self._compressed_data is None:
+            if shared:
+                # The same file is often embedded many times
+                self._compressed_data = get_payload_cache().get_or_compute(
+                    self.raw_data, get_codec().compress_data, key=self.cache_key
+                )
+            else:
+                self._compressed_data = get_codec().compress_data(self.raw_data)
         return self._compressed_data
 
+    @property
+    def compressed_data(self):
+        return self.compressed()
+
     @property
     def compressed_size(self):
-        if self._compressed_size:
-            return self._compressed_size
-        self._compressed_size = len(self.compressed_data)
-        return self._compressed_size
+        # From the bytes that will be embedded: a cache entry can still fail its check
+        return len(self.compressed_data)
 
     @staticmethod
     def filenames_with_delimiter(files: List["File"], delimiter: str = "/") -> List[str]:
@@ -56,12 +69,15 @@ class File:
         delimiter: str = "/",
         compressed=False,
         passphrase: str = None,
+        shared: bool = None,
     ) -> List[str]:
+        if shared is None:
+            shared = not passphrase
         sizes = [
             str(
                 File.estimate_embedded_size_handler(
                     passphrase=passphrase,
-                    data=file.compressed_data if compressed else file.raw_data,
+                    data=file.compressed(shared) if compressed else file.raw_data,
                     num_bits=num_bits,
                 )
             )
@@ -82,31 +98,31 @@ class File:
         return self.size * (bits // num_bits)
 
     def encrypt(self, passphrase: str) -> bytes:
-        return endec.encrypt_data(passphrase, self.raw_data)
+        return get_endec().encrypt_data(passphrase, self.raw_data)
 
     def compress_encrypt(self, passphrase: str) -> bytes:
-        return endec.encrypt_data(passphrase, self.compressed_data)
+        return get_endec().encrypt_data(passphrase, self.compressed(shared=False))
 
     @staticmethod
     def decrypt(passphrase: str, encrypted_data: bytes) -> bytes:
-        return endec.decrypt_data(passphrase, encrypted_data)
+        return get_endec().decrypt_data(passphrase, encrypted_data)
 
     @staticmethod
     def decompress_decrypt(passphrase: str, encrypted_compressed_data: bytes) -> bytes:
-        decrypted_data = endec.decrypt_data(passphrase, encrypted_compressed_data)
-        decompress_data = codec.decompress_data(decrypted_data)
+        decrypted_data = get_endec().decrypt_data(passphrase, encrypted_compressed_data)
+        decompress_data = get_codec().decompress_data(decrypted_data)
         return decompress_data
 
     @staticmethod
     def decompress(compressed_data: bytes) -> bytes:
-        decompress_data = codec.decompress_data(compressed_data)
+        decompress_data = get_codec().decompress_data(compressed_data)
         return decompress_data
 
     def estimate_embedded_size(
         self, num_bits: int = 2, compressed: bool = False, passphrase: str = None
     ) -> int:
         return File.estimate_embedded_size_handler(
-            data=self.compressed_data if compressed else self.raw_data,
+            data=self.compressed(shared=not passphrase) if compressed else self.raw_data,
             passphrase=passphrase,
             num_bits=num_bits,
         )
@@ -119,7 +135,7 @@ class File:
     ) -> int:
         bits = 8
         if passphrase:
-            size = endec.estimate_encrypted_size(data_length=len(data))
+            size = get_endec().estimate_encrypted_size(data_length=len(data))
         else:
             size = len(data)
         return size * bits // num_bits
@@ -127,3 +143,24 @@ class File:
     @staticmethod
     def total_size(files: List["File"]) -> int:
         return sum(file.size for file in files)
+
+    @staticmethod
+    def payload_size(
+        files: List["File"],
+        compressed: bool = False,
+        encrypted: bool = False,
+        shared: bool = None,
+    ) -> int:
+        """
+        Bytes the files take once prepared for embedding. ``shared`` (by
+        default, unless ``encrypted``) lets compression use the shared cache.
+        """
+        if shared is None:
+            shared = not encrypted
+        size = 0
+        for file in files:
+            length = len(file.compressed(shared)) if compressed else len(file.raw_data)
+            if encrypted:
+                length = get_endec().estimate_encrypted_size(data_length=length)
+            size += length
+        return size
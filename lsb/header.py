@@ -1,8 +1,11 @@
-from typing import Dict, List, Tuple
-import threading
+from typing import Dict, List
 
-from utils.exceptions import NotEmbeddedBySystemError
+from utils.exceptions import DataCorruptedError, NotEmbeddedBySystemError
+from .digest import PayloadDigest
+from .engines import LoopEngine, get_engine
 from .file import File
+from . import solid as solid_archive
+from .models import SOLID_FLAG
 import hmac
 import hashlib
 
@@ -14,16 +17,19 @@ import hashlib
         ######################################################
         #             Filenames         #   Embedded Sizes   #
         ######################################################
+        #                   Payload Digests                  #
+        ######################################################
         #                        HMAC                        #  
         ######################################################
 
 - Magic String: A unique identifier used to recognize the presence of an embedded file in the data stream.
-- CF (Compression Flag): Indicates whether the secret data has been compressed before embedding (1 if compressed, 0 otherwise).
+- CF (Compression Flag): Indicates whether the secret data has been compressed before embedding (1 if every file is compressed on its own, 2 if all files share one solid stream, 0 otherwise).
 - EF (Encryption Flag): Indicates whether the secret data has been encrypted (1 if encrypted, 0 otherwise).
 - Version: Version number of the steganography application or the embedding format being used.
 - File Metadata: Information related to the embedded secret files, including filenames and their respective sizes.
    + Filenames: The names and file extensions of the secret files that have been embedded.
-   + Embedded Sizes: The sizes (in bytes) of the embedded secret files to help extract the correct amount of data during retrieval.
+   + Embedded Sizes: The sizes (in bytes) of the embedded secret files to help extract the correct amount of data during retrieval. A solid payload lists the size of its stream first, then the length of every file inside the decompressed stream (see lsb.solid).
+- Payload Digests (since 1.1): A truncated SHA-256 for every 64 KiB chunk of the embedded payload, so extraction can stop at the first damaged chunk.
 - HMAC: A Hash-based Message Authentication Code used to verify the integrity and authenticity of the embedded data. It ensures that the data has not been altered or tampered with.
 """
 
@@ -36,11 +42,19 @@ class LsbHeader:
             quality: str = "medium",
             compressed: bool = False,
             passphrase: str = None,
+            payloads: List[bytes] = None,
+            solid: bool = False,
+            shared: bool = None,
         ) -> None:
             self.secret_files = secret_files
             self.quality = quality
             self.compressed = compressed
             self.passphrase = passphrase
+            self.payloads = payloads
+            self.solid = solid
+            # Whether sizing may compress through the shared cache; by
+            # default only without a passphrase
+            self.shared = shared
 
     def __init__(
         self,
@@ -49,7 +63,9 @@ class LsbHeader:
         qualities: Dict[str, int],
         block_delimiter: str,
         secret_key: str,
+        engine: LoopEngine = None,
     ) -> None:
+        self.engine = engine or get_engine()
         self.MAGIC_STRING = magic_string.encode()
         self.VERSION = version.encode()
         self.qualities = qualities
@@ -61,9 +77,51 @@ class LsbHeader:
             "VERSION",
             "FILENAMES",
             "EMBEDDED_SIZES",
+            "DIGESTS",
             "HMAC",
         ]
+        self.legacy_block_names = {
+            "1.0": [name for name in self.block_names if name != "DIGESTS"],
+        }
+        self.binary_block_names = {"DIGESTS", "HMAC"}
         self.full_block_names = ["MAGIC_STRING", *self.block_names]
+        self.max_length_prefix = 32
+        self.masks = {quality: (1 << lsb) - 1 for quality, lsb in qualities.items()}
+        self.magic_patterns = {
+            quality: self.bit_pattern(self.MAGIC_STRING, lsb)
+            for quality, lsb in qualities.items()
+        }
+        self.header_templates = {
+            (cf_flag, ef_flag): self.make_header_template(cf_flag, ef_flag)
+            for cf_flag in (b"0", b"1", SOLID_FLAG.encode())
+            for ef_flag in (b"0", b"1")
+        }
+
+    @staticmethod
+    def bit_pattern(data: bytes, lsb: int) -> List[int]:
+        mask = (1 << lsb) - 1
+        return [
+            (byte >> shift) & mask
+            for byte in data
+            for shift in range(8 - lsb, -1, -lsb)
+        ]
+
+    def make_header_template(self, cf_flag: bytes, ef_flag: bytes):
+        boolean_length = b"1"
+        header = b"".join(
+            [
+                self.MAGIC_STRING,
+                boolean_length + self.block_delimiter + cf_flag,
+                boolean_length + self.block_delimiter + ef_flag,
+                str(len(self.VERSION)).encode() + self.block_delimiter + self.VERSION,
+            ]
+        )
+        return header, [cf_flag, ef_flag, self.VERSION]
+
+    def block_names_for(self, version) -> List[str]:
+        if isinstance(version, bytes):
+            version = version.decode()
+        return self.legacy_block_names.get(version, self.block_names)
 
     def length(self, props: Props) -> int:
         return len(self.make_header(props))
@@ -80,37 +138,32 @@ class LsbHeader:
         compressed = props.compressed
         secret_files = props.secret_files
         filenames_bytes = File.filenames_with_delimiter(secret_files).encode()
-        file_sizes_bytes = File.embedded_sizes_with_delimiter(
-            files=secret_files,
-            num_bits=self.qualities[quality],
-            compressed=compressed,
-            passphrase=passphrase,
-        ).encode()
-
-        # Build the header blocks
-        header_blocks = [self.MAGIC_STRING]
-
-        boolean_length = 1
-        true, false = "1", "0"
-        cf_flag = true if compressed else false
-        ef_flag = true if passphrase is not None else false
-
-        # Add CF block
-        cf_block = (
-            str(boolean_length).encode() + self.block_delimiter + cf_flag.encode()
-        )
-        header_blocks.append(cf_block)
-        # Add EF block
-        ef_block = (
-            str(boolean_length).encode() + self.block_delimiter + ef_flag.encode()
-        )
-        header_blocks.append(ef_block)
-        # Add VERSION block
-        version_block = (
-            str(len(self.VERSION)).encode() + self.block_delimiter + self.VERSION
-        )
-        header_blocks.append(version_block)
-        checksum_blocks = [cf_flag.encode(), ef_flag.encode(), self.VERSION]
+        if props.solid:
+            file_sizes_bytes = solid_archive.embedded_sizes(
+                files=secret_files,
+                num_bits=self.qualities[quality],
+                passphrase=passphrase,
+                payload=props.payloads[0] if props.payloads else None,
+                shared=props.shared,
+            ).encode()
+        else:
+            file_sizes_bytes = File.embedded_sizes_with_delimiter(
+                files=secret_files,
+                num_bits=self.qualities[quality],
+                compressed=compressed,
+                passphrase=passphrase,
+                shared=props.shared,
+            ).encode()
+
+        # Start from the precomputed MAGIC_STRING, CF, EF and VERSION blocks
+        if props.solid:
+            cf_flag = SOLID_FLAG.encode()
+        else:
+            cf_flag = b"1" if compressed else b"0"
+        ef_flag = b"1" if passphrase is not None else b"0"
+        header_prefix, checksum_prefix = self.header_templates[(cf_flag, ef_flag)]
+        header_blocks = [header_prefix]
+        checksum_blocks = list(checksum_prefix)
 
         # Add FILENAMES block
         filenames_block = str(len(filenames_bytes)).encode() + self.block_delimiter + filenames_bytes
@@ -122,6 +175,13 @@ class LsbHeader:
         header_blocks.append(file_sizes_block)
         checksum_blocks.append(file_sizes_bytes)
 
+        # Add DIGESTS block
+        if "DIGESTS" in self.block_names_for(self.VERSION):
+            digests = self.payload_digests(props, file_sizes_bytes.decode())
+            digests_block = str(len(digests)).encode() + self.block_delimiter + digests
+            header_blocks.append(digests_block)
+            checksum_blocks.append(digests)
+
         checksum_data = b"".join(checksum_blocks)
 
         hmac_key = passphrase.encode() if passphrase else self.secret_key.encode()
@@ -133,6 +193,20 @@ class LsbHeader:
 
         return b"".join(header_blocks)
 
+    def payload_digests(self, props: Props, embedded_sizes: str) -> bytes:
+        if props.payloads is not None:
+            digest = PayloadDigest()
+            for payload in props.payloads:
+                digest.update(payload)
+            return digest.digest()
+        # Only the length matters when the payloads have not been prepared yet
+        sizes = File.str_sizes_to_array(embedded_sizes) if embedded_sizes else []
+        if props.solid:
+            # Only the stream is embedded; the other sizes are files inside it
+            sizes = sizes[:1]
+        payload_length = sum(sizes) * self.qualities[props.quality] // 8
+        return bytes(PayloadDigest.length(payload_length))
+
     def verify_hmac(
         self,
         key: str,
@@ -155,52 +229,37 @@ class LsbHeader:
     def get_quality_from_embedded_data(
         self, samples: List[int], raise_exception: bool = False
     ) -> str:
-        results = {key: False for key in self.qualities}
-        threads = [
-            threading.Thread(
-                target=self._extract_magic_string, args=(samples, results, key)
-            )
-            for key in self.qualities.keys()
-        ]
-        for thread in threads:
-            thread.start()
-        for thread in threads:
-            thread.join()
-        for quality in list(self.qualities.keys()):
-            if results[quality]:
+        for quality in self.qualities:
+            if self.matches_magic_string(samples, quality):
                 return quality
 
         if raise_exception:
             raise NotEmbeddedBySystemError()
         return None
 
-    def _extract_magic_string(
-        self, samples: List[int], results: Dict[str, Tuple[int, int]], quality: str
-    ):
-        lsb = self.qualities[quality]
-        end_magic_str_index = self.magic_str_index(quality)
-
-        if end_magic_str_index > len(samples):
-            return
-
-        bits = ""
-        for i in range(end_magic_str_index):
-            extracted_bits = samples[i] & ((1 << lsb) - 1)
-            bits += format(extracted_bits, f"0{lsb}b")
-
-        magic_string = "".join(
-            chr(int(bits[i : i + 8], 2)) for i in range(0, len(bits), 8)
-        )
-        if magic_string.encode() == self.MAGIC_STRING:
-            results[quality] = True
+    def matches_magic_string(self, samples: List[int], quality: str) -> bool:
+        # Compare against the precomputed bit pattern and stop at the first
+        # mismatching sample, which is usually the very first one
+        pattern = self.magic_patterns[quality]
+        if len(pattern) > len(samples):
+            return False
+        mask = self.masks[quality]
+        for i, bits in enumerate(pattern):
+            if samples[i] & mask != bits:
+                return False
+        return True
 
     def extract_header_blocks(self, samples: List[int], quality: str, start_index: int):
         blocks = {}
-        total_blocks = len(self.block_names)
+        block_names = self.block_names
         index = start_index
 
-        while len(blocks) < total_blocks:
-            index = self.search_for_block(samples, blocks, quality, index)
+        while len(blocks) < len(block_names):
+            index = self.search_for_block(
+                samples, blocks, quality, index, block_names=block_names
+            )
+            if "VERSION" in blocks:
+                block_names = self.block_names_for(blocks["VERSION"])
 
         return {**blocks, "index": index}
 
@@ -210,46 +269,37 @@ class LsbHeader:
         blocks: Dict[str, str],
         quality: str,
         start_index: int = 0,
+        block_names: List[str] = None,
     ):
+        block_names = block_names or self.block_names
         lsb = self.qualities[quality]
-        index = start_index
-        bits = ""
-        byte_str = ""
-        content_start_index = 0
-        length = 0
-
-        for i in range(index, len(samples)):
-            extracted_bits = samples[i] & ((1 << lsb) - 1)
-            bits += format(extracted_bits, f"0{lsb}b")
-
-            if len(bits) == 8:
-                current_byte = chr(int(bits, 2))
-                bits = ""
-                byte_str += current_byte
-                delimiter_str = byte_str[-len(self.block_delimiter) :]
-                if delimiter_str.encode() == self.block_delimiter:
-                    length = int(byte_str[: -len(self.block_delimiter)])
-                    content_start_index = i + 1
-                    break
-
-        bits = []
-        length = length * 8 // lsb
-        for i in range(content_start_index, content_start_index + length):
-            extracted_bits = samples[i] & ((1 << lsb) - 1)
-            bits.append(format(extracted_bits, f"0{lsb}b"))
+        per_byte = 8 // lsb
 
-        bits_str = "".join(bits)
+        # The length prefix is a handful of digits followed by the delimiter
+        prefix_samples = min(
+            self.max_length_prefix * per_byte, len(samples) - start_index
+        )
+        prefix = self.engine.extract(samples, lsb, start_index, prefix_samples)
+        delimiter_index = prefix.find(self.block_delimiter)
+        if delimiter_index == -1:
+            raise DataCorruptedError()
+        try:
+            length = int(prefix[:delimiter_index])
+        except ValueError:
+            raise DataCorruptedError()
+        content_start_index = (
+            start_index + (delimiter_index + len(self.block_delimiter)) * per_byte
+        )
 
-        data_bytes = bytearray()
-        for i in range(0, len(bits_str), 8):
-            byte = bits_str[i : i + 8]
-            data_bytes.append(int(byte, 2))
+        length = length * 8 // lsb
+        data_bytes = self.engine.extract(samples, lsb, content_start_index, length)
 
         try:
-            if self.block_names[len(blocks)] == "HMAC":
-                blocks[self.block_names[len(blocks)]] = bytes(data_bytes)
+            block_name = block_names[len(blocks)]
+            if block_name in self.binary_block_names:
+                blocks[block_name] = bytes(data_bytes)
             else:
-                blocks[self.block_names[len(blocks)]] = data_bytes.decode(
+                blocks[block_name] = data_bytes.decode(
                     "utf-8", errors="ignore"
                 )
         except Exception as e:
@@ -271,10 +321,10 @@ class LsbHeader:
         else:
             raise ValueError("Invalid header: MAGIC_STRING 'CIPHERNEST' not found")
 
-        total_blocks = len(self.full_block_names)
+        full_block_names = self.full_block_names
         block_idx = 1
 
-        while block_idx < total_blocks:
+        while block_idx < len(full_block_names):
             delimiter_index = header.find(self.block_delimiter, current_index)
 
             if delimiter_index == -1:
@@ -284,22 +334,25 @@ class LsbHeader:
             try:
                 length = int(length_str)
             except ValueError:
-                raise ValueError(f"Invalid length '{length_str}' for block '{self.full_block_names[block_idx]}'")
+                raise ValueError(f"Invalid length '{length_str}' for block '{full_block_names[block_idx]}'")
 
             current_index = delimiter_index + len(self.block_delimiter)
 
             data = header[current_index:current_index + length]
 
             try:
-                if self.full_block_names[block_idx] == "HMAC":
-                    blocks[self.full_block_names[block_idx]] = bytes(data)
+                if full_block_names[block_idx] in self.binary_block_names:
+                    blocks[full_block_names[block_idx]] = bytes(data)
                 else:
-                    blocks[self.full_block_names[block_idx]] = data.decode(
+                    blocks[full_block_names[block_idx]] = data.decode(
                         "utf-8", errors="ignore"
                     )
             except Exception as e:
                 print(f"Error decoding block: {e}")
 
+            if full_block_names[block_idx] == "VERSION":
+                full_block_names = ["MAGIC_STRING", *self.block_names_for(blocks["VERSION"])]
+
             current_index += length
             block_idx += 1
 
@@ -0,0 +1,71 @@
+"""
+Import-time budget of the steganography core.
+
+Each entry point is imported in a fresh interpreter under ``-X importtime``
+without a Django settings module, the way the batch CLI and a worker's
+first import see it. Its cumulative import time must stay within the
+budget, and it must not pull in Django, the crypto backend, pydub or the
+project settings: those load on first use.
+"""
+
+import os
+import subprocess
+import sys
+from typing import List
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Milliseconds, about three times what a laptop measures, to absorb slow CI
+BUDGETS = {
+    "lsb.lsb": 60,
+    "lsb.registry": 60,
+    "utils.audio": 80,
+    "lsb.batch": 200,
+}
+DEFERRED_PACKAGES = ("django", "cryptography", "pydub", "dotenv", "CipherNest")
+
+
+class ImportReport:
+    def __init__(self, module: str, milliseconds: float, deferred_loaded: List[str]) -> None:
+        self.module = module
+        self.milliseconds = milliseconds
+        self.deferred_loaded = deferred_loaded
+
+    @property
+    def budget(self) -> float:
+        return BUDGETS.get(self.module)
+
+    @property
+    def ok(self) -> bool:
+        within = self.budget is None or self.milliseconds <= self.budget
+        return within and not self.deferred_loaded
+
+
+def measure(module: str) -> ImportReport:
+    script = (
+        f"import sys, {module}\n"
+        f"print(' '.join(sorted({{name.split('.')[0] for name in sys.modules}} & {set(DEFERRED_PACKAGES)!r})))"
+    )
+    env = {key: value for key, value in os.environ.items() if key != "DJANGO_SETTINGS_MODULE"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        cwd=BASE_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # "import time: self [us] | cumulative | imported package"
+    cumulative = None
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            cumulative = int(fields[1])
+    if cumulative is None:
+        raise ValueError(f"No import time reported for {module}")
+    return ImportReport(module, cumulative / 1000, result.stdout.split())
+
+
+def best_of(module: str, repeat: int = 3) -> ImportReport:
+    """The fastest of ``repeat`` cold imports, to filter out scheduling noise."""
+    return min((measure(module) for _ in range(repeat)), key=lambda report: report.milliseconds)
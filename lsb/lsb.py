@@ -8,22 +8,31 @@ from utils.exceptions import (
     RunOutOfFreeSpaceError,
     WrongPasswordError,
 )
-from lsb.models import ExtractedPayload
+from lsb.models import ExtractedPayload, PayloadHeader
+from .cancel import CANCEL_CHUNK_SIZE, checkpoint
+from .digest import CHUNK_SIZE, PayloadVerifier
+from .engines import get_engine
 from .file import File
+from . import solid as solid_archive
 from .header import LsbHeader
-from CipherNest import settings
+from .registry import get_endec
+from .config import get_setting
 
 
 class LSBSteganography:
-    def __init__(self):
-        self.secret_key = settings.SECRET_KEY
+    def __init__(self, engine: str = None, secret_key: str = None):
+        self.secret_key = secret_key or get_setting("SECRET_KEY")
+        if not self.secret_key:
+            raise ValueError("SECRET_KEY is not configured")
         self.qualities = {"low": 4, "medium": 2, "high": 1, "very_low": 8}
+        self.engine = get_engine(engine or get_setting("LSB_ENGINE"))
         self.header = LsbHeader(
             magic_string="CipherNest",
-            version="1.0",
+            version="1.1",
             qualities=self.qualities,
             block_delimiter="BLK",
             secret_key=self.secret_key,
+            engine=self.engine,
         )
 
     def get_free_space(
@@ -33,24 +42,123 @@ class LSBSteganography:
         quality: str = "medium",
         compressed: bool = False,
         passphrase: str = None,
+        solid: bool = False,
     ) -> int:
         if quality not in self.qualities:
             raise ValueError(f"Invalid quality {quality}")
-        bits_per_sample = self.qualities[quality]
+        if solid:
+            payload_size = solid_archive.payload_size(
+                secret_files, encrypted=passphrase is not None
+            )
+        else:
+            payload_size = File.payload_size(
+                secret_files, compressed=compressed, encrypted=passphrase is not None
+            )
+        return self._free_space(
+            len(samples), secret_files, quality, compressed, passphrase, payload_size, solid
+        )
+
+    def get_capacity_report(
+        self,
+        samples: List[int],
+        secret_files: List[File],
+        passphrase: str = None,
+    ) -> List[dict]:
+        """
+        Free space for every quality and compression/encryption combination,
+        compressing the files one by one or as one solid stream.
 
+        Only the number of samples is needed, and each secret file and the
+        solid stream are compressed at most once, so a single report
+        replaces one ``get_free_space`` call per combination.
+        """
         total_samples = len(samples)
+        # Lengths do not depend on the passphrase itself
+        encrypting_passphrase = passphrase or self.secret_key
+        shared = passphrase is None
+        solid_size = solid_archive.payload_size(secret_files, shared=shared)
+        report = []
+        # A solid stream is always compressed
+        for compressed, solid in ((False, False), (True, False), (True, True)):
+            for encrypted in (False, True):
+                if not solid:
+                    payload_size = File.payload_size(
+                        secret_files, compressed=compressed, encrypted=encrypted, shared=shared
+                    )
+                elif encrypted:
+                    payload_size = get_endec().estimate_encrypted_size(data_length=solid_size)
+                else:
+                    payload_size = solid_size
+                for quality in self.qualities_by_fidelity():
+                    free_space = self._free_space(
+                        total_samples,
+                        secret_files,
+                        quality,
+                        compressed,
+                        encrypting_passphrase if encrypted else None,
+                        payload_size,
+                        solid,
+                        shared,
+                    )
+                    report.append(
+                        {
+                            "quality": quality,
+                            "compressed": compressed,
+                            "encrypted": encrypted,
+                            "solid": solid,
+                            "free_space": free_space,
+                        }
+                    )
+        return report
+
+    def recommend_quality(
+        self,
+        report: List[dict],
+        compressed: bool = False,
+        encrypted: bool = False,
+        solid: bool = False,
+    ) -> str:
+        """Highest quality of ``report`` that fits the payload, or None."""
+        for quality in self.qualities_by_fidelity():
+            for entry in report:
+                if (
+                    entry["quality"] == quality
+                    and entry["solid"] == solid
+                    # The solid stream is compressed whatever was asked for
+                    and (solid or entry["compressed"] == compressed)
+                    and entry["encrypted"] == encrypted
+                    and entry["free_space"] >= 0
+                ):
+                    return quality
+        return None
+
+    def qualities_by_fidelity(self) -> List[str]:
+        # Fewer bits per sample means less audible noise
+        return sorted(self.qualities, key=self.qualities.get)
+
+    def _free_space(
+        self,
+        total_samples: int,
+        secret_files: List[File],
+        quality: str,
+        compressed: bool,
+        passphrase: str,
+        payload_size: int,
+        solid: bool = False,
+        shared: bool = None,
+    ) -> int:
+        bits_per_sample = self.qualities[quality]
         header_length = self.header.length(
             LsbHeader.Props(
                 secret_files=secret_files,
                 quality=quality,
                 compressed=compressed,
                 passphrase=passphrase,
+                solid=solid,
+                shared=shared,
             )
         )
-        total_secret_file_size = File.total_size(files=secret_files)
-        return (
-            ((total_samples * bits_per_sample) // 8) - header_length - total_secret_file_size
-        )
+        return ((total_samples * bits_per_sample) // 8) - header_length - payload_size
 
     def is_embedded(self, samples: List[int]) -> bool:
         try:
@@ -65,6 +173,8 @@ class LSBSteganography:
         quality: str = "medium",
         compressed: bool = False,
         passphrase: str = None,
+        payloads: List[bytes] = None,
+        solid: bool = False,
     ):
         free_space = self.get_free_space(
             samples=samples,
@@ -72,23 +182,35 @@ class LSBSteganography:
             quality=quality,
             compressed=compressed,
             passphrase=passphrase,
+            solid=solid,
         )
         lsb = self.qualities[quality]
 
         if free_space < 0:
             raise RunOutOfFreeSpaceError()
 
+        # The header carries a digest of the payloads, so prepare them first
+        if payloads is None:
+            payloads = self.prepare_payloads(secret_files, compressed, passphrase, solid)
         header = self.header.make_header(
             LsbHeader.Props(
                 secret_files=secret_files,
                 quality=quality,
                 compressed=compressed,
                 passphrase=passphrase,
+                payloads=payloads,
+                solid=solid,
             )
         )
 
         current_index = self.embed_data(samples, header, lsb, start_index=0)
 
+        if solid:
+            # A single stream holds every file
+            for payload in payloads:
+                current_index = self.embed_data(samples, payload, lsb, current_index)
+            return
+
         self.embed_data_singlethread(
             samples=samples,
             secret_files=secret_files,
@@ -96,26 +218,21 @@ class LSBSteganography:
             start_index=current_index,
             compressed=compressed,
             passphrase=passphrase,
+            payloads=payloads,
         )
 
     def embed_data(
         self, samples: List[int], data: bytes, lsb: int, start_index=0
     ) -> int:
-        end_index = len(data) * 8 // lsb + start_index
-        data_index = 0
-        bit_index = 0
-        for i in range(start_index, end_index):
-            if data_index >= len(data):
-                break
-            byte_to_embed = data[data_index]
-            bits_in_data_index = 8 - lsb - bit_index
-            bits_to_embed = (byte_to_embed >> bits_in_data_index) & ((1 << lsb) - 1)
-            samples[i] = (samples[i] & ~((1 << lsb) - 1)) | bits_to_embed
-            bit_index += lsb
-            if bit_index >= 8:
-                bit_index = 0
-                data_index += 1
-        return end_index
+        if len(data) <= CANCEL_CHUNK_SIZE:
+            return self.engine.embed(samples, data, lsb, start_index)
+        # Large payloads go in chunks so an abandoned request stops early
+        for start in range(0, len(data), CANCEL_CHUNK_SIZE):
+            checkpoint()
+            start_index = self.engine.embed(
+                samples, data[start : start + CANCEL_CHUNK_SIZE], lsb, start_index
+            )
+        return start_index
 
     def embed_data_multithread(
         self,
@@ -125,6 +242,7 @@ class LSBSteganography:
         start_index=0,
         compressed: bool = False,
         passphrase: str = None,
+        payloads: List[bytes] = None,
     ) -> int:
         num_threads = len(secret_files)
         thread_list = []
@@ -134,7 +252,11 @@ class LSBSteganography:
             part_start = start_index + thread_id * chunk_size
             self.embed_data(
                 samples=samples,
-                data=self._get_data(secret_file, compressed, passphrase),
+                data=(
+                    payloads[thread_id]
+                    if payloads is not None
+                    else self._get_data(secret_file, compressed, passphrase)
+                ),
                 lsb=lsb,
                 start_index=part_start,
             )
@@ -162,12 +284,17 @@ class LSBSteganography:
         start_index=0,
         compressed: bool = False,
         passphrase: str = None,
+        payloads: List[bytes] = None,
     ) -> int:
         start_time = time.time()  # Start timing
-        for secret_file in secret_files:
+        for i, secret_file in enumerate(secret_files):
             start_index = self.embed_data(
                 samples=samples,
-                data=self._get_data(secret_file, compressed, passphrase),
+                data=(
+                    payloads[i]
+                    if payloads is not None
+                    else self._get_data(secret_file, compressed, passphrase)
+                ),
                 lsb=lsb,
                 start_index=start_index,
             )
@@ -176,6 +303,25 @@ class LSBSteganography:
 
         return start_index
 
+    def prepare_payloads(
+        self,
+        secret_files: List[File],
+        compressed: bool = False,
+        passphrase: str = None,
+        solid: bool = False,
+    ) -> List[bytes]:
+        """
+        The compressed and/or encrypted bytes ``embed`` writes for each file,
+        or the one solid stream of all of them.
+        """
+        if solid:
+            return [solid_archive.prepare_payload(secret_files, passphrase)] if secret_files else []
+        payloads = []
+        for secret_file in secret_files:
+            checkpoint()
+            payloads.append(self._get_data(secret_file, compressed, passphrase))
+        return payloads
+
     def _get_data(self, file: File, compressed: bool = False, passphrase: str = None):
         if compressed and passphrase:
             return file.compress_encrypt(passphrase)
@@ -185,71 +331,84 @@ class LSBSteganography:
             return file.compressed_data
         return file.raw_data
 
-    def get_header_blocks(self, samples: List[int], passphrase: str = None) -> dict:
+    def _read_header(
+        self, samples: List[int], passphrase: str = None, raise_exception: bool = False
+    ):
         quality = self.header.get_quality_from_embedded_data(
-            samples, raise_exception=False
+            samples, raise_exception=raise_exception
         )
         if not quality:
-            return None
+            return None, None
         start_index = self.header.magic_str_index(quality)
         header_blocks = self.header.extract_header_blocks(samples, quality, start_index)
-        print('HEADER BLOCKS:::', header_blocks)
         is_encrypted = header_blocks["EF"] == "1"
         if is_encrypted and passphrase is None:
             raise RequirePasswordError()
         passphrase = passphrase or self.secret_key
-        if self.header.verify_hmac(key=passphrase, header_blocks=header_blocks) is True:
-            return header_blocks
-        if is_encrypted:
-            raise WrongPasswordError()
-        raise DataCorruptedError()
+        if self.header.verify_hmac(key=passphrase, header_blocks=header_blocks) is not True:
+            if is_encrypted:
+                raise WrongPasswordError()
+            raise DataCorruptedError()
+        header = PayloadHeader.from_blocks(
+            header_blocks, quality, self.qualities[quality]
+        )
+        return header_blocks, header
+
+    def get_header(self, samples: List[int], passphrase: str = None) -> PayloadHeader:
+        """The parsed header of ``samples``, or None when nothing is embedded."""
+        return self._read_header(samples, passphrase)[1]
+
+    def get_header_blocks(self, samples: List[int], passphrase: str = None) -> dict:
+        header_blocks, _ = self._read_header(samples, passphrase)
+        print('HEADER BLOCKS:::', header_blocks)
+        return header_blocks
 
     def extract_data(self, samples: List[int], passphrase: str = None) -> ExtractedPayload:
         start_time = time.time()  # Start timing
-        
-        quality = self.header.get_quality_from_embedded_data(samples)
-        start_index = self.header.magic_str_index(quality)
-        blocks = self.header.extract_header_blocks(samples, quality, start_index)
 
-        true, false = "1", "0"
-        ef = blocks["EF"] is true
-        if ef and passphrase is None:
-            raise RequirePasswordError()
-        
-        passphrase = passphrase or self.secret_key
-        if not self.header.verify_hmac(passphrase, blocks):
-            if ef:
-                raise WrongPasswordError()
-            else:
-                raise DataCorruptedError()
-
-        sizes = File.str_sizes_to_array(blocks["EMBEDDED_SIZES"])
-        filenames = File.str_filenames_to_array(blocks["FILENAMES"])
-        start_index = blocks["index"]
-        
-        extracted_files = []
-        for i in range(min(len(sizes), len(filenames))):
-            data = self._extract_data(samples, quality, start_index, sizes[i])
-            extracted_files.append((filenames[i], data))
-            start_index = start_index + sizes[i]
+        blocks, header = self._read_header(samples, passphrase, raise_exception=True)
+        # Every file is extracted into one buffer and handed out as views of it
+        payload = self._extract_verified_data(
+            samples, header.quality, header.index, header.payload_samples, header.digests
+        )
+        if header.solid:
+            payload = solid_archive.extract_files(
+                payload, header.sizes, passphrase if header.encrypted else None
+            )
 
         end_time = time.time()
         print(f"Execution time: {end_time - start_time:.6f} seconds")
 
-        return ExtractedPayload(metadata=blocks, extracted_files=extracted_files)
+        return ExtractedPayload.from_payload(blocks, header, payload)
 
-    def _extract_data(self, samples: List[int], quality, start_index, end_index):
+    def _extract_verified_data(
+        self, samples: List[int], quality, start_index, count, digests: bytes = None
+    ) -> bytearray:
+        # Check every chunk as it is decoded and stop at the first damaged one;
+        # payloads embedded before 1.1 carry no digests to check
         lsb = self.qualities[quality]
-        bits = []
-        for i in range(start_index, start_index + end_index):
-            extracted_bits = samples[i] & ((1 << lsb) - 1)
-            bits.append(format(extracted_bits, f"0{lsb}b"))
-
-        bits_str = "".join(bits)
-
-        data_bytes = bytearray()
-        for i in range(0, len(bits_str), 8):
-            byte = bits_str[i : i + 8]
-            data_bytes.append(int(byte, 2))
-
+        chunk_samples = CHUNK_SIZE * 8 // lsb
+        verifier = PayloadVerifier(digests) if digests is not None else None
+        end_index = start_index + count
+        if digests is not None and end_index > len(samples):
+            raise DataCorruptedError()
+        data_bytes = bytearray(count * lsb // 8)
+        position = 0
+        for index in range(start_index, end_index, chunk_samples):
+            checkpoint()
+            chunk = self._extract_data(
+                samples, quality, index, min(chunk_samples, end_index - index)
+            )
+            if verifier is not None:
+                verifier.verify(chunk)
+            data_bytes[position : position + len(chunk)] = chunk
+            position += len(chunk)
+        if verifier is not None:
+            verifier.finish()
+        # A legacy payload cut short by the end of the cover comes out shorter
+        del data_bytes[position:]
         return data_bytes
+
+    def _extract_data(self, samples: List[int], quality, start_index, end_index):
+        lsb = self.qualities[quality]
+        return self.engine.extract(samples, lsb, start_index, end_index)
@@ -0,0 +1,87 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lsb import batch
+
+
+class BatchCommand(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths", nargs="+", help="Cover files or directories of cover files"
+        )
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            default=1,
+            help="Number of worker processes (default: 1)",
+        )
+
+    def add_output_argument(self, parser):
+        parser.add_argument(
+            "--output-dir", required=True, help="Directory to write results into"
+        )
+
+    def add_payload_arguments(self, parser, required: bool = False):
+        parser.add_argument(
+            "--secret",
+            nargs="+",
+            default=[],
+            required=required,
+            dest="secret_files",
+            help="Secret files to embed",
+        )
+        parser.add_argument(
+            "--quality",
+            default="medium",
+            choices=list(batch.steganography().qualities),
+        )
+        parser.add_argument("--compressed", action="store_true")
+        parser.add_argument(
+            "--solid",
+            action="store_true",
+            help="Compress all secret files as one stream",
+        )
+
+    def add_password_argument(self, parser):
+        parser.add_argument("--password", default=None)
+
+    def covers(self, options):
+        covers = batch.collect_covers(options["paths"])
+        if not covers:
+            raise CommandError("No supported cover files found")
+        return covers
+
+    def outputs(self, options, extension: str = None):
+        """
+        ``(cover, output)`` pairs that mirror the input directories under
+        ``--output-dir``, so covers with the same name never overwrite each
+        other.
+        """
+        covers = batch.collect_named_covers(options["paths"])
+        if not covers:
+            raise CommandError("No supported cover files found")
+        outputs = []
+        seen = {}
+        for cover, name in covers:
+            if extension is not None:
+                name = os.path.splitext(name)[0] + extension
+            output = os.path.join(options["output_dir"], name)
+            key = os.path.normcase(os.path.normpath(output))
+            if key in seen:
+                raise CommandError(f"{cover} and {seen[key]} would both be written to {output}")
+            seen[key] = cover
+            os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+            outputs.append((cover, output))
+        return outputs
+
+    def report(self, func, tasks, jobs):
+        failures = 0
+        for ok, message in batch.run(func, tasks, jobs=jobs):
+            if ok:
+                self.stdout.write(message)
+            else:
+                failures += 1
+                self.stderr.write(self.style.ERROR(message))
+        if failures:
+            raise CommandError(f"{failures} of {len(tasks)} file(s) failed")
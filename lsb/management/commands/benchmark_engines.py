@@ -0,0 +1,53 @@
+import array
+import os
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lsb.engines import ENGINES, get_engine
+
+
+class Command(BaseCommand):
+    help = "Compare the embedding and extraction speed of the LSB engines"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--samples", type=int, default=1_000_000)
+        parser.add_argument("--payload", type=int, default=64 * 1024)
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument(
+            "--engines", nargs="+", default=list(ENGINES), choices=list(ENGINES)
+        )
+
+    def handle(self, *args, **options):
+        cover = array.array(
+            "h", (random.randint(-32768, 32767) for _ in range(options["samples"]))
+        )
+        self.stdout.write(
+            f"{'engine':<8} {'lsb':>3} {'embed (s)':>10} {'extract (s)':>12} {'MB/s':>8}"
+        )
+        for lsb in (1, 2, 4, 8):
+            payload_size = min(options["payload"], len(cover) * lsb // 8)
+            payload = os.urandom(payload_size)
+            count = payload_size * 8 // lsb
+            results = {}
+            for name in options["engines"]:
+                engine = get_engine(name)
+                embed_time = extract_time = float("inf")
+                for _ in range(options["repeat"]):
+                    samples = array.array("h", cover)
+                    start = time.perf_counter()
+                    engine.embed(samples, payload, lsb, 0)
+                    embed_time = min(embed_time, time.perf_counter() - start)
+                    start = time.perf_counter()
+                    extracted = engine.extract(samples, lsb, 0, count)
+                    extract_time = min(extract_time, time.perf_counter() - start)
+                if extracted != payload:
+                    raise CommandError(f"Engine {name} failed the round trip at lsb={lsb}")
+                results[name] = samples
+                throughput = payload_size / (embed_time + extract_time) / 1e6
+                self.stdout.write(
+                    f"{name:<8} {lsb:>3} {embed_time:>10.4f} {extract_time:>12.4f} {throughput:>8.2f}"
+                )
+            if len({samples.tobytes() for samples in results.values()}) > 1:
+                raise CommandError(f"Engines disagree on embedded samples at lsb={lsb}")
@@ -0,0 +1,25 @@
+from lsb import batch
+from ._base import BatchCommand
+
+
+class Command(BatchCommand):
+    help = "Report the free space left in cover files for the given secret files"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        self.add_payload_arguments(parser)
+        self.add_password_argument(parser)
+
+    def handle(self, *args, **options):
+        tasks = [
+            {
+                "cover": cover,
+                "secret_paths": options["secret_files"],
+                "quality": options["quality"],
+                "compressed": options["compressed"],
+                "solid": options["solid"],
+                "password": options["password"],
+            }
+            for cover in self.covers(options)
+        ]
+        self.report(batch.capacity_file, tasks, options["jobs"])
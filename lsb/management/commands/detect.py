@@ -0,0 +1,17 @@
+from lsb import batch
+from ._base import BatchCommand
+
+
+class Command(BatchCommand):
+    help = "Detect whether cover files carry data embedded by the system"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        self.add_password_argument(parser)
+
+    def handle(self, *args, **options):
+        tasks = [
+            {"cover": cover, "password": options["password"]}
+            for cover in self.covers(options)
+        ]
+        self.report(batch.detect_file, tasks, options["jobs"])
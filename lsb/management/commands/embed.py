@@ -0,0 +1,27 @@
+from lsb import batch
+from ._base import BatchCommand
+
+
+class Command(BatchCommand):
+    help = "Embed secret files into cover files or directories of cover files"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        self.add_output_argument(parser)
+        self.add_payload_arguments(parser, required=True)
+        self.add_password_argument(parser)
+
+    def handle(self, *args, **options):
+        tasks = [
+            {
+                "cover": cover,
+                "output": output,
+                "secret_paths": options["secret_files"],
+                "quality": options["quality"],
+                "compressed": options["compressed"],
+                "solid": options["solid"],
+                "password": options["password"],
+            }
+            for cover, output in self.outputs(options)
+        ]
+        self.report(batch.embed_file, tasks, options["jobs"])
@@ -0,0 +1,22 @@
+from lsb import batch
+from ._base import BatchCommand
+
+
+class Command(BatchCommand):
+    help = "Extract embedded secret files from cover files into zip archives"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        self.add_output_argument(parser)
+        self.add_password_argument(parser)
+
+    def handle(self, *args, **options):
+        tasks = [
+            {
+                "cover": cover,
+                "output": output,
+                "password": options["password"],
+            }
+            for cover, output in self.outputs(options, extension=".zip")
+        ]
+        self.report(batch.extract_file, tasks, options["jobs"])
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from lsb.importtime import BUDGETS, best_of
+
+
+class Command(BaseCommand):
+    help = "Measure cold import times of the steganography core against their budgets"
+
+    def add_arguments(self, parser):
+        parser.add_argument("modules", nargs="*", default=list(BUDGETS))
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'module':<16} {'import (ms)':>12} {'budget (ms)':>12}  deferred loaded")
+        failed = []
+        for module in options["modules"]:
+            report = best_of(module, options["repeat"])
+            budget = "-" if report.budget is None else f"{report.budget:.0f}"
+            self.stdout.write(
+                f"{module:<16} {report.milliseconds:>12.1f} {budget:>12}  "
+                f"{', '.join(report.deferred_loaded) or '-'}"
+            )
+            if not report.ok:
+                failed.append(module)
+        if failed:
+            raise CommandError(f"Over the import budget: {', '.join(failed)}")
@@ -0,0 +1,123 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from utils import loadtest
+
+
+def parse_mix(value: str):
+    mix = {}
+    for item in value.split(","):
+        endpoint, _, weight = item.partition("=")
+        if endpoint not in loadtest.ENDPOINTS:
+            raise CommandError(f"Invalid endpoint {endpoint} in --mix")
+        try:
+            mix[endpoint] = int(weight or 1)
+        except ValueError:
+            raise CommandError(f"Invalid weight {weight} in --mix")
+    return mix
+
+
+class Command(BaseCommand):
+    help = "Replay synthetic uploads against the HTTP endpoints and report latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--server", default="gunicorn", choices=loadtest.SERVERS)
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument(
+            "--url", default=None, help="Target a running server instead of starting one"
+        )
+        parser.add_argument("--requests", type=int, default=100)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument(
+            "--mix",
+            default="covers=2,embed=1,extract=1",
+            help="Comma separated endpoint=weight pairs",
+        )
+        parser.add_argument(
+            "--formats", nargs="+", default=["wav", "flac"], choices=["wav", "flac"]
+        )
+        parser.add_argument(
+            "--payload-sizes", nargs="+", type=int, default=[1024, 32 * 1024]
+        )
+        parser.add_argument(
+            "--seconds", type=float, default=5, help="Duration of the synthetic covers"
+        )
+        parser.add_argument(
+            "--password-ratio",
+            type=float,
+            default=0.5,
+            help="Share of scenarios sent with a password",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.stdout.write("Preparing synthetic covers...")
+        scenarios = loadtest.build_scenarios(
+            mix=parse_mix(options["mix"]),
+            formats=options["formats"],
+            payload_sizes=options["payload_sizes"],
+            seconds=options["seconds"],
+            password_ratio=options["password_ratio"],
+            seed=options["seed"],
+        )
+
+        if options["url"]:
+            results, elapsed = loadtest.run_load(
+                options["url"],
+                scenarios,
+                options["requests"],
+                options["concurrency"],
+                seed=options["seed"],
+            )
+            self.write_results(results, elapsed)
+            return
+
+        port = loadtest.free_port()
+        process = loadtest.start_server(options["server"], options["workers"], port)
+        try:
+            try:
+                loadtest.wait_for_port(port, process)
+            except RuntimeError as e:
+                raise CommandError(str(e))
+            with loadtest.RssMonitor(process.pid) as monitor:
+                results, elapsed = loadtest.run_load(
+                    f"http://127.0.0.1:{port}",
+                    scenarios,
+                    options["requests"],
+                    options["concurrency"],
+                    seed=options["seed"],
+                )
+        finally:
+            process.terminate()
+            process.wait()
+        self.write_results(results, elapsed)
+        self.stdout.write("\nPeak RSS")
+        for pid, peak in sorted(monitor.peaks.items()):
+            role = "master" if pid == process.pid else "worker"
+            self.stdout.write(f"  {role:<6} {pid:>8} {peak / 1024:>10.1f} MiB")
+
+    def write_results(self, results: loadtest.Results, elapsed: float):
+        total = sum(map(len, results.latencies.values()))
+        errors = sum(results.errors.values())
+        self.stdout.write(
+            f"\n{total} requests in {elapsed:.2f}s ({total / elapsed:.1f} req/s), "
+            f"{errors} errors ({errors / max(total, 1):.1%})"
+        )
+        self.stdout.write(
+            f"\n{'scenario':<14} {'count':>6} {'errors':>7} "
+            f"{'p50 (ms)':>9} {'p90 (ms)':>9} {'p99 (ms)':>9}"
+        )
+        for name, latencies in sorted(results.latencies.items()):
+            p50, p90, p99 = (
+                results.percentile(latencies, fraction) * 1000
+                for fraction in (0.5, 0.9, 0.99)
+            )
+            self.stdout.write(
+                f"{name:<14} {len(latencies):>6} {results.errors.get(name, 0):>7} "
+                f"{p50:>9.1f} {p90:>9.1f} {p99:>9.1f}"
+            )
+        for name, latencies in sorted(results.latencies.items()):
+            self.stdout.write(f"\n{name}")
+            peak = max(count for _, count in results.histogram(latencies))
+            for label, count in results.histogram(latencies):
+                bar = "#" * (40 * count // peak if peak else 0)
+                self.stdout.write(f"  {label:>10} {count:>6} {bar}")
@@ -1,30 +1,208 @@
-from typing import List, Dict, Any, Tuple
+from array import array
+from collections.abc import Sequence
+from itertools import accumulate
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# CF block of a solid payload, see lsb.solid
+SOLID_FLAG = "2"
+
+
+class PayloadHeader:
+    """
+    The header blocks of an embedded payload, parsed once.
+
+    ``sizes`` counts the samples each file takes and ``offsets`` where each
+    file starts, relative to ``index``. In a solid payload both are bytes
+    inside the decompressed stream instead, and the stream alone takes
+    ``payload_samples``. (A plain slotted class: ``dataclasses`` would add a
+    sizeable share of the core's import budget.)
+    """
+
+    __slots__ = (
+        "version",
+        "compressed",
+        "solid",
+        "encrypted",
+        "filenames",
+        "sizes",
+        "offsets",
+        "payload_samples",
+        "digests",
+        "hmac",
+        "quality",
+        "lsb",
+        "index",
+    )
+
+    def __init__(
+        self,
+        version: str,
+        compressed: bool,
+        solid: bool,
+        encrypted: bool,
+        filenames: Tuple[str, ...],
+        sizes: array,
+        offsets: array,
+        payload_samples: int,
+        digests: Optional[bytes],
+        hmac: bytes,
+        quality: str,
+        lsb: int,
+        index: int,
+    ) -> None:
+        self.version = version
+        self.compressed = compressed
+        self.solid = solid
+        self.encrypted = encrypted
+        self.filenames = filenames
+        self.sizes = sizes
+        self.offsets = offsets
+        self.payload_samples = payload_samples
+        self.digests = digests
+        self.hmac = hmac
+        self.quality = quality
+        self.lsb = lsb
+        self.index = index
+
+    @classmethod
+    def from_blocks(cls, blocks: Dict[str, Any], quality: str, lsb: int) -> "PayloadHeader":
+        filenames = tuple(blocks["FILENAMES"].split("/"))
+        sizes = array(
+            "Q", (int(size) for size in blocks["EMBEDDED_SIZES"].split("/") if size)
+        )
+        solid = blocks["CF"] == SOLID_FLAG
+        if solid:
+            stream_samples, sizes = (sizes[0] if sizes else 0), sizes[1:]
+        # Blocks that disagree on the file count only describe the files in both
+        count = min(len(filenames), len(sizes))
+        sizes = sizes[:count]
+        offsets = array("Q", accumulate(sizes, initial=0))
+        return cls(
+            version=blocks["VERSION"],
+            compressed=blocks["CF"] in ("1", SOLID_FLAG),
+            solid=solid,
+            encrypted=blocks["EF"] == "1",
+            filenames=filenames[:count],
+            sizes=sizes,
+            offsets=offsets,
+            payload_samples=stream_samples if solid else offsets[-1],
+            digests=blocks.get("DIGESTS"),
+            hmac=blocks["HMAC"],
+            quality=quality,
+            lsb=lsb,
+            index=blocks["index"],
+        )
+
+    def byte_range(self, position: int) -> Tuple[int, int]:
+        """Where file ``position`` lies in the extracted payload bytes."""
+        if self.solid:
+            return self.offsets[position], self.offsets[position + 1]
+        return (
+            self.offsets[position] * self.lsb // 8,
+            self.offsets[position + 1] * self.lsb // 8,
+        )
+
+
+class FileViews(Sequence):
+    """
+    ``(filename, data)`` pairs made on first access from ``load(position)``,
+    so a payload of many files costs no copy per file until one is read.
+    """
+
+    __slots__ = ("filenames", "load", "_views")
+
+    def __init__(self, filenames: Tuple[str, ...], load: Callable[[int], memoryview]):
+        self.filenames = filenames
+        self.load = load
+        self._views = [None] * len(filenames)
+
+    def __len__(self) -> int:
+        return len(self.filenames)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        view = self._views[position]
+        if view is None:
+            view = self._views[position] = (self.filenames[position], self.load(position))
+        return view
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (list, tuple, FileViews)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
 
 class ExtractedPayload:
-    def __init__(self, metadata: Dict[str, Any], extracted_files: List[Tuple[str, bytes]]):
-        self.metadata = metadata  
-        self.extracted_files = extracted_files  
+    __slots__ = ("metadata", "header", "extracted_files")
+
+    def __init__(
+        self,
+        metadata: Dict[str, Any],
+        extracted_files: List[Tuple[str, bytes]],
+        header: PayloadHeader = None,
+    ):
+        self.metadata = metadata
+        self.header = header
+        self.extracted_files = extracted_files
+
+    @classmethod
+    def from_payload(
+        cls, metadata: Dict[str, Any], header: PayloadHeader, payload: bytearray
+    ) -> "ExtractedPayload":
+        """
+        Files as views into the single buffer all of them were extracted to:
+        the embedded payload, or the decompressed stream of a solid one.
+        """
+        view = memoryview(payload)
+
+        def load(position: int) -> memoryview:
+            start, end = header.byte_range(position)
+            return view[start:end]
+
+        return cls(metadata, FileViews(header.filenames, load), header)
 
     def is_encrypted(self) -> bool:
+        if self.header is not None:
+            return self.header.encrypted
         ef_block = self.metadata.get("EF")
         return ef_block == "1"
 
     def is_compressed(self) -> bool:
+        if self.header is not None:
+            return self.header.compressed
         cf_block = self.metadata.get("CF")
-        return cf_block == "1"
+        return cf_block in ("1", SOLID_FLAG)
+
+    def is_solid(self) -> bool:
+        """Whether the files were decrypted and decompressed during extraction."""
+        if self.header is not None:
+            return self.header.solid
+        return self.metadata.get("CF") == SOLID_FLAG
 
     def get_version(self) -> str:
+        if self.header is not None:
+            return self.header.version
         version_block = self.metadata.get("VERSION")
         return version_block if version_block else None
 
     def get_filenames(self) -> List[str]:
+        if self.header is not None:
+            return list(self.header.filenames)
         filenames_block = self.metadata.get("FILENAMES")
         return filenames_block if filenames_block else []
 
     def get_embedded_sizes(self) -> List[int]:
+        if self.header is not None:
+            return self.header.sizes.tolist()
         sizes_block = self.metadata.get("EMBEDDED_SIZES")
         return sizes_block if sizes_block else []
 
     def get_hmac(self) -> str:
+        if self.header is not None:
+            return self.header.hmac
         hmac_block = self.metadata.get("HMAC")
         return hmac_block if hmac_block else None
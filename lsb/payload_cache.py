@@ -0,0 +1,174 @@
+"""
+Compressed secret-file payloads shared across requests.
+
+Batch clients embed the same licence file or key bundle into many covers,
+and every request used to deflate it again. Compressed bytes are cached
+by the SHA-256 of the raw bytes in two tiers: a per-process LRU bounded
+in bytes, and a directory that every worker process on the host shares.
+Disk entries are written atomically under their key and evicted oldest
+access first (hits refresh the mtime) once the directory grows past its
+budget, and carry a checksum so a damaged file is recompressed instead
+of embedded. Each process keeps a running total of the directory size,
+taken from a scan when the cache is built and when it evicts, so a write
+only lists the directory once the total goes past the budget.
+
+Only compression is cached, and only for files embedded without a
+password: the compressed bytes of a secret that is going to be encrypted
+are its plaintext, so they never reach a shared cache. Encryption runs on
+every request so that each payload gets a fresh salt and IV.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+# Bumped whenever the codec output changes, so old entries are never read
+KEY_PREFIX = "zlib1-"
+# Disk entries end with the SHA-256 of the value, checked on every read
+CHECKSUM_SIZE = 32
+
+
+class PayloadCache:
+    def __init__(
+        self, memory_bytes: int, directory: Optional[str] = None, disk_bytes: int = 0
+    ) -> None:
+        self.memory_bytes = memory_bytes
+        self.directory = directory if directory and disk_bytes else None
+        self.disk_bytes = disk_bytes
+        self.entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self.size = 0
+        self.disk_size = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self.disk_size = sum(size for _, size, _ in self._scan_disk())
+
+    @staticmethod
+    def key(data: bytes) -> str:
+        return KEY_PREFIX + hashlib.sha256(data).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _remember(self, key: str, value: bytes) -> None:
+        if len(value) > self.memory_bytes:
+            return
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return
+            self.entries[key] = value
+            self.size += len(value)
+            while self.size > self.memory_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+        if self.directory:
+            value = self._read(key)
+            if value is not None:
+                self._remember(key, value)
+                self.hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def _read(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as cached:
+                stored = cached.read()
+            os.utime(self._path(key))
+        except OSError:
+            return None
+        value, checksum = stored[:-CHECKSUM_SIZE], stored[-CHECKSUM_SIZE:]
+        if hashlib.sha256(value).digest() != checksum:
+            # Damaged on disk: recompress rather than embed garbage
+            return None
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        self._remember(key, value)
+        if not self.directory or len(value) > self.disk_bytes:
+            return
+        temporary = None
+        try:
+            descriptor, temporary = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            with os.fdopen(descriptor, "wb") as cached:
+                cached.write(value)
+                cached.write(hashlib.sha256(value).digest())
+            # Readers in other processes see the whole entry or none of it
+            os.replace(temporary, self._path(key))
+            temporary = None
+            with self._lock:
+                self.disk_size += len(value) + CHECKSUM_SIZE
+                full = self.disk_size > self.disk_bytes
+            if full:
+                self._evict_disk()
+        except OSError:
+            pass
+        finally:
+            if temporary is not None:
+                try:
+                    os.remove(temporary)
+                except OSError:
+                    pass
+
+    def _scan_disk(self):
+        """``(mtime, size, path)`` of every entry in the directory."""
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if not entry.name.startswith(KEY_PREFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict_disk(self) -> None:
+        # Other workers write to the directory too, so evict from a fresh listing
+        entries = sorted(self._scan_disk())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        with self._lock:
+            self.disk_size = total
+
+    def get_or_compute(
+        self, data: bytes, compute: Callable[[bytes], bytes], key: str = None
+    ) -> bytes:
+        key = key or self.key(data)
+        value = self.get(key)
+        if value is None:
+            value = compute(data)
+            self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+            self.size = 0
+        if self.directory:
+            for _, _, path in self._scan_disk():
+                os.remove(path)
+            with self._lock:
+                self.disk_size = 0
@@ -0,0 +1,112 @@
+"""
+Process-wide instances shared by every request handled by a worker.
+
+The engines hold no per-request state, so one instance of each is built on
+first use (or by ``warm_up`` at worker boot) and reused across threads.
+"""
+
+import array
+import threading
+import time
+
+from utils.codec import CoDec
+from utils.endec import EnDec
+
+# Reentrant: building the steganography instance builds the dispatcher
+_lock = threading.RLock()
+_instances = {}
+
+
+def _get(name: str, factory):
+    instance = _instances.get(name)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(name)
+            if instance is None:
+                instance = _instances[name] = factory()
+    return instance
+
+
+def _steganography():
+    from .lsb import LSBSteganography
+
+    return LSBSteganography()
+
+
+def _dispatcher():
+    from .dispatch import Dispatcher
+
+    return Dispatcher()
+
+
+def _payload_cache():
+    from .config import get_setting
+    from .payload_cache import PayloadCache
+
+    return PayloadCache(
+        memory_bytes=int(get_setting("PAYLOAD_CACHE_MEMORY_BYTES")),
+        directory=get_setting("PAYLOAD_CACHE_DIR") or None,
+        disk_bytes=int(get_setting("PAYLOAD_CACHE_DISK_BYTES")),
+    )
+
+
+def _zip():
+    from utils.zip import Zip
+
+    return Zip()
+
+
+def get_steganography():
+    return _get("steganography", _steganography)
+
+
+def get_zip():
+    return _get("zip", _zip)
+
+
+def get_dispatcher():
+    return _get("dispatcher", _dispatcher)
+
+
+def get_payload_cache():
+    return _get("payload_cache", _payload_cache)
+
+
+def reset(name: str) -> None:
+    """Drop a shared instance so that its next use builds it from current settings."""
+    with _lock:
+        _instances.pop(name, None)
+
+
+def get_codec() -> CoDec:
+    return _get("codec", CoDec)
+
+
+def get_endec() -> EnDec:
+    return _get("endec", EnDec)
+
+
+def warm_up() -> float:
+    """
+    Build the shared engines and run one embed/extract round trip.
+    With the "auto" engine, also calibrate the dispatcher first.
+    """
+    from .engines import AUTO_ENGINE
+    from .file import File
+
+    start_time = time.time()
+    algorithm = get_steganography()
+    if algorithm.engine.name == AUTO_ENGINE:
+        get_dispatcher().calibrate()
+    data = b"warm-up"
+    samples = array.array("h", bytes(8192))
+    algorithm.embed(
+        samples=samples,
+        secret_files=[File(name="warm-up.txt", size=len(data), data=data)],
+        quality="medium",
+        compressed=True,
+        passphrase="warm-up",
+    )
+    payload = algorithm.extract_data(samples=samples, passphrase="warm-up")
+    get_zip().create_zip(response_data=payload, password="warm-up")
+    return time.time() - start_time
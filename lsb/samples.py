@@ -0,0 +1,144 @@
+import threading
+from abc import ABC, abstractmethod
+from array import array
+
+
+class SampleBuffer:
+    """
+    Packed PCM samples addressed through their least significant byte.
+
+    LSB embedding only ever touches the low bits of a sample, so instead of
+    widening every sample to an integer array the buffer reads and writes the
+    low byte of each packed sample in place, whatever the sample width or
+    byte order. ``raw``, ``width`` and ``offset`` describe the strided byte
+    layout for engines that work on whole buffers.
+    """
+
+    def __init__(self, raw, sample_width: int, byteorder: str = "little") -> None:
+        self.raw = memoryview(raw).cast("B")
+        self.width = sample_width
+        self.offset = 0 if byteorder == "little" else sample_width - 1
+        self.length = len(self.raw) // sample_width
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index: int) -> int:
+        if not 0 <= index < self.length:
+            raise IndexError("sample index out of range")
+        return self.raw[index * self.width + self.offset]
+
+    def __setitem__(self, index: int, value: int) -> None:
+        if not 0 <= index < self.length:
+            raise IndexError("sample index out of range")
+        self.raw[index * self.width + self.offset] = value & 0xFF
+
+    def tobytes(self) -> bytes:
+        return self.raw.tobytes()
+
+    def release(self) -> None:
+        self.raw.release()
+
+
+class LazySamples(ABC):
+    """
+    Samples produced on demand by a decoder.
+
+    This is the decoder interface: ``len()`` is the total number of samples
+    in the stream, but a subclass only decodes the prefix callers actually
+    read or write, one ``decode_more`` block at a time, into ``decoded`` (an
+    integer array or a SampleBuffer). ``available`` counts the decoded
+    samples and ``dirty_end`` how far samples were modified, so containers
+    can re-encode only that range.
+    """
+
+    def __init__(self, length: int, decoded=None) -> None:
+        self.length = length
+        self.decoded = array("i") if decoded is None else decoded
+        self.available = 0
+        self.dirty_end = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.length
+
+    @abstractmethod
+    def decode_more(self) -> bool:
+        """Decode the next block of samples into ``decoded``; False when exhausted."""
+
+    def ensure(self, end: int) -> None:
+        if end <= self.available:
+            return
+        with self._lock:
+            while self.available < end and self.decode_more():
+                pass
+        if self.available < end:
+            raise IndexError("sample index out of range")
+
+    def region(self, end: int, writable: bool = False):
+        self.ensure(end)
+        if writable:
+            self.dirty_end = max(self.dirty_end, end)
+        return self.decoded
+
+    def __getitem__(self, index: int) -> int:
+        if index >= self.available:
+            self.ensure(index + 1)
+        return self.decoded[index]
+
+    def __setitem__(self, index: int, value: int) -> None:
+        self.region(index + 1, writable=True)[index] = value
+
+
+class PcmSamples(LazySamples):
+    """
+    Uncompressed PCM samples read from a file object only as far as needed.
+
+    The sample buffer starts empty and grows, doubling up to the size of the
+    data chunk, only as reads reach further into the stream, so probing or
+    extracting from a long cover costs memory in proportion to the prefix
+    that is actually read.
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(
+        self, file, data_offset: int, data_length: int, sample_width: int, byteorder: str
+    ) -> None:
+        self.file = file
+        self.data_offset = data_offset
+        self.data_length = data_length
+        self.byteorder = byteorder
+        self.raw = bytearray()
+        self.filled = 0
+        super().__init__(
+            data_length // sample_width,
+            decoded=SampleBuffer(self.raw, sample_width, byteorder),
+        )
+
+    def _grow(self) -> None:
+        # The SampleBuffer view pins the bytearray, so growing means a new buffer
+        capacity = min(
+            max(2 * len(self.raw), self.filled + self.chunk_size), self.data_length
+        )
+        raw = bytearray(capacity)
+        raw[: self.filled] = self.raw[: self.filled]
+        width = self.decoded.width
+        self.decoded.release()
+        self.raw = raw
+        self.decoded = SampleBuffer(raw, width, self.byteorder)
+
+    def decode_more(self) -> bool:
+        if self.filled >= self.data_length:
+            return False
+        if self.filled >= len(self.raw):
+            self._grow()
+        self.file.seek(self.data_offset + self.filled)
+        end = min(self.filled + self.chunk_size, len(self.raw))
+        with memoryview(self.raw) as view:
+            read = self.file.readinto(view[self.filled : end])
+        if not read:
+            return False
+        self.filled += read
+        self.available = self.filled // self.decoded.width
+        return True
@@ -0,0 +1,100 @@
+"""
+Solid compression: every secret file in one deflate stream.
+
+Compressed one by one, each file starts from an empty window, so payloads
+of many small, similar files (configs, JSON, logs) barely shrink. In solid
+mode the raw files are concatenated into a single stream, where every file
+is compressed against the ones before it, and the stream is encrypted as a
+whole, so the payload also needs a single key derivation.
+
+The header marks a solid payload with CF=2. Its EMBEDDED_SIZES block
+starts with the samples the stream takes, followed by the length of every
+file inside the decompressed stream. Extraction decompresses the stream
+once and slices the files out of it.
+"""
+
+import hashlib
+from typing import List
+
+from utils.exceptions import DataCorruptedError
+from .cancel import checkpoint
+from .registry import get_codec, get_endec, get_payload_cache
+
+
+def cache_key(files: List) -> str:
+    # Deferred like the cache itself, which pulls in tempfile
+    from .payload_cache import KEY_PREFIX
+
+    digest = hashlib.sha256()
+    for file in files:
+        digest.update(file.cache_key.encode())
+    return f"{KEY_PREFIX}solid-{digest.hexdigest()}"
+
+
+def compress_files(files: List, shared: bool = True) -> bytes:
+    """
+    The solid stream of ``files``, shared across requests like single files
+    unless ``shared`` is False (the stream is going to be encrypted).
+    """
+
+    def chunks():
+        for file in files:
+            checkpoint()
+            yield file.raw_data
+
+    if not shared:
+        return get_codec().compress_chunks(chunks())
+    cache = get_payload_cache()
+    key = cache_key(files)
+    stream = cache.get(key)
+    if stream is None:
+        stream = get_codec().compress_chunks(chunks())
+        cache.put(key, stream)
+    return stream
+
+
+def payload_size(files: List, encrypted: bool = False, shared: bool = None) -> int:
+    """
+    Bytes the solid payload of ``files`` takes once prepared for embedding.
+    ``shared`` (by default, unless ``encrypted``) lets compression use the
+    shared cache.
+    """
+    if shared is None:
+        shared = not encrypted
+    size = len(compress_files(files, shared=shared)) if files else 0
+    if encrypted:
+        size = get_endec().estimate_encrypted_size(data_length=size)
+    return size
+
+
+def prepare_payload(files: List, passphrase: str = None) -> bytes:
+    if passphrase:
+        return get_endec().encrypt_data(passphrase, compress_files(files, shared=False))
+    return compress_files(files)
+
+
+def embedded_sizes(
+    files: List,
+    num_bits: int,
+    passphrase: str = None,
+    payload: bytes = None,
+    delimiter: str = "/",
+    shared: bool = None,
+) -> str:
+    if payload is not None:
+        stream_size = len(payload)
+    else:
+        stream_size = payload_size(files, encrypted=passphrase is not None, shared=shared)
+    sizes = [stream_size * 8 // num_bits, *(len(file.raw_data) for file in files)]
+    return delimiter.join(str(size) for size in sizes)
+
+
+def extract_files(payload: bytes, sizes, passphrase: str = None) -> bytes:
+    """The decompressed stream holding the files of ``sizes``, back to back."""
+    checkpoint()
+    if passphrase:
+        payload = get_endec().decrypt_data(passphrase, payload)
+    data = get_codec().decompress_exactly(payload, sum(sizes))
+    if data is None:
+        raise DataCorruptedError()
+    return data
@@ -1,16 +1,41 @@
-from django.test import TestCase
+import array
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import wave
+import zipfile
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import LiveServerTestCase, TestCase, override_settings
+from django.urls import reverse
 from unittest.mock import patch
 from django.test import TestCase
 
+from lsb.cancel import CANCEL_CHUNK_SIZE
+from lsb.digest import CHUNK_SIZE as DIGEST_CHUNK_SIZE, DIGEST_SIZE, PayloadDigest, PayloadVerifier
+from lsb.dispatch import CALIBRATION_SIZES, DispatchEngine, Dispatcher
+from lsb.engines import BytesEngine, LoopEngine, ParallelEngine
+from lsb import config, registry
+from lsb.importtime import BASE_DIR, BUDGETS, measure
 from lsb.lsb import LSBSteganography
+from lsb.payload_cache import CHECKSUM_SIZE, PayloadCache
+from testing.artifacts import TemporaryArtifactsMixin
+from utils.codec import CoDec
+from utils.zip import Zip
 from .file import File  
 from .header import LsbHeader  
-from .models import ExtractedPayload  
+from .models import ExtractedPayload, PayloadHeader
 from utils.exceptions import NotEmbeddedBySystemError, DataCorruptedError, RequirePasswordError, RunOutOfFreeSpaceError, WrongPasswordError
 
 class FileTests(TestCase):
 
     def setUp(self):
+        # Mocked codecs must neither hit nor fill the shared payload cache
+        registry.get_payload_cache().clear()
+        self.addCleanup(registry.get_payload_cache().clear)
         self.test_data = b"Test data for file operations."
         self.file = File(name="test_file.txt", size=len(self.test_data), data=self.test_data)
 
@@ -74,6 +99,104 @@ class FileTests(TestCase):
         self.assertEqual(total, 579)
 
 
+class PayloadCacheTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def make_cache(self, memory_bytes=1024, disk_bytes=1024):
+        return PayloadCache(memory_bytes, self.directory.name, disk_bytes)
+
+    def test_memory_tier_evicts_least_recently_used(self):
+        cache = PayloadCache(memory_bytes=250)
+        for key in ("a", "b"):
+            cache.put(key, bytes(100))
+        cache.get("a")
+        cache.put("c", bytes(100))
+        self.assertEqual(list(cache.entries), ["a", "c"])
+        self.assertEqual(cache.size, 200)
+
+    def test_disk_tier_is_shared(self):
+        key = PayloadCache.key(b"licence")
+        self.make_cache().put(key, b"compressed")
+        other = self.make_cache()
+        self.assertEqual(other.entries, {})
+        self.assertEqual(other.get(key), b"compressed")
+        self.assertIn(key, other.entries)
+
+    def test_disk_tier_evicts_oldest_access(self):
+        cache = self.make_cache(memory_bytes=0, disk_bytes=250)
+        keys = [PayloadCache.key(bytes([i])) for i in range(3)]
+        for age, key in enumerate(keys[:2]):
+            cache.put(key, bytes(80))
+            os.utime(os.path.join(self.directory.name, key), (1000 + age, 1000 + age))
+        cache.put(keys[2], bytes(80))
+        self.assertIsNone(cache.get(keys[0]))
+        self.assertIsNotNone(cache.get(keys[1]))
+        self.assertEqual(cache.disk_size, 2 * (80 + CHECKSUM_SIZE))
+
+    def test_disk_size_is_tracked_between_evictions(self):
+        cache = self.make_cache(memory_bytes=0, disk_bytes=1024)
+        cache.put(PayloadCache.key(b"a"), bytes(100))
+        with patch("os.scandir") as scandir:
+            cache.put(PayloadCache.key(b"b"), bytes(100))
+        scandir.assert_not_called()
+        self.assertEqual(cache.disk_size, 2 * (100 + CHECKSUM_SIZE))
+        self.assertEqual(self.make_cache().disk_size, cache.disk_size)
+
+    def test_size_follows_the_embedded_bytes(self):
+        cache = self.make_cache(memory_bytes=0)
+        data = b"licence " * 100
+        file = File(name="licence.txt", size=len(data), data=data)
+        # A damaged entry of another length: it fails its check and is recompressed
+        with open(os.path.join(self.directory.name, file.cache_key), "wb") as entry:
+            entry.write(bytes(500))
+        with patch("lsb.file.get_payload_cache", return_value=cache):
+            self.assertEqual(file.compressed_size, len(CoDec().compress_data(data)))
+            self.assertEqual(file.compressed_size, len(file.compressed_data))
+
+    def test_damaged_entry_is_a_miss(self):
+        cache = self.make_cache(memory_bytes=0)
+        key = PayloadCache.key(b"bundle")
+        cache.put(key, b"compressed")
+        with open(os.path.join(self.directory.name, key), "r+b") as entry:
+            entry.write(b"X")
+        self.assertIsNone(cache.get(key))
+
+    def test_files_share_compression_but_not_encryption(self):
+        self.assertIsNone(registry.get_payload_cache().directory)
+        registry.get_payload_cache().clear()
+        self.addCleanup(registry.get_payload_cache().clear)
+        data = os.urandom(64) * 100
+        first = File(name="licence.txt", size=len(data), data=data)
+        second = File(name="licence.txt", size=len(data), data=data)
+        with patch("utils.codec.CoDec.compress_data", wraps=CoDec().compress_data) as compress:
+            self.assertEqual(first.compressed_data, second.compressed_data)
+            third = File(name="bundle.txt", size=len(data), data=data)
+            self.assertEqual(third.compressed_size, len(first.compressed_data))
+        compress.assert_called_once()
+        self.assertNotEqual(first.compress_encrypt("secret"), second.compress_encrypt("secret"))
+
+    def test_password_protected_files_skip_the_cache(self):
+        cache = PayloadCache(memory_bytes=1 << 20, directory=self.directory.name, disk_bytes=1 << 20)
+        data = b"private key material " * 50
+        secret_files = [File(name="key.pem", size=len(data), data=data)]
+        with patch.object(registry, "get_payload_cache", return_value=cache), patch(
+            "lsb.solid.get_payload_cache", return_value=cache
+        ), patch("lsb.file.get_payload_cache", return_value=cache):
+            stego = LSBSteganography()
+            samples = array.array("h", bytes(40000))
+            for solid in (False, True):
+                stego.get_free_space(samples, secret_files, "low", True, "pw", solid=solid)
+                stego.get_capacity_report(samples, secret_files, passphrase="pw")
+                stego.embed(
+                    samples=samples, secret_files=secret_files, quality="low",
+                    compressed=True, passphrase="pw", solid=solid,
+                )
+        self.assertEqual(cache.entries, {})
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+
 class LsbHeaderTestCase(TestCase):
     def setUp(self):
         self.magic_string = "CipherNest"
@@ -197,6 +320,31 @@ class ExtractedPayloadTestCase(TestCase):
         payload_no_hmac = ExtractedPayload(metadata={}, extracted_files=[])
         self.assertEqual(payload_no_hmac.get_hmac(), None)
 
+    def test_parsed_header(self):
+        blocks = {
+            "CF": "0",
+            "EF": "1",
+            "VERSION": "1.1",
+            "FILENAMES": "a.txt/b.txt/c.txt",
+            "EMBEDDED_SIZES": "8/16",
+            "HMAC": b"mac",
+            "index": 40,
+        }
+        header = PayloadHeader.from_blocks(blocks, "medium", 2)
+        self.assertEqual(header.filenames, ("a.txt", "b.txt"))
+        self.assertEqual(header.sizes.typecode, "Q")
+        self.assertEqual(header.offsets.tolist(), [0, 8, 24])
+        self.assertEqual(header.byte_range(1), (2, 6))
+        self.assertIsNone(header.digests)
+        self.assertFalse(hasattr(header, "__dict__"))
+
+        payload = ExtractedPayload.from_payload(blocks, header, bytearray(b"ABCDEF"))
+        self.assertTrue(payload.is_encrypted())
+        self.assertFalse(payload.is_compressed())
+        self.assertEqual(payload.get_embedded_sizes(), [8, 16])
+        self.assertEqual(payload.extracted_files, [("a.txt", b"AB"), ("b.txt", b"CDEF")])
+        self.assertIsInstance(payload.extracted_files[1][1], memoryview)
+
 
 class LSBSteganographyTestCase(TestCase):
     def setUp(self):
@@ -222,6 +370,95 @@ class LSBSteganographyTestCase(TestCase):
         with self.assertRaises(ValueError):
             self.stego.get_free_space(self.samples, self.secret_files, quality="invalid_quality")
 
+    def test_capacity_report_matches_free_space(self):
+        report = self.stego.get_capacity_report(self.samples, self.secret_files)
+        self.assertEqual(len(report), len(self.stego.qualities) * 6)
+        for entry in report:
+            free_space = self.stego.get_free_space(
+                self.samples,
+                self.secret_files,
+                quality=entry["quality"],
+                compressed=entry["compressed"],
+                passphrase="mypassword" if entry["encrypted"] else None,
+                solid=entry["solid"],
+            )
+            self.assertEqual(entry["free_space"], free_space)
+        self.assertEqual(self.stego.recommend_quality(report), "high")
+        self.assertEqual(self.stego.recommend_quality(report, solid=True), "high")
+        self.assertIsNone(self.stego.recommend_quality([]))
+
+    def test_capacity_report_recommends_solid(self):
+        configs = [b'{"host": "10.0.0.%02d", "port": 8080}\n' % i for i in range(20)]
+        files = [
+            File(name=f"config-{i}.json", size=len(data), data=data)
+            for i, data in enumerate(configs)
+        ]
+
+        def overhead(report, **combination):
+            # Without samples, the free space is minus the header and payload
+            for entry in report:
+                if entry["quality"] == "high" and all(entry[key] == value for key, value in combination.items()):
+                    return -entry["free_space"]
+
+        empty = self.stego.get_capacity_report([], files)
+        solid_bytes = overhead(empty, compressed=True, encrypted=False, solid=True)
+        self.assertLess(solid_bytes, overhead(empty, compressed=True, encrypted=False, solid=False))
+
+        # Just room at the highest quality for the solid stream
+        report = self.stego.get_capacity_report([0] * (solid_bytes * 8), files)
+        self.assertEqual(self.stego.recommend_quality(report, solid=True), "high")
+        self.assertEqual(self.stego.recommend_quality(report, compressed=True, solid=True), "high")
+        self.assertNotEqual(self.stego.recommend_quality(report, compressed=True), "high")
+
+    def test_free_space_is_exact(self):
+        free_space = self.stego.get_free_space(
+            self.samples, self.secret_files, quality="medium", passphrase="mypassword"
+        )
+        needed = len(self.samples) * 2 // 8 - free_space
+        samples = [10] * (needed * 4)
+        self.stego.embed(samples, self.secret_files, quality="medium", passphrase="mypassword")
+        payload = self.stego.extract_data(samples, passphrase="mypassword")
+        self.assertEqual(len(payload.extracted_files), 3)
+        with self.assertRaises(RunOutOfFreeSpaceError):
+            self.stego.embed(
+                samples[:-4], self.secret_files, quality="medium", passphrase="mypassword"
+            )
+
+    def test_solid_payload_round_trip(self):
+        configs = [b'{"host": "10.0.0.%02d", "port": 8080}\n' % i for i in range(20)]
+        files = [
+            File(name=f"config-{i}.json", size=len(data), data=data)
+            for i, data in enumerate(configs)
+        ]
+        samples = [10] * 20000
+        separate = self.stego.get_free_space(samples, files, quality="medium", compressed=True)
+        solid = self.stego.get_free_space(samples, files, quality="medium", compressed=True, solid=True)
+        self.assertGreater(solid, separate)
+
+        for passphrase in (None, "pw"):
+            self.stego.embed(samples, files, quality="medium", passphrase=passphrase, solid=True)
+            header = self.stego.get_header(samples, passphrase=passphrase)
+            self.assertTrue(header.solid and header.compressed)
+            self.assertEqual(header.sizes.tolist(), [file.size for file in files])
+
+            payload = self.stego.extract_data(samples, passphrase=passphrase)
+            self.assertTrue(payload.is_solid())
+            self.assertEqual(payload.extracted_files, [(file.name, file.raw_data) for file in files])
+            with zipfile.ZipFile(Zip().create_zip(payload, password=passphrase)) as archive:
+                self.assertEqual(archive.read("config-7.json"), files[7].raw_data)
+
+    def test_damaged_solid_stream(self):
+        with patch("utils.codec.CoDec.decompress_exactly", return_value=None):
+            samples = [10] * 4000
+            self.stego.embed(samples, self.secret_files, quality="medium", solid=True)
+            with self.assertRaises(DataCorruptedError):
+                self.stego.extract_data(samples)
+        codec = CoDec()
+        stream = codec.compress_chunks([b"abc", b"abc"])
+        self.assertEqual(codec.decompress_exactly(stream, 6), b"abcabc")
+        self.assertIsNone(codec.decompress_exactly(stream, 5))
+        self.assertIsNone(codec.decompress_exactly(stream, 7))
+
     def test_run_out_of_free_space(self):
         small_samples = [10] * 10  
         with self.assertRaises(RunOutOfFreeSpaceError):
@@ -238,6 +475,21 @@ class LSBSteganographyTestCase(TestCase):
         extracted_payload = self.stego.extract_data(self.samples)
         self.assertIsInstance(extracted_payload, ExtractedPayload)
 
+    def test_extracted_files_share_one_buffer(self):
+        samples = [10] * 4000
+        self.stego.embed(samples, self.secret_files, quality="medium", compressed=True, passphrase="pw")
+        header = self.stego.get_header(samples, passphrase="pw")
+        self.assertEqual(header.filenames, ("test.txt", "test2.pdf", "test3.png"))
+        self.assertTrue(header.compressed and header.encrypted)
+
+        payload = self.stego.extract_data(samples, passphrase="pw")
+        views = [data for _, data in payload.extracted_files]
+        self.assertTrue(all(view.obj is views[0].obj for view in views))
+        self.assertEqual(
+            [File.decompress_decrypt("pw", view) for view in views],
+            [file.raw_data for file in self.secret_files],
+        )
+
     def test_encryption_requires_password(self):
         samples_encrypted = [0b00000000] * 1000  
         with patch.object(LsbHeader, 'get_quality_from_embedded_data', return_value="medium"):
@@ -267,3 +519,319 @@ class LSBSteganographyTestCase(TestCase):
             start_index=0
         )
         self.assertGreater(result_index, 0)  
+
+
+class BatchCommandTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.covers_dir = os.path.join(self.tmpdir.name, "covers")
+        self.output_dir = os.path.join(self.tmpdir.name, "output")
+        os.makedirs(self.covers_dir)
+        for name in ("first.wav", "second.wav"):
+            with wave.open(os.path.join(self.covers_dir, name), "wb") as cover:
+                cover.setnchannels(2)
+                cover.setsampwidth(2)
+                cover.setframerate(44100)
+                cover.writeframes(bytes(range(256)) * 200)
+        self.secret_path = os.path.join(self.tmpdir.name, "secret.txt")
+        with open(self.secret_path, "wb") as secret:
+            secret.write(b"batch secret data")
+
+    def call(self, *args):
+        stdout = io.StringIO()
+        call_command(*args, stdout=stdout, stderr=io.StringIO())
+        return stdout.getvalue()
+
+    def test_embed_detect_extract_directory(self):
+        self.call(
+            "embed", self.covers_dir, "--secret", self.secret_path,
+            "--output-dir", self.output_dir, "--quality", "low", "--password", "pw",
+        )
+        detected = self.call("detect", self.output_dir, "--password", "pw")
+        self.assertEqual(detected.count("secret.txt"), 2)
+
+        zips_dir = os.path.join(self.tmpdir.name, "zips")
+        self.call("extract", self.output_dir, "--output-dir", zips_dir, "--password", "pw")
+        with zipfile.ZipFile(os.path.join(zips_dir, "first.zip")) as archive:
+            self.assertEqual(archive.read("secret.txt"), b"batch secret data")
+
+    def test_same_names_in_subdirectories_keep_apart(self):
+        nested = os.path.join(self.covers_dir, "nested")
+        os.makedirs(nested)
+        with open(os.path.join(self.covers_dir, "first.wav"), "rb") as cover:
+            data = cover.read()
+        with open(os.path.join(nested, "first.wav"), "wb") as cover:
+            cover.write(data)
+
+        self.call(
+            "embed", self.covers_dir, "--secret", self.secret_path,
+            "--output-dir", self.output_dir, "--quality", "low",
+        )
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, "first.wav")))
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, "nested", "first.wav")))
+
+        zips_dir = os.path.join(self.tmpdir.name, "zips")
+        self.call("extract", self.output_dir, "--output-dir", zips_dir)
+        self.assertTrue(os.path.exists(os.path.join(zips_dir, "nested", "first.zip")))
+
+        with self.assertRaises(CommandError):
+            self.call(
+                "extract", os.path.join(self.output_dir, "first.wav"),
+                os.path.join(self.output_dir, "nested", "first.wav"),
+                "--output-dir", zips_dir,
+            )
+
+    def test_detect_not_embedded(self):
+        output = self.call("detect", self.covers_dir)
+        self.assertEqual(output.count("not embedded"), 2)
+
+    def test_extract_not_embedded_fails(self):
+        with self.assertRaises(CommandError):
+            self.call("extract", self.covers_dir, "--output-dir", self.output_dir)
+
+
+class EngineTests(TestCase):
+    def setUp(self):
+        self.cover = array.array("h", [(i * 7919) % 65536 - 32768 for i in range(4000)])
+        self.data = bytes(range(256)) + b"engine parity"
+
+    def test_bytes_engine_matches_loop_engine(self):
+        for lsb in (1, 2, 4, 8):
+            loop_samples = array.array("h", self.cover)
+            bytes_samples = array.array("h", self.cover)
+            loop_end = LoopEngine().embed(loop_samples, self.data, lsb, start_index=5)
+            bytes_end = BytesEngine().embed(bytes_samples, self.data, lsb, start_index=5)
+            self.assertEqual(loop_end, bytes_end)
+            self.assertEqual(loop_samples, bytes_samples)
+
+            for count in (loop_end - 5, loop_end - 6):
+                self.assertEqual(
+                    LoopEngine().extract(loop_samples, lsb, 5, count),
+                    BytesEngine().extract(bytes_samples, lsb, 5, count),
+                )
+
+    def test_bytes_engine_falls_back_for_lists(self):
+        samples = [10] * 200
+        end = BytesEngine().embed(samples, b"list", 2, start_index=0)
+        self.assertEqual(BytesEngine().extract(samples, 2, 0, end), b"list")
+
+    def test_parallel_engine_matches_bytes_engine(self):
+        engine = ParallelEngine()
+        engine.min_part_size = 64
+        for lsb in (1, 2, 4, 8):
+            bytes_samples = array.array("h", self.cover)
+            parallel_samples = array.array("h", self.cover)
+            bytes_end = BytesEngine().embed(bytes_samples, self.data, lsb, start_index=3)
+            parallel_end = engine.embed(parallel_samples, self.data, lsb, start_index=3)
+            self.assertEqual(bytes_end, parallel_end)
+            self.assertEqual(bytes_samples, parallel_samples)
+            for count in (parallel_end - 3, parallel_end - 4):
+                self.assertEqual(
+                    engine.extract(parallel_samples, lsb, 3, count),
+                    BytesEngine().extract(bytes_samples, lsb, 3, count),
+                )
+
+    def test_embed_and_extract_with_each_engine(self):
+        for engine in ("loop", "bytes", "parallel", "auto"):
+            stego = LSBSteganography(engine=engine)
+            samples = array.array("h", self.cover)
+            secret_files = [File(name="a.txt", size=len(self.data), data=self.data)]
+            stego.embed(samples=samples, secret_files=secret_files, quality="low")
+            payload = stego.extract_data(samples)
+            self.assertEqual(payload.extracted_files, [("a.txt", self.data)])
+
+
+class DispatcherTests(TestCase):
+    def test_uncalibrated_dispatcher_uses_bytes_engine(self):
+        dispatcher = Dispatcher(["loop", "bytes"])
+        self.assertEqual(dispatcher.choose("embed", 10), "bytes")
+        self.assertFalse(dispatcher.diagnostics()["calibrated"])
+
+    def test_calibrate_derives_thresholds(self):
+        dispatcher = Dispatcher(["loop", "bytes"])
+        report = dispatcher.calibrate(sizes={"embed": (16, 1024), "extract": (16,)}, repeat=1)
+        self.assertTrue(report["calibrated"])
+        self.assertEqual(set(report["timings"]["embed"]), {"16", "1024"})
+        self.assertEqual(set(report["timings"]["extract"]), {"16"})
+        for operation in ("embed", "extract"):
+            self.assertIsNone(report["thresholds"][operation][-1]["max_payload_size"])
+            self.assertIn(dispatcher.choose(operation, 2**30), ("loop", "bytes"))
+
+    def test_calibration_sizes_follow_the_call_chunks(self):
+        self.assertEqual(max(CALIBRATION_SIZES["embed"]), CANCEL_CHUNK_SIZE)
+        self.assertEqual(max(CALIBRATION_SIZES["extract"]), DIGEST_CHUNK_SIZE)
+
+    def test_pool_starts_only_when_parallel_can_win(self):
+        dispatcher = Dispatcher(["bytes", "parallel"])
+        with patch.object(ParallelEngine, "pool") as pool:
+            # Below two parts the parallel engine is never timed
+            report = dispatcher.calibrate(
+                sizes={"embed": (16,), "extract": (ParallelEngine.min_part_size,)}, repeat=1
+            )
+        pool.assert_not_called()
+        self.assertEqual(report["timings"]["extract"][str(ParallelEngine.min_part_size)].keys(), {"bytes"})
+
+    def test_choose_follows_thresholds(self):
+        dispatcher = Dispatcher(["loop", "bytes"])
+        dispatcher.thresholds = {
+            "embed": [(100, "loop"), (float("inf"), "bytes")],
+            "extract": [(float("inf"), "bytes")],
+        }
+        self.assertEqual(dispatcher.choose("embed", 100), "loop")
+        self.assertEqual(dispatcher.choose("embed", 101), "bytes")
+        self.assertEqual(dispatcher.choose("extract", 100), "bytes")
+        self.assertEqual(dispatcher.decisions["embed"], {"loop": 1, "bytes": 1})
+        self.assertEqual(dispatcher.decisions["extract"], {"bytes": 1})
+
+    def test_dispatch_engine_round_trip(self):
+        dispatcher = Dispatcher(["loop", "bytes"])
+        dispatcher.thresholds = {
+            "embed": [(8, "loop"), (float("inf"), "bytes")],
+            "extract": [(8, "loop"), (float("inf"), "bytes")],
+        }
+        engine = DispatchEngine(dispatcher)
+        samples = array.array("h", [0] * 400)
+        end = engine.embed(samples, b"dispatched", 2)
+        self.assertEqual(engine.extract(samples, 2, 0, end), b"dispatched")
+        self.assertEqual(dispatcher.decisions["embed"], {"bytes": 1})
+        self.assertEqual(dispatcher.decisions["extract"], {"bytes": 1})
+
+    def test_diagnostics_endpoint(self):
+        response = self.client.get(reverse("dispatch-diagnostics"))
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(get_user_model().objects.create_user("ops", is_staff=True))
+        response = self.client.get(reverse("dispatch-diagnostics"))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()["data"]
+        self.assertEqual(data["engine"], "auto")
+        self.assertIn("thresholds", data)
+
+
+class PayloadDigestTests(TestCase):
+    def setUp(self):
+        self.stego = LSBSteganography()
+        self.data = os.urandom(3000)
+        self.secret_files = [File(name="a.bin", size=len(self.data), data=self.data)]
+
+    def test_digest_is_streaming(self):
+        whole = PayloadDigest(chunk_size=100)
+        whole.update(self.data)
+        parts = PayloadDigest(chunk_size=100)
+        for i in range(0, len(self.data), 7):
+            parts.update(self.data[i : i + 7])
+        self.assertEqual(whole.digest(), parts.digest())
+        self.assertEqual(len(whole.digest()), PayloadDigest.length(3000, chunk_size=100))
+        self.assertEqual(len(whole.digest()), 30 * DIGEST_SIZE)
+
+    def test_verifier_rejects_damaged_chunk(self):
+        digest = PayloadDigest(chunk_size=100)
+        digest.update(self.data)
+        verifier = PayloadVerifier(digest.digest())
+        verifier.verify(self.data[:100])
+        with self.assertRaises(DataCorruptedError):
+            verifier.verify(b"\x00" + self.data[101:200])
+
+    def test_corrupted_payload_aborts_extraction(self):
+        samples = array.array("h", [0] * 20000)
+        self.stego.embed(samples=samples, secret_files=self.secret_files, quality="low")
+        blocks = self.stego.get_header_blocks(samples)
+        self.assertIn("DIGESTS", blocks)
+        samples[blocks["index"] + 100] ^= 0b1111
+
+        with patch.object(File, "decompress") as mock_decompress:
+            with self.assertRaises(DataCorruptedError):
+                self.stego.extract_data(samples)
+            mock_decompress.assert_not_called()
+
+    def test_extract_legacy_header_without_digests(self):
+        legacy = LSBSteganography()
+        legacy.header = LsbHeader(
+            "CipherNest", "1.0", legacy.qualities, "BLK", legacy.secret_key
+        )
+        samples = array.array("h", [0] * 20000)
+        legacy.embed(samples=samples, secret_files=self.secret_files, quality="low")
+
+        payload = self.stego.extract_data(samples)
+        self.assertNotIn("DIGESTS", payload.metadata)
+        self.assertEqual(payload.extracted_files, [("a.bin", self.data)])
+
+
+class RegistryTests(TestCase):
+    def test_shared_instances(self):
+        self.assertIs(registry.get_steganography(), registry.get_steganography())
+        self.assertIs(registry.get_zip(), registry.get_zip())
+
+    def test_warm_up_round_trip(self):
+        self.assertGreaterEqual(registry.warm_up(), 0)
+
+    def test_magic_pattern_detection(self):
+        header = registry.get_steganography().header
+        for quality, lsb in header.qualities.items():
+            samples = array.array("h", [0] * 200)
+            LoopEngine().embed(samples, header.MAGIC_STRING, lsb)
+            self.assertEqual(header.get_quality_from_embedded_data(samples), quality)
+
+
+class LoadTestCommandTests(TemporaryArtifactsMixin, LiveServerTestCase):
+    def test_replays_mix_against_running_server(self):
+        stdout = io.StringIO()
+        call_command(
+            "loadtest",
+            "--url", self.live_server_url,
+            "--requests", "6",
+            "--concurrency", "2",
+            "--seconds", "0.5",
+            "--payload-sizes", "256",
+            "--mix", "covers,embed,extract",
+            stdout=stdout,
+        )
+        output = stdout.getvalue()
+        self.assertIn("6 requests", output)
+        self.assertIn("0 errors", output)
+
+
+STANDALONE_SCRIPT = """
+import array, sys
+from lsb import config
+config.configure(SECRET_KEY="standalone", LSB_ENGINE="loop")
+from lsb.file import File
+from lsb.lsb import LSBSteganography
+stego = LSBSteganography()
+samples = array.array("h", bytes(20000))
+secret = [File(name="a.txt", size=5, data=b"hello")]
+stego.embed(samples=samples, secret_files=secret, quality="medium")
+assert stego.engine.name == "loop"
+assert "cryptography" not in sys.modules
+assert stego.extract_data(samples).extracted_files == [("a.txt", b"hello")]
+stego.embed(samples=samples, secret_files=secret, quality="medium", passphrase="pw")
+assert "cryptography" in sys.modules
+assert stego.extract_data(samples, "pw").extracted_files[0][0] == "a.txt"
+assert "django" not in sys.modules
+"""
+
+
+class StandaloneImportTests(TestCase):
+    def test_core_runs_without_django(self):
+        env = {key: value for key, value in os.environ.items() if key != "DJANGO_SETTINGS_MODULE"}
+        subprocess.run(
+            [sys.executable, "-c", STANDALONE_SCRIPT], cwd=BASE_DIR, env=env, check=True
+        )
+
+    def test_configure_rejects_unknown_settings(self):
+        with self.assertRaises(ValueError):
+            config.configure(SECRET=1)
+
+    def test_configured_values_win(self):
+        self.addCleanup(config.reset)
+        config.configure(LSB_ENGINE="loop")
+        self.assertEqual(LSBSteganography().engine.name, "loop")
+        config.reset()
+        self.assertEqual(LSBSteganography().engine.name, "auto")
+
+    def test_import_budget(self):
+        # Wall-clock timings are too noisy to assert on; the importtime command reports them
+        for module in BUDGETS:
+            report = measure(module)
+            self.assertEqual(report.deferred_loaded, [], module)
@@ -1,3 +1,23 @@
-from django.shortcuts import render
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
 
-# Create your views here.
+from utils.constants import Code
+from utils.response import standard_response
+from .registry import get_dispatcher, get_steganography
+
+
+class DispatchDiagnosticsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        data = get_dispatcher().diagnostics()
+        data["engine"] = get_steganography().engine.name
+        return standard_response(
+            code=Code.SUCCESS.value,
+            message=(
+                "Engine thresholds from the boot calibration"
+                if data["calibrated"]
+                else "Not calibrated, the bytes engine handles every request"
+            ),
+            data=data,
+        )
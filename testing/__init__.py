@@ -0,0 +1,3 @@
+"""
+Helpers shared by the test suites of the apps; not part of the service.
+"""
@@ -0,0 +1,16 @@
+import tempfile
+
+from django.test import override_settings
+
+
+class TemporaryArtifactsMixin:
+    """Keeps the artifacts stored by a test class in a temporary ARTIFACT_DIR."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.artifact_dir = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(cls.artifact_dir.cleanup)
+        artifact_settings = override_settings(ARTIFACT_DIR=cls.artifact_dir.name)
+        artifact_settings.enable()
+        cls.addClassCleanup(artifact_settings.disable)
+        super().setUpClass()
@@ -0,0 +1,12 @@
+import io
+import wave
+
+
+def make_wav(frames: bytes, sample_width: int = 2, channels: int = 2) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as cover:
+        cover.setnchannels(channels)
+        cover.setsampwidth(sample_width)
+        cover.setframerate(44100)
+        cover.writeframes(frames)
+    return buffer.getvalue()
@@ -0,0 +1,129 @@
+"""
+Upload handler for audio file fields.
+
+Django's default handlers buffer the whole multipart body before the
+serializer gets to look at the file name. This one takes over the cover
+and stego file fields: it rejects an unsupported extension as soon as the
+part starts, checks the container signature against the extension on the
+first chunk, and parses the WAV/AIFF/FLAC header while the rest of the
+body is still arriving. The request or file going past UPLOAD_MAX_SIZE
+stops the upload there.
+
+Content that is not recognisable is left to the decoder backends, which
+read more formats than the native parsers.
+"""
+
+import io
+
+from django.conf import settings
+from django.core.files.uploadedfile import InMemoryUploadedFile, TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+
+from utils.constants import EXTENSIONS_OF_SUPPORTED_FILE_FORMATS
+from utils.exceptions import UnsupportedAudioFormatError, UploadTooLargeError
+from .models import probe_header
+
+AUDIO_FIELDS = ("cover_file", "embedded_file")
+SIGNATURE_SIZE = 12
+# Headers beyond this are left to the audio layer to find
+PROBE_PREFIX_SIZE = 64 * 1024
+
+
+def sniff_format(prefix: bytes) -> str:
+    """The container the leading bytes belong to, or None if unrecognised."""
+    if prefix[0:4] == b"RIFF" and prefix[8:12] == b"WAVE":
+        return "wav"
+    if prefix[0:4] == b"FORM" and prefix[8:12] in (b"AIFF", b"AIFC"):
+        return "aiff"
+    if prefix[0:4] == b"fLaC":
+        return "flac"
+    if prefix[0:4] == b"OggS":
+        return "ogg"
+    if prefix[4:8] == b"ftyp":
+        return "mp4"
+    if prefix[0:4] == b"PK\x03\x04":
+        return "zip"
+    if prefix[0:3] == b"\xff\xd8\xff":
+        return "jpeg"
+    if prefix[0:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if prefix[0:5] == b"%PDF-":
+        return "pdf"
+    if len(prefix) >= 2 and prefix[0] == 0xFF and prefix[1] & 0xE0 == 0xE0:
+        # MPEG audio frame sync; ID3 tags are left alone, FLAC can carry them too
+        return "mp3"
+    return None
+
+
+class AudioUploadHandler(FileUploadHandler):
+    def __init__(self, request=None) -> None:
+        super().__init__(request)
+        self.active = False
+        self.in_memory = False
+
+    def handle_raw_input(
+        self, input_data, META, content_length, boundary, encoding=None
+    ):
+        if content_length > settings.UPLOAD_MAX_SIZE:
+            raise UploadTooLargeError()
+        self.in_memory = content_length <= settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        super().new_file(field_name, file_name, *args, **kwargs)
+        self.active = field_name in AUDIO_FIELDS
+        if not self.active:
+            return
+        self.format = file_name.split(".")[-1].lower() if "." in file_name else ""
+        if self.format not in EXTENSIONS_OF_SUPPORTED_FILE_FORMATS:
+            raise UnsupportedAudioFormatError()
+        if self.in_memory:
+            self.file = InMemoryUploadedFile(
+                io.BytesIO(), field_name, file_name, self.content_type, 0, self.charset,
+                self.content_type_extra,
+            )
+        else:
+            self.file = TemporaryUploadedFile(
+                file_name, self.content_type, 0, self.charset, self.content_type_extra
+            )
+        self.prefix = bytearray()
+        self.checked = False
+        self.header_found = False
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        if start + len(raw_data) > settings.UPLOAD_MAX_SIZE:
+            raise UploadTooLargeError()
+        if not self.header_found and len(self.prefix) < PROBE_PREFIX_SIZE:
+            self.prefix += raw_data[: PROBE_PREFIX_SIZE - len(self.prefix)]
+            self.inspect()
+        self.file.write(raw_data)
+        return None
+
+    def inspect(self) -> None:
+        if not self.checked and len(self.prefix) >= SIGNATURE_SIZE:
+            self.checked = True
+            sniffed = sniff_format(self.prefix)
+            if sniffed is not None and sniffed != self.format:
+                raise UnsupportedAudioFormatError(
+                    f"The file is named .{self.format} but contains {sniffed} data."
+                )
+        if self.checked:
+            # The sample count needs the final size; for now the header is enough
+            self.header_found = (
+                probe_header(bytes(self.prefix), self.format, len(self.prefix)) is not None
+            )
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        self.file.seek(0)
+        self.file.size = file_size
+        # Stream parameters parsed on the way in, None if the header was not found
+        self.file.probe = (
+            probe_header(bytes(self.prefix), self.format, file_size)
+            if self.header_found
+            else None
+        )
+        return self.file
@@ -0,0 +1,258 @@
+import fcntl
+import io
+import json
+import os
+import re
+import time
+import uuid
+
+from django.conf import settings
+
+from utils.exceptions import UploadConflictError, UploadNotFoundError
+from utils.flac import FlacStream
+from utils.pcm import PCM_FORMATS, parse_pcm
+
+UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+COPY_BLOCK_SIZE = 64 * 1024
+WAIT_INTERVAL = 0.05
+
+
+def probe_header(prefix: bytes, format: str, size: int) -> dict:
+    """Stream parameters from the leading bytes of a cover, or None if not there yet."""
+    try:
+        if format in PCM_FORMATS:
+            pcm = parse_pcm(prefix, format, size)
+            return {
+                "channels": pcm.channels,
+                "frame_rate": pcm.frame_rate,
+                "sample_width": pcm.sample_width,
+                "total_samples": pcm.total_samples,
+            }
+        if format == "flac":
+            streaminfo = FlacStream(prefix).streaminfo
+            return {
+                "channels": streaminfo.channels,
+                "frame_rate": streaminfo.sample_rate,
+                "sample_width": (streaminfo.bits_per_sample + 7) // 8,
+                "total_samples": streaminfo.total_samples * streaminfo.channels,
+            }
+    except (ValueError, IndexError):
+        pass
+    return None
+
+
+class Upload:
+    """
+    A resumable upload spooled to ``UPLOAD_DIR``.
+
+    ``<id>.part`` holds the bytes received so far and ``<id>.json`` the
+    state, so any worker sharing the directory can append to, finalize or
+    read an upload.
+    """
+
+    def __init__(
+        self,
+        upload_id: str,
+        filename: str,
+        size: int,
+        offset: int = 0,
+        finalized: bool = False,
+        probe: dict = None,
+        created_at: float = None,
+    ) -> None:
+        self.upload_id = upload_id
+        self.filename = filename
+        self.size = size
+        self.offset = offset
+        self.finalized = finalized
+        self.probe = probe
+        self.created_at = created_at or time.time()
+
+    @staticmethod
+    def directory() -> str:
+        os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+        return str(settings.UPLOAD_DIR)
+
+    @property
+    def data_path(self) -> str:
+        return os.path.join(self.directory(), f"{self.upload_id}.part")
+
+    @property
+    def state_path(self) -> str:
+        return os.path.join(self.directory(), f"{self.upload_id}.json")
+
+    @property
+    def extension(self) -> str:
+        return os.path.splitext(self.filename)[1][1:].lower()
+
+    def to_dict(self) -> dict:
+        return {
+            "upload_id": self.upload_id,
+            "filename": self.filename,
+            "size": self.size,
+            "offset": self.offset,
+            "finalized": self.finalized,
+            "probe": self.probe,
+        }
+
+    def save(self) -> None:
+        temporary = f"{self.state_path}.{os.getpid()}"
+        with open(temporary, "w") as file:
+            json.dump({**self.to_dict(), "created_at": self.created_at}, file)
+        os.replace(temporary, self.state_path)
+
+    @classmethod
+    def create(cls, filename: str, size: int) -> "Upload":
+        cls.purge_expired()
+        upload = cls(uuid.uuid4().hex, filename, size)
+        open(upload.data_path, "wb").close()
+        upload.save()
+        return upload
+
+    @classmethod
+    def get(cls, upload_id: str) -> "Upload":
+        if not UPLOAD_ID.match(upload_id or ""):
+            raise UploadNotFoundError()
+        try:
+            with open(os.path.join(cls.directory(), f"{upload_id}.json")) as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            raise UploadNotFoundError()
+        state.pop("upload_id")
+        return cls(upload_id, **state)
+
+    @classmethod
+    def purge_expired(cls) -> None:
+        deadline = time.time() - settings.UPLOAD_TTL
+        for name in os.listdir(cls.directory()):
+            path = os.path.join(cls.directory(), name)
+            try:
+                if os.path.getmtime(path) < deadline:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def append(self, offset: int, stream) -> int:
+        """Write ``stream`` at ``offset``, which must be the end of the data so far."""
+        with open(self.data_path, "r+b") as file:
+            # Serialize appends to the same upload across threads and workers
+            fcntl.flock(file, fcntl.LOCK_EX)
+            current = Upload.get(self.upload_id)
+            if current.finalized:
+                raise UploadConflictError("The upload is already finalized.")
+            if offset != current.offset:
+                raise UploadConflictError(
+                    f"Expected offset {current.offset}, got {offset}."
+                )
+            file.seek(offset)
+            written = 0
+            while block := stream.read(COPY_BLOCK_SIZE):
+                if offset + written + len(block) > current.size:
+                    file.truncate(offset)
+                    raise UploadConflictError("The chunk goes past the declared size.")
+                file.write(block)
+                written += len(block)
+            file.flush()
+
+            self.offset = offset + written
+            self.finalized = False
+            self.probe = current.probe
+            if self.probe is None:
+                file.seek(0)
+                self.probe = probe_header(
+                    file.read(min(self.offset, COPY_BLOCK_SIZE)), self.extension, self.size
+                )
+            self.save()
+        return self.offset
+
+    def finalize(self) -> None:
+        if self.offset != self.size:
+            raise UploadConflictError(
+                f"Received {self.offset} of {self.size} bytes."
+            )
+        self.finalized = True
+        self.save()
+
+    def delete(self) -> None:
+        for path in (self.data_path, self.state_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def open(self) -> "UploadReader":
+        return UploadReader(self)
+
+
+class UploadReader(io.RawIOBase):
+    """
+    Read-only file over an upload that may still be receiving chunks.
+
+    Reads past the bytes received so far wait for more chunks, so decoding
+    can start on the leading chunks. Only bytes up to the offset committed in
+    the upload state are read, never a chunk that is still being written,
+    and all waits of a reader together may take ``UPLOAD_WAIT_TIMEOUT``.
+    ``name`` and ``size`` make it usable wherever the views expect an
+    uploaded file.
+    """
+
+    def __init__(self, upload: Upload) -> None:
+        super().__init__()
+        self.upload = upload
+        self.name = upload.filename
+        self.size = upload.size
+        self.position = 0
+        self.committed = upload.offset
+        self.wait_left = settings.UPLOAD_WAIT_TIMEOUT
+        self.file = open(upload.data_path, "rb")
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(0, offset)
+        return self.position
+
+    def wait_for(self, end: int) -> None:
+        started_at = time.monotonic()
+        try:
+            while self.committed < end:
+                self.committed = Upload.get(self.upload.upload_id).offset
+                if self.committed >= end:
+                    break
+                if time.monotonic() - started_at > self.wait_left:
+                    raise UploadConflictError("The upload stopped receiving chunks.")
+                time.sleep(WAIT_INTERVAL)
+        finally:
+            self.wait_left -= time.monotonic() - started_at
+
+    def readinto(self, buffer) -> int:
+        end = min(self.position + len(buffer), self.size)
+        if end <= self.position:
+            return 0
+        self.wait_for(end)
+        self.file.seek(self.position)
+        read = self.file.readinto(memoryview(buffer)[: end - self.position])
+        self.position += read
+        return read
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.size - self.position
+        buffer = bytearray(max(0, min(size, self.size - self.position)))
+        read = self.readinto(buffer)
+        return bytes(buffer[:read])
+
+    def close(self) -> None:
+        self.file.close()
+        super().close()
@@ -0,0 +1,24 @@
+from django.conf import settings
+from rest_framework import serializers
+
+from utils.constants import EXTENSIONS_OF_SUPPORTED_FILE_FORMATS
+
+
+class UploadCreateSerializer(serializers.Serializer):
+    filename = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1)
+
+    def validate_filename(self, value):
+        extension = value.split(".")[-1].lower()
+        if extension not in EXTENSIONS_OF_SUPPORTED_FILE_FORMATS:
+            raise serializers.ValidationError(
+                "Unsupported file extension for cover file. Allowed types are: wav, mp3, flac, aiff."
+            )
+        return value
+
+    def validate_size(self, value):
+        if value > settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"Uploads are limited to {settings.UPLOAD_MAX_SIZE} bytes."
+            )
+        return value
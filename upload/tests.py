@@ -0,0 +1,199 @@
+import io
+import tempfile
+import threading
+import time
+import zipfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http.multipartparser import MultiPartParser
+from django.test import override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from testing.artifacts import TemporaryArtifactsMixin
+from testing.audio import make_wav
+from utils.constants import Code
+from utils.exceptions import UnsupportedAudioFormatError, UploadConflictError, UploadTooLargeError
+from .handlers import AudioUploadHandler
+from .models import Upload
+
+
+class UploadTests(TemporaryArtifactsMixin, APITestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        settings = override_settings(UPLOAD_DIR=self.tmpdir.name, UPLOAD_WAIT_TIMEOUT=5)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.cover = make_wav(bytes(range(256)) * 400)
+
+    def create(self, filename="cover.wav", data=None):
+        data = self.cover if data is None else data
+        response = self.client.post(
+            reverse("upload-create"), {"filename": filename, "size": len(data)}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.json()["data"]["upload_id"]
+
+    def append(self, upload_id, offset, chunk):
+        return self.client.patch(
+            reverse("upload-detail", args=[upload_id]),
+            chunk,
+            content_type="application/octet-stream",
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def upload(self, data=None, filename="cover.wav"):
+        data = self.cover if data is None else data
+        upload_id = self.create(filename, data)
+        for offset in range(0, len(data), 30000):
+            response = self.append(upload_id, offset, data[offset : offset + 30000])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(reverse("upload-finalize", args=[upload_id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return upload_id
+
+    def test_resume_and_probe(self):
+        upload_id = self.create()
+        response = self.append(upload_id, 0, self.cover[:1000])
+        self.assertEqual(response["Upload-Offset"], "1000")
+
+        response = self.client.get(reverse("upload-detail", args=[upload_id]))
+        data = response.json()["data"]
+        self.assertEqual(data["offset"], 1000)
+        self.assertFalse(data["finalized"])
+        self.assertEqual(data["probe"]["total_samples"], len(self.cover[44:]) // 2)
+
+        response = self.append(upload_id, 0, self.cover[:1000])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.json()["code"], Code.UPLOAD_CONFLICT.value)
+
+        response = self.client.post(reverse("upload-finalize", args=[upload_id]))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        self.append(upload_id, 1000, self.cover[1000:])
+        response = self.client.post(reverse("upload-finalize", args=[upload_id]))
+        self.assertTrue(response.json()["data"]["finalized"])
+
+    def test_unknown_upload(self):
+        response = self.client.get(reverse("upload-detail", args=["..etc"]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.json()["code"], Code.UPLOAD_NOT_FOUND.value)
+
+    def test_chunk_past_declared_size(self):
+        upload_id = self.create()
+        response = self.append(upload_id, 0, self.cover + b"extra")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_embed_and_extract_by_upload_id(self):
+        secret_file = io.BytesIO(b"resumable secret")
+        secret_file.name = "secret.txt"
+        response = self.client.post(
+            reverse("embed"),
+            {
+                "upload_id": self.upload(),
+                "output_quality": "low",
+                "secret_files": [secret_file],
+            },
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        stego = b"".join(response.streaming_content)
+
+        response = self.client.post(
+            reverse("embedded-upload"),
+            {"upload_id": self.upload(stego, "stego.wav")},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as archive:
+            self.assertEqual(archive.read("secret.txt"), b"resumable secret")
+
+    def test_reader_waits_for_missing_chunks(self):
+        upload_id = self.create()
+        upload = Upload.get(upload_id)
+        upload.append(0, io.BytesIO(self.cover[:100]))
+        reader = upload.open()
+        self.assertEqual(reader.read(50), self.cover[:50])
+
+        def finish():
+            time.sleep(0.2)
+            Upload.get(upload_id).append(100, io.BytesIO(self.cover[100:]))
+
+        thread = threading.Thread(target=finish)
+        thread.start()
+        self.assertEqual(reader.read(), self.cover[50:])
+        thread.join()
+        reader.close()
+
+    @override_settings(UPLOAD_WAIT_TIMEOUT=0.2)
+    def test_reader_stops_at_committed_offset(self):
+        upload = Upload.get(self.create())
+        upload.append(0, io.BytesIO(self.cover[:100]))
+        # A chunk still being written is in the file but not in the state
+        with open(upload.data_path, "ab") as file:
+            file.write(self.cover[100:200])
+        reader = upload.open()
+        self.addCleanup(reader.close)
+        self.assertEqual(reader.read(100), self.cover[:100])
+        with self.assertRaises(UploadConflictError):
+            reader.read(50)
+        self.assertLessEqual(reader.wait_left, 0)
+
+
+class AudioUploadHandlerTests(APITestCase):
+    def parse(self, filename, data, field="cover_file"):
+        body = encode_multipart(BOUNDARY, {field: SimpleUploadedFile(filename, data)})
+        stream = io.BytesIO(body)
+        meta = {
+            "CONTENT_TYPE": MULTIPART_CONTENT,
+            "CONTENT_LENGTH": str(len(body)),
+        }
+        try:
+            return MultiPartParser(meta, stream, [AudioUploadHandler()]).parse()[1]
+        finally:
+            self.received, self.total = stream.tell(), len(body)
+
+    def test_probes_header_while_receiving(self):
+        cover = make_wav(bytes(range(256)) * 2000)
+        files = self.parse("cover.wav", cover)
+        self.assertEqual(files["cover_file"].read(), cover)
+        self.assertEqual(files["cover_file"].probe["total_samples"], len(cover[44:]) // 2)
+        self.assertEqual(files["cover_file"].probe["channels"], 2)
+
+    def test_unrecognised_content_is_left_to_decoders(self):
+        files = self.parse("cover.wav", b"dummy audio file content")
+        self.assertIsNone(files["cover_file"].probe)
+
+    def test_rejects_mismatched_content_before_body_is_received(self):
+        flac = b"fLaC" + bytes(5 * 1024 * 1024)
+        with self.assertRaises(UnsupportedAudioFormatError):
+            self.parse("cover.wav", flac)
+        self.assertLess(self.received, self.total // 2)
+
+    def test_rejects_unsupported_extension(self):
+        with self.assertRaises(UnsupportedAudioFormatError):
+            self.parse("cover.mp3", bytes(1000), field="embedded_file")
+        response = self.client.post(
+            reverse("cover-upload"),
+            {"cover_file": SimpleUploadedFile("cover.ogg", b"OggS" + bytes(100)),
+             "output_quality": "low"},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        self.assertEqual(response.json()["code"], Code.UNSUPPORTED_AUDIO_FORMAT.value)
+
+    @override_settings(UPLOAD_MAX_SIZE=4096)
+    def test_rejects_oversized_upload(self):
+        with self.assertRaises(UploadTooLargeError):
+            self.parse("cover.wav", make_wav(bytes(8192)))
+        self.assertEqual(self.received, 0)
+        response = self.client.post(
+            reverse("embedded-upload"),
+            {"embedded_file": SimpleUploadedFile("stego.wav", make_wav(bytes(8192)))},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(response.json()["code"], Code.UPLOAD_TOO_LARGE.value)
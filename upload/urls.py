@@ -0,0 +1,13 @@
+from django.urls import path
+
+from .views import UploadCreateView, UploadDetailView, UploadFinalizeView
+
+urlpatterns = [
+    path("uploads/", UploadCreateView.as_view(), name="upload-create"),
+    path("uploads/<str:upload_id>/", UploadDetailView.as_view(), name="upload-detail"),
+    path(
+        "uploads/<str:upload_id>/finalize/",
+        UploadFinalizeView.as_view(),
+        name="upload-finalize",
+    ),
+]
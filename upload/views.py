@@ -0,0 +1,76 @@
+from rest_framework import status
+from rest_framework.views import APIView
+
+from utils.constants import Code
+from utils.exceptions import UploadConflictError
+from utils.response import standard_response
+from .models import Upload
+from .serializers import UploadCreateSerializer
+
+OFFSET_HEADER = "Upload-Offset"
+
+
+class UploadCreateView(APIView):
+    def post(self, request):
+        serializer = UploadCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = Upload.create(
+            filename=serializer.validated_data["filename"],
+            size=serializer.validated_data["size"],
+        )
+        return standard_response(
+            code=Code.SUCCESS.value,
+            message="Upload created",
+            data=upload.to_dict(),
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class UploadDetailView(APIView):
+    def get(self, request, upload_id):
+        upload = Upload.get(upload_id)
+        return standard_response(
+            code=Code.SUCCESS.value,
+            message=f"Received {upload.offset} of {upload.size} bytes",
+            data=upload.to_dict(),
+        )
+
+    def patch(self, request, upload_id):
+        upload = Upload.get(upload_id)
+        try:
+            offset = int(request.headers[OFFSET_HEADER])
+        except (KeyError, ValueError):
+            raise UploadConflictError(f"The {OFFSET_HEADER} header is required.")
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+        if offset + length > upload.size:
+            raise UploadConflictError("The chunk goes past the declared size.")
+
+        # Read the raw body: request.data would buffer the chunk in memory
+        upload.append(offset, request.stream or _Empty())
+        response = standard_response(
+            code=Code.SUCCESS.value,
+            message=f"Received {upload.offset} of {upload.size} bytes",
+            data=upload.to_dict(),
+        )
+        response[OFFSET_HEADER] = str(upload.offset)
+        return response
+
+    def delete(self, request, upload_id):
+        Upload.get(upload_id).delete()
+        return standard_response(code=Code.SUCCESS.value, message="Upload deleted")
+
+
+class UploadFinalizeView(APIView):
+    def post(self, request, upload_id):
+        upload = Upload.get(upload_id)
+        upload.finalize()
+        return standard_response(
+            code=Code.SUCCESS.value,
+            message="Upload complete",
+            data=upload.to_dict(),
+        )
+
+
+class _Empty:
+    def read(self, size=-1):
+        return b""
@@ -0,0 +1,239 @@
+import io
+from abc import ABC, abstractmethod
+
+from lsb.cancel import checkpoint
+from lsb.config import get_setting
+from lsb.samples import PcmSamples, SampleBuffer
+from utils import ffmpeg
+from utils.flac import FlacSamples, FlacStream
+from utils.pcm import PCM_FORMATS, parse_pcm
+from utils.pipeline import Pipeline
+
+EXPORT_CHUNK_SIZE = 256 * 1024
+
+
+class Cover(ABC):
+    """Cover audio whose samples can be edited in place and exported again."""
+
+    def __init__(self, samples: SampleBuffer, format: str) -> None:
+        self.samples = samples
+        self.format = format
+
+    @abstractmethod
+    def export(self) -> io.BytesIO:
+        """The cover file with the edited samples."""
+
+    def content_length(self) -> int:
+        return None
+
+    def chunks(self, chunk_size: int = EXPORT_CHUNK_SIZE):
+        """The exported file as an iterator of byte strings."""
+        buffer = self.export()
+        return iter(lambda: buffer.read(chunk_size), b"")
+
+
+class PcmCover(Cover):
+    """
+    Uncompressed WAV/AIFF cover edited directly inside the file bytes.
+
+    No decoding or re-encoding happens: exporting returns the original file
+    with the modified sample bytes.
+    """
+
+    def __init__(self, file_bytes: bytes, format: str) -> None:
+        self.data = bytearray(file_bytes)
+        pcm = parse_pcm(self.data, format)
+        samples = SampleBuffer(
+            memoryview(self.data)[pcm.data_offset : pcm.data_end],
+            sample_width=pcm.sample_width,
+            byteorder=pcm.byteorder,
+        )
+        super().__init__(samples, format)
+
+    def export(self) -> io.BytesIO:
+        return io.BytesIO(self.data)
+
+
+class FlacCover(Cover):
+    """
+    FLAC cover decoded frame by frame on demand.
+
+    Exporting re-encodes only the frames holding modified samples and copies
+    the rest of the file unchanged, so the cost follows the payload size
+    rather than the track length.
+    """
+
+    def __init__(self, file_bytes: bytes, format: str = "flac") -> None:
+        super().__init__(FlacSamples(FlacStream(file_bytes)), format)
+
+    def export(self) -> io.BytesIO:
+        return io.BytesIO(self.samples.encode())
+
+
+class PydubCover(Cover):
+    """Cover decoded through pydub/ffmpeg, for formats without a native parser."""
+
+    def __init__(self, file_bytes: bytes, format: str) -> None:
+        from pydub import AudioSegment
+
+        self.audio = AudioSegment.from_file(io.BytesIO(file_bytes), format=format)
+        samples = SampleBuffer(
+            bytearray(self.audio.raw_data), sample_width=self.audio.sample_width
+        )
+        super().__init__(samples, format)
+
+    def export(self) -> io.BytesIO:
+        # pydub runs ffmpeg through temporary files in one blocking call
+        checkpoint()
+        buffer = io.BytesIO()
+        self.audio._spawn(self.samples.tobytes()).export(buffer, format=self.format)
+        buffer.seek(0)
+        return buffer
+
+
+class FfmpegCover(Cover):
+    """
+    Cover decoded and re-encoded by ffmpeg over stdin/stdout pipes.
+
+    The raw PCM ffmpeg writes is the sample buffer the engines edit, and
+    the same buffer is piped back to the encoder on export. ``chunks``
+    sends the encoded file as ffmpeg writes it, except for WAV/AIFF whose
+    header sizes are filled in at the end.
+    """
+
+    def __init__(self, file_bytes: bytes, format: str) -> None:
+        self.info = ffmpeg.probe(file_bytes, format)
+        self.pcm = ffmpeg.decode(file_bytes, format, self.info)
+        super().__init__(SampleBuffer(self.pcm, self.info.sample_width), format)
+
+    def export(self) -> io.BytesIO:
+        return io.BytesIO(ffmpeg.encode(self.pcm, self.format, self.info))
+
+    def chunks(self, chunk_size: int = EXPORT_CHUNK_SIZE):
+        if self.format in PCM_FORMATS:
+            return super().chunks(chunk_size)
+        return Pipeline(ffmpeg.encode_chunks(self.pcm, self.format, self.info, chunk_size))
+
+
+def ffmpeg_enabled() -> bool:
+    return get_setting("AUDIO_BACKEND") == "ffmpeg" and ffmpeg.available()
+
+
+def decode_cover(file_bytes: bytes, format: str) -> Cover:
+    """Cover for formats without a native parser, through the configured backend."""
+    if ffmpeg_enabled():
+        try:
+            return FfmpegCover(file_bytes, format)
+        except ffmpeg.FfmpegError:
+            pass
+    return PydubCover(file_bytes, format)
+
+
+def open_cover(file_bytes: bytes, format: str) -> Cover:
+    if format in PCM_FORMATS:
+        try:
+            return PcmCover(file_bytes, format)
+        except ValueError:
+            pass
+    if format == "flac":
+        try:
+            if flac_is_short(FlacStream(file_bytes)) or not ffmpeg_enabled():
+                return FlacCover(file_bytes, format)
+            return FfmpegCover(file_bytes, format)
+        except (ValueError, ffmpeg.FfmpegError):
+            pass
+    return decode_cover(file_bytes, format)
+
+
+def flac_is_short(stream: FlacStream) -> bool:
+    """Whether the native decoder is fast enough to decode all of ``stream``."""
+    total_samples = stream.streaminfo.total_samples * stream.streaminfo.channels
+    return 0 < total_samples <= get_setting("FLAC_NATIVE_MAX_SAMPLES")
+
+
+PCM_HEADER_PREFIX = 64 * 1024
+
+
+def read_pcm_samples(file, format: str) -> PcmSamples:
+    file.seek(0, io.SEEK_END)
+    total_length = file.tell()
+    file.seek(0)
+    pcm = parse_pcm(file.read(PCM_HEADER_PREFIX), format, total_length)
+    return PcmSamples(
+        file,
+        data_offset=pcm.data_offset,
+        data_length=pcm.data_length,
+        sample_width=pcm.sample_width,
+        byteorder=pcm.byteorder,
+    )
+
+
+class PcmFileCover(Cover):
+    """
+    WAV/AIFF cover read lazily from a file object and streamed back out.
+
+    Only the sample prefix that embedding touches is read into memory, in a
+    buffer that PcmSamples grows with it; ``chunks`` sends the container
+    header and that prefix, then copies the rest of the file from a reader
+    thread while earlier chunks go out.
+    """
+
+    def __init__(self, file, format: str) -> None:
+        super().__init__(read_pcm_samples(file, format), format)
+        self.file = file
+        self.file.seek(0, io.SEEK_END)
+        self.size = self.file.tell()
+
+    def content_length(self) -> int:
+        return self.size
+
+    def _blocks(self, chunk_size: int):
+        samples = self.samples
+        self.file.seek(0)
+        yield self.file.read(samples.data_offset)
+        yield bytes(samples.raw[: samples.filled])
+        self.file.seek(samples.data_offset + samples.filled)
+        while block := self.file.read(chunk_size):
+            yield block
+
+    def chunks(self, chunk_size: int = EXPORT_CHUNK_SIZE):
+        return Pipeline(self._blocks(chunk_size))
+
+    def export(self) -> io.BytesIO:
+        return io.BytesIO(b"".join(self.chunks()))
+
+
+def open_cover_file(file, format: str) -> Cover:
+    """Like ``open_cover``, but WAV/AIFF covers are read from ``file`` on demand."""
+    if format in PCM_FORMATS:
+        try:
+            return PcmFileCover(file, format)
+        except ValueError:
+            pass
+    file.seek(0)
+    return open_cover(file.read(), format)
+
+
+def read_samples(file, format: str):
+    """
+    Samples of a cover that is only going to be read, decoded lazily.
+
+    Probing for a header or extracting a payload only looks at a prefix of
+    the samples, so WAV/AIFF data is read from ``file`` and FLAC frames are
+    decoded only as far as the caller asks; past FLAC_NATIVE_MAX_SAMPLES
+    ffmpeg decodes the rest of the stream. Other formats are decoded in
+    full through ffmpeg or pydub.
+    """
+    if format == "flac" and ffmpeg_enabled():
+        file.seek(0)
+        file_bytes = file.read()
+        try:
+            stream = FlacStream(file_bytes)
+        except ValueError:
+            return decode_cover(file_bytes, format).samples
+        return FlacSamples(
+            stream,
+            fallback=lambda: decode_cover(file_bytes, format).samples,
+            native_limit=get_setting("FLAC_NATIVE_MAX_SAMPLES"),
+        )
+    return open_cover_file(file, format).samples
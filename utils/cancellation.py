@@ -0,0 +1,199 @@
+"""
+Cancellation of requests whose client has gone away.
+
+``CancellationMiddleware`` runs every request under a CancelToken (see
+``lsb.cancel``), so the embed, extract, crypto, zip and encode stages stop
+at their next checkpoint once the token is cancelled, and a streaming
+response stops at the next chunk.
+
+What cancels the token depends on the server. Under ASGI,
+``CancellableASGIHandler`` cancels it when the server reports
+``http.disconnect``. WSGI has no such event: when the server exposes the
+client socket (gunicorn's ``gunicorn.socket``), ``DisconnectMonitor``
+polls the sockets of running requests every ``DISCONNECT_POLL_INTERVAL``
+seconds and cancels on end of file. Elsewhere (runserver) a disconnect
+only shows when writing a streamed response fails and the server closes
+its iterator.
+"""
+
+import logging
+import socket
+import threading
+import time
+from typing import Dict
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+
+from lsb.cancel import CancelToken, cancel_scope
+from utils.exceptions import RequestCancelledError
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SCOPE_KEY = "ciphernest.cancel_token"
+DISCONNECTED = "client disconnected"
+
+metrics.describe("requests_cancelled_total", "Requests whose client disconnected")
+metrics.describe(
+    "cancelled_work_seconds", "Worker time spent on requests until they were cancelled"
+)
+metrics.describe(
+    "cancellation_latency_seconds", "Time from a detected disconnect to the work stopping"
+)
+
+
+def client_gone(client: socket.socket) -> bool:
+    try:
+        # Readable with nothing to read means the peer closed its side
+        return client.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b""
+    except (BlockingIOError, InterruptedError, ValueError):
+        # ValueError: a TLS socket refuses recv flags, so its state is unknown
+        return False
+    except OSError:
+        return True
+
+
+class DisconnectMonitor:
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.clients: Dict[CancelToken, socket.socket] = {}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def watch(self, token: CancelToken, client: socket.socket) -> bool:
+        """Poll ``client`` for ``token``; False for sockets that cannot be peeked at."""
+        # TLS and green sockets wrap the file descriptor, and peeking past them misleads
+        if type(client) is not socket.socket:
+            return False
+        with self._lock:
+            self.clients[token] = client
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="disconnect-monitor", daemon=True
+                )
+                self._thread.start()
+        return True
+
+    def unwatch(self, token: CancelToken) -> None:
+        with self._lock:
+            self.clients.pop(token, None)
+
+    def poll(self) -> None:
+        with self._lock:
+            clients = list(self.clients.items())
+        for token, client in clients:
+            if client_gone(client):
+                token.cancel(DISCONNECTED)
+                self.unwatch(token)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception:
+                # The thread is started once, so it must outlive a bad socket
+                logger.exception("Polling client sockets for disconnects failed")
+
+
+_monitor = None
+_lock = threading.Lock()
+
+
+def get_monitor() -> DisconnectMonitor:
+    global _monitor
+    if _monitor is None:
+        with _lock:
+            if _monitor is None:
+                _monitor = DisconnectMonitor(settings.DISCONNECT_POLL_INTERVAL)
+    return _monitor
+
+
+class CancellableASGIHandler(ASGIHandler):
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await super().__call__(scope, receive, send)
+
+        token = scope[SCOPE_KEY] = CancelToken()
+
+        async def receive_or_cancel():
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                token.cancel(DISCONNECTED)
+            return message
+
+        return await super().__call__(scope, receive_or_cancel, send)
+
+
+class CancellationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        scope = getattr(request, "scope", None)
+        token = scope.get(SCOPE_KEY) if scope else None
+        watched = False
+        if token is None:
+            token = CancelToken()
+            client = request.META.get("gunicorn.socket")
+            if client is not None and settings.DISCONNECT_POLL_INTERVAL:
+                watched = get_monitor().watch(token, client)
+
+        started_at = time.perf_counter()
+        try:
+            with cancel_scope(token):
+                response = self.get_response(request)
+        except BaseException:
+            if watched:
+                get_monitor().unwatch(token)
+            raise
+
+        view = getattr(request.resolver_match, "url_name", None) or "unknown"
+        if getattr(response, "file_to_stream", None) is not None:
+            # Leave files to wsgi.file_wrapper (sendfile); nothing is computed while they go out
+            self.finish(token, view, started_at, watched, False)
+        elif response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, token, view, started_at, watched
+            )
+        else:
+            aborted = response.status_code == RequestCancelledError.status_code
+            self.finish(token, view, started_at, watched, aborted)
+        return response
+
+    def stream(
+        self, content, token: CancelToken, view: str, started_at: float, watched: bool
+    ):
+        aborted = False
+        try:
+            for chunk in content:
+                if token.cancelled:
+                    aborted = True
+                    return
+                yield chunk
+        except GeneratorExit:
+            # The server stopped iterating: writing to the client failed
+            token.cancel(DISCONNECTED)
+            aborted = True
+            raise
+        finally:
+            self.finish(token, view, started_at, watched, aborted)
+
+    def finish(
+        self, token: CancelToken, view: str, started_at: float, watched: bool, aborted: bool
+    ) -> None:
+        if watched:
+            get_monitor().unwatch(token)
+        if not token.cancelled:
+            return
+        # Work that finished before the disconnect was noticed is not counted as aborted
+        labels = {"view": view, "outcome": "aborted" if aborted else "completed"}
+        metrics.inc("requests_cancelled_total", labels)
+        metrics.observe("cancelled_work_seconds", time.perf_counter() - started_at, labels)
+        if aborted:
+            metrics.observe(
+                "cancellation_latency_seconds",
+                time.monotonic() - token.cancelled_at,
+                {"view": view},
+            )
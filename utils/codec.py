@@ -1,4 +1,5 @@
 import zlib
+from typing import Iterable
 
 class CoDec:
     def compress_data(self, data: bytes) -> bytes:
@@ -7,3 +8,26 @@ class CoDec:
     def decompress_data(self, compressed_data: bytes) -> bytes:
         return zlib.decompress(compressed_data)
 
+    def compress_chunks(self, chunks: Iterable[bytes]) -> bytes:
+        """One stream for all ``chunks``, each compressed against the ones before it."""
+        compressor = zlib.compressobj()
+        parts = [compressor.compress(chunk) for chunk in chunks]
+        parts.append(compressor.flush())
+        return b"".join(parts)
+
+    def decompress_exactly(self, compressed_data: bytes, length: int) -> bytes:
+        """
+        The first ``length`` bytes of the stream, or None when it holds
+        anything else: a damaged stream cannot inflate past ``length``.
+        """
+        decompressor = zlib.decompressobj()
+        try:
+            data = decompressor.decompress(compressed_data, length)
+            if not decompressor.eof:
+                # Only the end-of-stream marker may be left
+                data += decompressor.decompress(decompressor.unconsumed_tail, 1)
+        except zlib.error:
+            return None
+        if len(data) != length or not decompressor.eof:
+            return None
+        return data
@@ -11,6 +11,14 @@ class Code(Enum):
     REQUIRE_PASSWORD = "05"
     WRONG_PASSWORD = "06"
     DATA_CORRUPTED = "07"
+    MEMORY_BUDGET_EXCEEDED = "08"
+    SERVER_BUSY = "09"
+    UPLOAD_NOT_FOUND = "10"
+    UPLOAD_CONFLICT = "11"
+    UPLOAD_TOO_LARGE = "12"
+    UNSUPPORTED_AUDIO_FORMAT = "13"
+    REQUEST_CANCELLED = "14"
+    ARTIFACT_NOT_FOUND = "15"
 
 
 class Algorithm(Enum):
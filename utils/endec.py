@@ -1,9 +1,15 @@
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.backends import default_backend
 import os
 
+from lsb.cancel import checkpoint
+
+
+def _cipher(key: bytes, iv: bytes):
+    # cryptography takes longer to import than the rest of the core together,
+    # so it is loaded on the first encryption instead of at startup
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+    return Cipher(algorithms.AES(key), modes.CBC(iv))
+
 
 class EnDec:
     def __init__(self) -> None:
@@ -22,12 +28,16 @@ class EnDec:
         return padded_data_length + salt_size + iv_size
 
     def derive_key(self, password: str, salt: bytes) -> bytes:
+        # A derivation takes tens of milliseconds and cannot be interrupted
+        checkpoint()
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
         kdf = PBKDF2HMAC(
             algorithm=hashes.SHA256(),
             length=32,
             salt=salt,
             iterations=100000,
-            backend=default_backend(),
         )
         return kdf.derive(password.encode())
 
@@ -36,7 +46,7 @@ class EnDec:
         iv = os.urandom(16)
         key = self.derive_key(passphrase, salt)
 
-        cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
+        cipher = _cipher(key, iv)
         encryptor = cipher.encryptor()
 
         padding_length = (
@@ -48,16 +58,15 @@ class EnDec:
         return salt + iv + encrypted_data
 
     def decrypt_data(self, passphrase: str, encrypted_data: bytes) -> bytes:
-        if isinstance(encrypted_data, bytearray):
-            encrypted_data = bytes(encrypted_data)
-
-        salt = encrypted_data[:16]
-        iv = encrypted_data[16:32]
+        # Extracted files are views into the payload; only the key inputs need bytes
+        encrypted_data = memoryview(encrypted_data)
+        salt = bytes(encrypted_data[:16])
+        iv = bytes(encrypted_data[16:32])
         actual_encrypted_data = encrypted_data[32:]
 
         key = self.derive_key(passphrase, salt)
 
-        cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
+        cipher = _cipher(key, iv)
         decryptor = cipher.decryptor()
 
         decrypted_data = decryptor.update(actual_encrypted_data) + decryptor.finalize()
@@ -45,3 +45,56 @@ class DataCorruptedError(BaseCustomException):
     code = Code.DATA_CORRUPTED.value
     message = "The data has been corrupted or modified."
     status_code = status.HTTP_400_BAD_REQUEST
+
+
+class MemoryBudgetExceededError(BaseCustomException):
+    code = Code.MEMORY_BUDGET_EXCEEDED.value
+    message = "The request needs more memory than the server allows."
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+
+class ServerBusyError(BaseCustomException):
+    code = Code.SERVER_BUSY.value
+    message = "The server is busy, please retry later."
+    status_code = status.HTTP_429_TOO_MANY_REQUESTS
+
+    def __init__(self, message=None, code=None, retry_after: int = 1):
+        self.retry_after = retry_after
+        super().__init__(message, code)
+
+
+class UploadNotFoundError(BaseCustomException):
+    code = Code.UPLOAD_NOT_FOUND.value
+    message = "The upload does not exist or has expired."
+    status_code = status.HTTP_404_NOT_FOUND
+
+
+class UploadConflictError(BaseCustomException):
+    code = Code.UPLOAD_CONFLICT.value
+    message = "The upload is not in the expected state."
+    status_code = status.HTTP_409_CONFLICT
+
+
+class UploadTooLargeError(BaseCustomException):
+    code = Code.UPLOAD_TOO_LARGE.value
+    message = "The upload is larger than the server accepts."
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+
+class UnsupportedAudioFormatError(BaseCustomException):
+    code = Code.UNSUPPORTED_AUDIO_FORMAT.value
+    message = "Unsupported audio file. Allowed types are: wav, flac, aiff."
+    status_code = status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+
+
+class RequestCancelledError(BaseCustomException):
+    code = Code.REQUEST_CANCELLED.value
+    message = "The request was cancelled before it finished."
+    # nginx's "client closed request": nobody is left to read the response
+    status_code = 499
+
+
+class ArtifactNotFoundError(BaseCustomException):
+    code = Code.ARTIFACT_NOT_FOUND.value
+    message = "The artifact does not exist or has expired."
+    status_code = status.HTTP_404_NOT_FOUND
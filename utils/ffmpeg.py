@@ -0,0 +1,253 @@
+"""
+Audio decoding and encoding through ffmpeg pipes.
+
+pydub writes the input and the output of every conversion to temporary
+files and runs ffprobe before ffmpeg. Here ffmpeg reads the cover from
+stdin and writes raw PCM to stdout, and the edited PCM goes back the same
+way, so nothing touches the disk. Input is written from a thread while
+output is read, in blocks, into one growing buffer.
+"""
+
+import re
+import shutil
+import subprocess
+import threading
+from typing import Iterator, Tuple
+
+from lsb.cancel import checkpoint, current_token
+from lsb.config import get_setting
+from utils.flac import FLAC_HEADER_SIZE, set_total_samples
+from utils.pcm import PCM_FORMATS, set_chunk_sizes
+
+PIPE_BLOCK_SIZE = 256 * 1024
+# The stream parameters come from the container header; no need to send more
+PROBE_SIZE = 1024 * 1024
+
+RAW_FORMATS = {1: "u8", 2: "s16le", 3: "s24le", 4: "s32le"}
+# ffmpeg sample formats that do not say their bit depth
+SAMPLE_FORMAT_WIDTHS = {"u8": 1, "s16": 2, "s32": 4}
+STREAM_INFO = re.compile(
+    r"Audio: [^,]+, (\d+) Hz, ([^,]+), (\w+?)p?(?: \((\d+) bit\))?[,\n]"
+)
+CHANNEL_LAYOUTS = {"mono": 1, "stereo": 2}
+
+
+class FfmpegError(Exception):
+    pass
+
+
+class StreamInfo:
+    def __init__(self, frame_rate: int, channels: int, sample_width: int) -> None:
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self.sample_width = sample_width
+
+    @property
+    def raw_format(self) -> str:
+        return RAW_FORMATS[self.sample_width]
+
+
+def available() -> bool:
+    return shutil.which(get_setting("FFMPEG_BINARY")) is not None
+
+
+def _channels(layout: str) -> int:
+    if layout in CHANNEL_LAYOUTS:
+        return CHANNEL_LAYOUTS[layout]
+    match = re.match(r"(\d+) channels", layout)
+    if match:
+        return int(match.group(1))
+    # "5.1", "7.1(wide)", ...: front/back channels plus the LFE
+    match = re.match(r"(\d+)\.(\d+)", layout)
+    if match:
+        return int(match.group(1)) + int(match.group(2))
+    raise FfmpegError(f"Unknown channel layout {layout!r}")
+
+
+def parse_stream_info(stderr: str) -> StreamInfo:
+    match = STREAM_INFO.search(stderr)
+    if match is None:
+        raise FfmpegError("No audio stream found")
+    frame_rate, layout, sample_format, bits = match.groups()
+    if bits:
+        sample_width = (int(bits) + 7) // 8
+    else:
+        # Float and unknown formats are converted to 16-bit integers, as pydub does
+        sample_width = SAMPLE_FORMAT_WIDTHS.get(sample_format, 2)
+    return StreamInfo(int(frame_rate), _channels(layout), sample_width)
+
+
+def _spawn(arguments: list, input) -> Tuple[subprocess.Popen, list, list]:
+    """Start ffmpeg, with threads writing ``input`` to stdin and reading stderr."""
+    try:
+        process = subprocess.Popen(
+            [get_setting("FFMPEG_BINARY"), "-nostdin", "-hide_banner", *arguments],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    except OSError as e:
+        raise FfmpegError(str(e))
+
+    errors = []
+
+    def write():
+        try:
+            with memoryview(input) as view:
+                for start in range(0, len(view), PIPE_BLOCK_SIZE):
+                    process.stdin.write(view[start : start + PIPE_BLOCK_SIZE])
+        except (BrokenPipeError, ValueError):
+            # ffmpeg stops reading once it has what it needs (probing)
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def read_errors():
+        errors.append(process.stderr.read())
+
+    threads = [threading.Thread(target=write), threading.Thread(target=read_errors)]
+    for thread in threads:
+        thread.start()
+    return process, threads, errors
+
+
+def _wait(process: subprocess.Popen, threads: list, errors: list, check: bool) -> str:
+    process.stdout.close()
+    process.wait()
+    for thread in threads:
+        thread.join()
+    process.stderr.close()
+    stderr = errors[0].decode(errors="replace") if errors else ""
+    if check and process.returncode != 0:
+        raise FfmpegError(stderr.strip() or f"ffmpeg exited with {process.returncode}")
+    return stderr
+
+
+def run(
+    arguments: list, input, output: bytearray = None, check: bool = True
+) -> Tuple[bytearray, str]:
+    """
+    Run ffmpeg with ``input`` on stdin and return its stdout and stderr.
+
+    Output is read with ``readinto`` into ``output``, grown as needed, so
+    a caller that knows the decoded size roughly avoids every copy.
+    """
+    process, threads, errors = _spawn(arguments, input)
+    output = bytearray(PIPE_BLOCK_SIZE) if output is None else output
+    filled = 0
+    token = current_token()
+    while True:
+        if token is not None and token.cancelled:
+            # The writer and stderr threads finish once the pipes close
+            process.kill()
+            break
+        if len(output) - filled < PIPE_BLOCK_SIZE:
+            output.extend(bytes(max(len(output), PIPE_BLOCK_SIZE)))
+        with memoryview(output) as view:
+            read = process.stdout.readinto(view[filled:])
+        if not read:
+            break
+        filled += read
+    del output[filled:]
+
+    stderr = _wait(process, threads, errors, check=False)
+    checkpoint()
+    if check and process.returncode != 0:
+        raise FfmpegError(stderr.strip() or f"ffmpeg exited with {process.returncode}")
+    return output, stderr
+
+
+def stream(arguments: list, input, block_size: int = PIPE_BLOCK_SIZE) -> Iterator[bytes]:
+    """
+    Run ffmpeg with ``input`` on stdin and yield its stdout as it is written.
+
+    A consumer that stops early kills the process; errors are raised once
+    the output ends.
+    """
+    process, threads, errors = _spawn(arguments, input)
+    finished = False
+    try:
+        while block := process.stdout.read1(block_size):
+            yield block
+        finished = True
+    finally:
+        if not finished:
+            process.kill()
+        _wait(process, threads, errors, check=finished)
+
+
+def probe(file_bytes, format: str) -> StreamInfo:
+    # Without an output ffmpeg only prints the input streams and exits
+    _, stderr = run(
+        ["-f", format, "-i", "pipe:0"], memoryview(file_bytes)[:PROBE_SIZE], check=False
+    )
+    return parse_stream_info(stderr)
+
+
+def decode(file_bytes, format: str, info: StreamInfo) -> bytearray:
+    """The first audio stream of ``file_bytes`` as interleaved raw PCM."""
+    # Compressed covers decode to a few times their size
+    output = bytearray(len(file_bytes) * 2)
+    pcm, _ = run(
+        ["-v", "error", "-f", format, "-i", "pipe:0", "-map", "0:a:0",
+         "-f", info.raw_format, "pipe:1"],
+        file_bytes,
+        output,
+    )
+    return pcm
+
+
+def encoder_arguments(format: str, info: StreamInfo) -> list:
+    bits = info.sample_width * 8
+    if format == "wav":
+        return ["-c:a", "pcm_u8" if bits == 8 else f"pcm_s{bits}le"]
+    if format == "aiff":
+        return ["-c:a", "pcm_s8" if bits == 8 else f"pcm_s{bits}be"]
+    if format == "flac" and bits == 32:
+        return ["-strict", "experimental"]
+    return []
+
+
+def _encode_arguments(format: str, info: StreamInfo) -> list:
+    return [
+        "-v", "error", "-f", info.raw_format, "-ar", str(info.frame_rate),
+        "-ac", str(info.channels), "-i", "pipe:0",
+        *encoder_arguments(format, info), "-f", format, "pipe:1",
+    ]
+
+
+def encode(pcm, format: str, info: StreamInfo) -> bytearray:
+    """Raw PCM back into a ``format`` file."""
+    output, _ = run(
+        _encode_arguments(format, info), pcm, bytearray(len(pcm) + PIPE_BLOCK_SIZE)
+    )
+    if format in PCM_FORMATS:
+        # Writing to a pipe, the muxer cannot go back to fill in the sizes
+        set_chunk_sizes(output, format)
+    elif format == "flac":
+        set_total_samples(output, len(pcm) // (info.sample_width * info.channels))
+    return output
+
+
+def encode_chunks(pcm, format: str, info: StreamInfo, block_size: int = PIPE_BLOCK_SIZE):
+    """
+    Like ``encode``, but the file is yielded in blocks while ffmpeg encodes.
+
+    WAV/AIFF sizes are only known at the end, so use ``encode`` for those.
+    """
+    if format in PCM_FORMATS:
+        raise ValueError(f"{format} covers cannot be encoded as a stream")
+    blocks = stream(_encode_arguments(format, info), pcm, block_size)
+    if format == "flac":
+        # STREAMINFO is the first metadata block; hold output back until it is whole
+        header = bytearray()
+        for block in blocks:
+            header += block
+            if len(header) >= FLAC_HEADER_SIZE:
+                break
+        set_total_samples(header, len(pcm) // (info.sample_width * info.channels))
+        yield bytes(header)
+    yield from blocks
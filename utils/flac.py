@@ -0,0 +1,617 @@
+"""
+Minimal native FLAC support: a pure-Python frame decoder and a verbatim
+frame encoder.
+
+Embedding only changes the first ``header + payload`` samples of a cover,
+so instead of decoding and re-encoding the whole track, the frames covering
+the modified samples are re-emitted with VERBATIM subframes and every other
+frame is copied byte for byte. STREAMINFO and SEEKTABLE are patched to
+match the new frame sizes and offsets.
+"""
+
+import struct
+import sys
+from array import array
+from typing import List
+
+from lsb.samples import LazySamples
+
+FLAC_SIGNATURE = b"fLaC"
+STREAMINFO = 0
+# Signature, then the STREAMINFO block header and body
+FLAC_HEADER_SIZE = 4 + 4 + 34
+SEEKTABLE = 3
+SEEK_PLACEHOLDER = 0xFFFFFFFFFFFFFFFF
+MAX_BITS_PER_SAMPLE = 24
+
+
+def _crc8_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return table
+
+
+def _crc16_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x8005) & 0xFFFF if crc & 0x8000 else (crc << 1) & 0xFFFF
+        table.append(crc)
+    return table
+
+
+CRC8_TABLE = _crc8_table()
+CRC16_TABLE = _crc16_table()
+
+
+def crc8(data) -> int:
+    crc = 0
+    table = CRC8_TABLE
+    for byte in data:
+        crc = table[crc ^ byte]
+    return crc
+
+
+def crc16(data) -> int:
+    crc = 0
+    table = CRC16_TABLE
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ table[(crc >> 8) ^ byte]
+    return crc
+
+
+class BitReader:
+    def __init__(self, data, position: int = 0) -> None:
+        self.data = data
+        self.position = position
+
+    def read(self, bits: int) -> int:
+        if bits == 0:
+            return 0
+        start = self.position >> 3
+        end = (self.position + bits + 7) >> 3
+        chunk = int.from_bytes(self.data[start:end], "big")
+        self.position += bits
+        return (chunk >> ((end << 3) - self.position)) & ((1 << bits) - 1)
+
+    def read_signed(self, bits: int) -> int:
+        value = self.read(bits)
+        if bits and value >= 1 << (bits - 1):
+            value -= 1 << bits
+        return value
+
+    def read_unary(self) -> int:
+        data = self.data
+        position = self.position
+        count = 0
+        while True:
+            bit = position & 7
+            byte = (data[position >> 3] << bit) & 0xFF
+            if byte:
+                zeros = 8 - byte.bit_length()
+                self.position = position + zeros + 1
+                return count + zeros
+            count += 8 - bit
+            position += 8 - bit
+
+    def read_utf8(self) -> int:
+        first = self.read(8)
+        if first < 0x80:
+            return first
+        length = 8 - (first ^ 0xFF).bit_length()
+        if not 2 <= length <= 7:
+            raise ValueError("Invalid FLAC frame number")
+        value = first & ((1 << (7 - length)) - 1)
+        for _ in range(length - 1):
+            value = (value << 6) | (self.read(8) & 0x3F)
+        return value
+
+    def align(self) -> None:
+        self.position = (self.position + 7) & ~7
+
+
+class StreamInfo:
+    def __init__(self, body: bytes) -> None:
+        (
+            self.min_block_size,
+            self.max_block_size,
+        ) = struct.unpack(">HH", body[0:4])
+        self.min_frame_size = int.from_bytes(body[4:7], "big")
+        self.max_frame_size = int.from_bytes(body[7:10], "big")
+        packed = int.from_bytes(body[10:18], "big")
+        self.sample_rate = packed >> 44
+        self.channels = ((packed >> 41) & 0x7) + 1
+        self.bits_per_sample = ((packed >> 36) & 0x1F) + 1
+        self.total_samples = packed & ((1 << 36) - 1)
+        self.packed = body[10:18]
+
+    def to_bytes(self) -> bytes:
+        return (
+            struct.pack(">HH", self.min_block_size, self.max_block_size)
+            + self.min_frame_size.to_bytes(3, "big")
+            + self.max_frame_size.to_bytes(3, "big")
+            + self.packed
+            # The MD5 of the audio no longer matches once samples change;
+            # all zeros means "unknown" to decoders
+            + bytes(16)
+        )
+
+
+def set_total_samples(buffer: bytearray, total_samples: int) -> None:
+    """Fill in the STREAMINFO sample count, left at 0 by encoders writing to a pipe."""
+    if buffer[:4] != FLAC_SIGNATURE or buffer[4] & 0x7F != STREAMINFO:
+        raise ValueError("Invalid FLAC file: STREAMINFO not found")
+    # Signature, block header, block and frame sizes
+    position = 4 + 4 + 10
+    packed = int.from_bytes(buffer[position : position + 8], "big")
+    packed = packed & ~((1 << 36) - 1) | total_samples
+    buffer[position : position + 8] = packed.to_bytes(8, "big")
+
+
+class FlacFrame:
+    def __init__(
+        self,
+        offset: int,
+        length: int,
+        header: bytes,
+        block_size: int,
+        bits_per_sample: int,
+        first_sample: int,
+    ) -> None:
+        self.offset = offset
+        self.length = length
+        self.header = header
+        self.block_size = block_size
+        self.bits_per_sample = bits_per_sample
+        self.first_sample = first_sample
+
+    @property
+    def end(self) -> int:
+        return self.offset + self.length
+
+
+BITS_PER_SAMPLE_CODES = {1: 8, 2: 12, 4: 16, 5: 20, 6: 24}
+SAMPLE_SIZE_CODES = {bits: code for code, bits in BITS_PER_SAMPLE_CODES.items()}
+
+
+def encode_utf8(value: int) -> bytes:
+    """FLAC's UTF-8-like coding of frame numbers."""
+    if value < 0x80:
+        return bytes([value])
+    payload = []
+    while True:
+        payload.append(0x80 | (value & 0x3F))
+        value >>= 6
+        length = len(payload) + 1
+        if value < 1 << (7 - length):
+            break
+    lead = (0xFF << (8 - length)) & 0xFF | value
+    return bytes([lead] + payload[::-1])
+
+
+class FlacStream:
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        start = 0
+        if data[:3] == b"ID3" and len(data) >= 10:
+            size = 0
+            for byte in data[6:10]:
+                size = (size << 7) | (byte & 0x7F)
+            start = 10 + size + (10 if data[5] & 0x10 else 0)
+        if data[start : start + 4] != FLAC_SIGNATURE:
+            raise ValueError("Invalid FLAC file: fLaC signature not found")
+        self.signature_offset = start
+
+        self.blocks = []
+        index = start + 4
+        while True:
+            if index + 4 > len(data):
+                raise ValueError("Invalid FLAC file: truncated metadata")
+            block_type = data[index] & 0x7F
+            is_last = data[index] & 0x80
+            length = int.from_bytes(data[index + 1 : index + 4], "big")
+            self.blocks.append((block_type, index, length))
+            index += 4 + length
+            if is_last:
+                break
+        self.frames_offset = index
+
+        block_type, offset, length = self.blocks[0]
+        if block_type != STREAMINFO:
+            raise ValueError("Invalid FLAC file: STREAMINFO must come first")
+        self.streaminfo = StreamInfo(data[offset + 4 : offset + 4 + length])
+        if self.streaminfo.bits_per_sample > MAX_BITS_PER_SAMPLE:
+            raise ValueError("Unsupported FLAC bit depth")
+
+    def decode_frame(self, offset: int, first_sample: int):
+        """Decode the frame at ``offset``; returns the frame and its channels."""
+        data = self.data
+        reader = BitReader(data, offset * 8)
+        if reader.read(14) != 0x3FFE:
+            raise ValueError("Invalid FLAC frame: sync code not found")
+        reader.read(2)
+        block_size_code = reader.read(4)
+        sample_rate_code = reader.read(4)
+        channel_code = reader.read(4)
+        sample_size_code = reader.read(3)
+        reader.read(1)
+        reader.read_utf8()
+
+        if block_size_code == 1:
+            block_size = 192
+        elif 2 <= block_size_code <= 5:
+            block_size = 576 << (block_size_code - 2)
+        elif block_size_code == 6:
+            block_size = reader.read(8) + 1
+        elif block_size_code == 7:
+            block_size = reader.read(16) + 1
+        elif block_size_code >= 8:
+            block_size = 256 << (block_size_code - 8)
+        else:
+            raise ValueError("Invalid FLAC frame: reserved block size")
+
+        if sample_rate_code == 12:
+            reader.read(8)
+        elif sample_rate_code in (13, 14):
+            reader.read(16)
+        elif sample_rate_code == 15:
+            raise ValueError("Invalid FLAC frame: invalid sample rate")
+
+        if sample_size_code == 0:
+            bits_per_sample = self.streaminfo.bits_per_sample
+        elif sample_size_code in BITS_PER_SAMPLE_CODES:
+            bits_per_sample = BITS_PER_SAMPLE_CODES[sample_size_code]
+        else:
+            raise ValueError("Unsupported FLAC frame sample size")
+
+        header_end = reader.position >> 3
+        if crc8(data[offset:header_end]) != reader.read(8):
+            raise ValueError("Invalid FLAC frame: header CRC mismatch")
+
+        if channel_code < 8:
+            channel_bits = [bits_per_sample] * (channel_code + 1)
+        elif channel_code == 8:
+            channel_bits = [bits_per_sample, bits_per_sample + 1]
+        elif channel_code == 9:
+            channel_bits = [bits_per_sample + 1, bits_per_sample]
+        elif channel_code == 10:
+            channel_bits = [bits_per_sample, bits_per_sample + 1]
+        else:
+            raise ValueError("Invalid FLAC frame: reserved channel assignment")
+        if len(channel_bits) != self.streaminfo.channels:
+            raise ValueError("Invalid FLAC frame: channel count mismatch")
+
+        channels = [
+            self._decode_subframe(reader, bits, block_size) for bits in channel_bits
+        ]
+
+        if channel_code == 8:
+            left, side = channels
+            channels[1] = [l - s for l, s in zip(left, side)]
+        elif channel_code == 9:
+            side, right = channels
+            channels[0] = [s + r for s, r in zip(side, right)]
+        elif channel_code == 10:
+            mid, side = channels
+            left, right = [], []
+            for m, s in zip(mid, side):
+                m = (m << 1) | (s & 1)
+                left.append((m + s) >> 1)
+                right.append((m - s) >> 1)
+            channels = [left, right]
+
+        reader.align()
+        frame_end = reader.position >> 3
+        if crc16(data[offset:frame_end]) != reader.read(16):
+            raise ValueError("Invalid FLAC frame: frame CRC mismatch")
+
+        frame = FlacFrame(
+            offset=offset,
+            length=frame_end + 2 - offset,
+            header=bytes(data[offset:header_end]),
+            block_size=block_size,
+            bits_per_sample=bits_per_sample,
+            first_sample=first_sample,
+        )
+        return frame, channels
+
+    def _decode_subframe(self, reader: BitReader, bits: int, block_size: int) -> List[int]:
+        if reader.read(1):
+            raise ValueError("Invalid FLAC subframe: padding bit set")
+        subframe_type = reader.read(6)
+        wasted = 0
+        if reader.read(1):
+            wasted = reader.read_unary() + 1
+            bits -= wasted
+
+        if subframe_type == 0:
+            samples = [reader.read_signed(bits)] * block_size
+        elif subframe_type == 1:
+            samples = [reader.read_signed(bits) for _ in range(block_size)]
+        elif 8 <= subframe_type <= 12:
+            order = subframe_type - 8
+            samples = [reader.read_signed(bits) for _ in range(order)]
+            residual = self._decode_residual(reader, order, block_size)
+            self._restore_fixed(samples, residual, order)
+        elif subframe_type >= 32:
+            order = (subframe_type & 0x1F) + 1
+            samples = [reader.read_signed(bits) for _ in range(order)]
+            precision = reader.read(4) + 1
+            if precision == 16:
+                raise ValueError("Invalid FLAC subframe: invalid LPC precision")
+            shift = reader.read_signed(5)
+            if shift < 0:
+                raise ValueError("Unsupported FLAC subframe: negative LPC shift")
+            coefficients = [reader.read_signed(precision) for _ in range(order)]
+            residual = self._decode_residual(reader, order, block_size)
+            self._restore_lpc(samples, residual, coefficients, shift)
+        else:
+            raise ValueError("Invalid FLAC subframe: reserved subframe type")
+
+        if wasted:
+            samples = [sample << wasted for sample in samples]
+        return samples
+
+    @staticmethod
+    def _decode_residual(reader: BitReader, order: int, block_size: int) -> List[int]:
+        method = reader.read(2)
+        if method > 1:
+            raise ValueError("Invalid FLAC residual: reserved coding method")
+        parameter_bits = 5 if method else 4
+        escape = (1 << parameter_bits) - 1
+        partition_order = reader.read(4)
+        partition_size = block_size >> partition_order
+
+        residual = []
+        read = reader.read
+        read_unary = reader.read_unary
+        for partition in range(1 << partition_order):
+            count = partition_size - (order if partition == 0 else 0)
+            parameter = read(parameter_bits)
+            if parameter == escape:
+                raw_bits = read(5)
+                residual.extend(reader.read_signed(raw_bits) for _ in range(count))
+                continue
+            for _ in range(count):
+                value = (read_unary() << parameter) | read(parameter)
+                residual.append((value >> 1) ^ -(value & 1))
+        return residual
+
+    @staticmethod
+    def _restore_fixed(samples: List[int], residual: List[int], order: int) -> None:
+        append = samples.append
+        if order == 0:
+            samples.extend(residual)
+        elif order == 1:
+            for r in residual:
+                append(samples[-1] + r)
+        elif order == 2:
+            for r in residual:
+                append(2 * samples[-1] - samples[-2] + r)
+        elif order == 3:
+            for r in residual:
+                append(3 * samples[-1] - 3 * samples[-2] + samples[-3] + r)
+        else:
+            for r in residual:
+                append(
+                    4 * samples[-1] - 6 * samples[-2] + 4 * samples[-3] - samples[-4] + r
+                )
+
+    @staticmethod
+    def _restore_lpc(
+        samples: List[int], residual: List[int], coefficients: List[int], shift: int
+    ) -> None:
+        order = len(coefficients)
+        reversed_coefficients = coefficients[::-1]
+        for r in residual:
+            history = samples[-order:]
+            prediction = sum(c * s for c, s in zip(reversed_coefficients, history))
+            samples.append(r + (prediction >> shift))
+
+    @staticmethod
+    def encode_verbatim(frame: FlacFrame, samples: array, channels: int) -> bytes:
+        """Re-emit ``frame`` from interleaved ``samples`` with VERBATIM subframes."""
+        header = bytearray(frame.header)
+        # Independent channels: the assignment code is the channel count - 1
+        header[3] = (header[3] & 0x0F) | ((channels - 1) << 4)
+        header.append(crc8(header))
+
+        bits = frame.bits_per_sample
+        start = frame.first_sample * channels
+        end = start + frame.block_size * channels
+        body = bytearray()
+        if bits % 8 == 0:
+            width = bits // 8
+            for channel in range(channels):
+                values = array("i", samples[start + channel : end : channels])
+                if sys.byteorder == "little":
+                    values.byteswap()
+                raw = values.tobytes()
+                body.append(0x02)
+                packed = bytearray(frame.block_size * width)
+                for byte in range(width):
+                    packed[byte::width] = raw[4 - width + byte :: 4]
+                body += packed
+        else:
+            mask = (1 << bits) - 1
+            bit_string = "".join(
+                "00000010"
+                + "".join(
+                    format(value & mask, f"0{bits}b")
+                    for value in samples[start + channel : end : channels]
+                )
+                for channel in range(channels)
+            )
+            bit_string += "0" * (-len(bit_string) % 8)
+            body += int(bit_string, 2).to_bytes(len(bit_string) // 8, "big")
+
+        encoded = header + body
+        encoded += crc16(encoded).to_bytes(2, "big")
+        return bytes(encoded)
+
+
+class FlacSamples(LazySamples):
+    """
+    Interleaved FLAC samples, decoded frame by frame as they are needed.
+
+    The decoder is pure Python, a few microseconds per sample. Read-only
+    samples can be given a ``fallback`` that decodes the whole stream at
+    once (ffmpeg) and returns its samples: it takes over from frame
+    decoding when a read reaches past ``native_limit`` samples, or right
+    away when STREAMINFO does not give the length. Samples that fell back
+    cannot be ``encode``d.
+    """
+
+    def __init__(self, stream: FlacStream, fallback=None, native_limit: int = 0) -> None:
+        self.stream = stream
+        self.channels = stream.streaminfo.channels
+        self.frames = []
+        self.next_offset = stream.frames_offset
+        self.next_sample = 0
+        self.fallback = fallback
+        self.native_limit = native_limit
+        super().__init__(stream.streaminfo.total_samples * self.channels)
+        if self.length == 0:
+            if fallback is not None:
+                self._fall_back()
+                return
+            # Unknown length in STREAMINFO: the whole stream has to be decoded
+            while self.decode_more():
+                pass
+            self.length = len(self.decoded)
+
+    def _fall_back(self) -> None:
+        self.decoded = self.fallback()
+        self.fallback = None
+        self.frames = None
+        self.length = self.available = len(self.decoded)
+
+    def ensure(self, end: int) -> None:
+        if self.fallback is not None and end > max(self.available, self.native_limit):
+            with self._lock:
+                if self.fallback is not None:
+                    self._fall_back()
+        super().ensure(end)
+
+    def decode_more(self) -> bool:
+        if self.frames is None:
+            return False
+        total_samples = self.stream.streaminfo.total_samples
+        if total_samples and self.next_sample >= total_samples:
+            return False
+        if self.next_offset >= len(self.stream.data) - 2:
+            return False
+        frame, channels = self.stream.decode_frame(self.next_offset, self.next_sample)
+        interleaved = array("i", bytes(4 * frame.block_size * self.channels))
+        for index, channel in enumerate(channels):
+            interleaved[index :: self.channels] = array("i", channel)
+        self.decoded.extend(interleaved)
+        self.available = len(self.decoded)
+        self.frames.append(frame)
+        self.next_offset = frame.end
+        self.next_sample += frame.block_size
+        return True
+
+    def encode(self) -> bytes:
+        """Return the FLAC file with every modified frame re-encoded."""
+        stream = self.stream
+        data = stream.data
+        touched = [
+            frame
+            for frame in self.frames
+            if frame.first_sample * self.channels < self.dirty_end
+        ]
+        if not touched:
+            return bytes(data)
+
+        encoded_frames = [
+            stream.encode_verbatim(frame, self.decoded, self.channels)
+            for frame in touched
+        ]
+        old_end = touched[-1].end
+        delta = sum(map(len, encoded_frames)) - (old_end - stream.frames_offset)
+
+        new_offsets = {}
+        position = 0
+        for frame, encoded in zip(touched, encoded_frames):
+            new_offsets[frame.first_sample] = position
+            position += len(encoded)
+
+        output = bytearray(data[: stream.frames_offset])
+        for block_type, offset, length in stream.blocks:
+            body_start = offset + 4
+            if block_type == STREAMINFO:
+                streaminfo = StreamInfo(data[body_start : body_start + length])
+                sizes = list(map(len, encoded_frames))
+                if streaminfo.min_frame_size:
+                    streaminfo.min_frame_size = min(streaminfo.min_frame_size, *sizes)
+                if streaminfo.max_frame_size:
+                    streaminfo.max_frame_size = max(streaminfo.max_frame_size, *sizes)
+                output[body_start : body_start + 34] = streaminfo.to_bytes()
+            elif block_type == SEEKTABLE:
+                for point in range(body_start, body_start + length - 17, 18):
+                    sample, frame_offset = struct.unpack(">QQ", data[point : point + 16])
+                    if sample == SEEK_PLACEHOLDER:
+                        continue
+                    if sample in new_offsets:
+                        frame_offset = new_offsets[sample]
+                    elif stream.frames_offset + frame_offset >= old_end:
+                        frame_offset += delta
+                    output[point + 8 : point + 16] = frame_offset.to_bytes(8, "big")
+
+        for encoded in encoded_frames:
+            output += encoded
+        output += data[old_end:]
+        return bytes(output)
+
+
+def write_verbatim_flac(
+    samples,
+    channels: int,
+    sample_rate: int,
+    bits_per_sample: int = 16,
+    block_size: int = 4096,
+) -> bytes:
+    """Build a FLAC file holding interleaved ``samples`` in VERBATIM frames."""
+    if bits_per_sample not in SAMPLE_SIZE_CODES:
+        raise ValueError(f"Unsupported FLAC bit depth {bits_per_sample}")
+    total_samples = len(samples) // channels
+    packed = (
+        (sample_rate << 44)
+        | ((channels - 1) << 41)
+        | ((bits_per_sample - 1) << 36)
+        | total_samples
+    )
+    streaminfo = (
+        struct.pack(">HH", block_size, block_size)
+        + bytes(6)
+        + packed.to_bytes(8, "big")
+        + bytes(16)
+    )
+    output = bytearray(FLAC_SIGNATURE)
+    output += bytes([0x80 | STREAMINFO]) + len(streaminfo).to_bytes(3, "big")
+    output += streaminfo
+
+    for number, first_sample in enumerate(range(0, total_samples, block_size)):
+        size = min(block_size, total_samples - first_sample)
+        # Block size code 7: the size minus one follows as 16 bits
+        header = (
+            bytes([0xFF, 0xF8, 0x70, SAMPLE_SIZE_CODES[bits_per_sample] << 1])
+            + encode_utf8(number)
+            + (size - 1).to_bytes(2, "big")
+        )
+        frame = FlacFrame(
+            offset=len(output),
+            length=0,
+            header=header,
+            block_size=size,
+            bits_per_sample=bits_per_sample,
+            first_sample=first_sample,
+        )
+        output += FlacStream.encode_verbatim(frame, samples, channels)
+    return bytes(output)
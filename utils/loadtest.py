@@ -0,0 +1,309 @@
+"""
+Load generator for the HTTP endpoints.
+
+Synthetic WAV/FLAC covers and payloads are prepared up front, then a pool
+of client threads replays a weighted mix of ``/covers/``, ``/embed/`` and
+``/extract/`` uploads against a server started under gunicorn or uvicorn
+(or an already running one), recording latency, status and worker RSS.
+"""
+
+import http.client
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import wave
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict, List, Tuple
+from urllib.parse import urlsplit
+
+from utils.flac import write_verbatim_flac
+
+ENDPOINTS = {
+    "covers": "/covers/",
+    "embed": "/embed/",
+    "extract": "/extract/",
+}
+SERVERS = ("gunicorn", "uvicorn")
+SAMPLE_RATE = 44100
+# Upper bounds of the latency histogram buckets, in milliseconds
+HISTOGRAM_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def make_cover(format: str, seconds: float, seed: int = 0) -> bytes:
+    """Stereo 16-bit noise as a WAV or FLAC file."""
+    rng = random.Random(seed)
+    samples = array(
+        "h", (rng.randint(-32768, 32767) for _ in range(int(seconds * SAMPLE_RATE) * 2))
+    )
+    if format == "flac":
+        return write_verbatim_flac(samples, channels=2, sample_rate=SAMPLE_RATE)
+    buffer = BytesIO()
+    with wave.open(buffer, "wb") as cover:
+        cover.setnchannels(2)
+        cover.setsampwidth(2)
+        cover.setframerate(SAMPLE_RATE)
+        cover.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+def encode_multipart(fields: Dict[str, str], files: List[Tuple[str, str, bytes]]):
+    boundary = uuid.uuid4().hex
+    body = BytesIO()
+    for name, value in fields.items():
+        body.write(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+            f"{value}\r\n".encode()
+        )
+    for name, filename, data in files:
+        body.write(
+            f"--{boundary}\r\nContent-Disposition: form-data; "
+            f'name="{name}"; filename="{filename}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n".encode()
+        )
+        body.write(data)
+        body.write(b"\r\n")
+    body.write(f"--{boundary}--\r\n".encode())
+    return body.getvalue(), f"multipart/form-data; boundary={boundary}"
+
+
+class Scenario:
+    """One kind of request: an endpoint, a cover format, a payload size and a password."""
+
+    def __init__(
+        self, endpoint: str, format: str, cover: bytes, payload: bytes, password: str
+    ) -> None:
+        self.endpoint = endpoint
+        self.format = format
+        self.password = password
+        fields = {"output_quality": "low", "compressed": "true"}
+        files = [("cover_file", f"cover.{format}", cover)]
+        if endpoint == "extract":
+            fields = {}
+            files = [("embedded_file", f"cover.{format}", cover)]
+        else:
+            files.append(("secret_files", "secret.bin", payload))
+        if password:
+            fields["password"] = password
+        self.body, self.content_type = encode_multipart(fields, files)
+
+    @property
+    def name(self) -> str:
+        return f"{self.endpoint}/{self.format}"
+
+
+def build_scenarios(
+    mix: Dict[str, int],
+    formats: List[str],
+    payload_sizes: List[int],
+    seconds: float,
+    password_ratio: float,
+    seed: int = 0,
+) -> List[Scenario]:
+    """Scenarios repeated according to the endpoint weights of ``mix``."""
+    from lsb.file import File
+    from lsb.registry import get_steganography
+    from utils.audio import open_cover
+
+    rng = random.Random(seed)
+    covers = {format: make_cover(format, seconds, seed) for format in formats}
+    scenarios = []
+    for endpoint, weight in mix.items():
+        for format in formats:
+            for payload_size in payload_sizes:
+                payload = rng.randbytes(payload_size)
+                password = "load-test" if rng.random() < password_ratio else None
+                cover = covers[format]
+                if endpoint == "extract":
+                    stego = open_cover(cover, format)
+                    get_steganography().embed(
+                        samples=stego.samples,
+                        secret_files=[
+                            File(name="secret.bin", size=len(payload), data=payload)
+                        ],
+                        quality="low",
+                        compressed=True,
+                        passphrase=password,
+                    )
+                    cover = stego.export().getvalue()
+                scenario = Scenario(endpoint, format, cover, payload, password)
+                scenarios.extend([scenario] * weight)
+    return scenarios
+
+
+class Results:
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, latency: float, ok: bool) -> None:
+        with self._lock:
+            self.latencies.setdefault(name, []).append(latency)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    @staticmethod
+    def percentile(values: List[float], fraction: float) -> float:
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+        return ordered[index]
+
+    @staticmethod
+    def histogram(values: List[float]) -> List[Tuple[str, int]]:
+        counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        for value in values:
+            milliseconds = value * 1000
+            for index, bound in enumerate(HISTOGRAM_BUCKETS):
+                if milliseconds <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[-1] += 1
+        labels = [f"<={bound}ms" for bound in HISTOGRAM_BUCKETS] + [
+            f">{HISTOGRAM_BUCKETS[-1]}ms"
+        ]
+        return list(zip(labels, counts))
+
+
+def send(base_url: str, scenario: Scenario, timeout: float = 60) -> Tuple[bool, float]:
+    url = urlsplit(base_url)
+    connection = http.client.HTTPConnection(url.hostname, url.port, timeout=timeout)
+    start = time.perf_counter()
+    try:
+        connection.request(
+            "POST",
+            url.path.rstrip("/") + ENDPOINTS[scenario.endpoint],
+            body=scenario.body,
+            headers={"Content-Type": scenario.content_type},
+        )
+        response = connection.getresponse()
+        response.read()
+        ok = response.status < 400
+    except (OSError, http.client.HTTPException):
+        ok = False
+    finally:
+        connection.close()
+    return ok, time.perf_counter() - start
+
+
+def run_load(
+    base_url: str,
+    scenarios: List[Scenario],
+    requests: int,
+    concurrency: int,
+    seed: int = 0,
+) -> Tuple[Results, float]:
+    """Send ``requests`` randomly drawn scenarios; returns the results and wall time."""
+    rng = random.Random(seed)
+    plan = [rng.choice(scenarios) for _ in range(requests)]
+    results = Results()
+
+    def worker(scenario):
+        ok, latency = send(base_url, scenario)
+        results.record(scenario.name, latency, ok)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, plan))
+    return results, time.perf_counter() - start
+
+
+def rss_kib(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def child_pids(pid: int) -> List[int]:
+    children = []
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return children
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat:
+                # The command name may contain spaces, the parent pid follows it
+                parent = int(stat.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if parent == pid:
+            children.append(int(entry))
+    return children
+
+
+class RssMonitor:
+    """Samples the peak RSS of a server process and each of its workers."""
+
+    def __init__(self, pid: int, interval: float = 0.2) -> None:
+        self.pid = pid
+        self.interval = interval
+        self.peaks: Dict[int, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            for pid in [self.pid] + child_pids(self.pid):
+                self.peaks[pid] = max(self.peaks.get(pid, 0), rss_kib(pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(server: str, workers: int, port: int) -> subprocess.Popen:
+    if server == "gunicorn":
+        command = [
+            sys.executable, "-m", "gunicorn", "CipherNest.wsgi:application",
+            "--bind", f"127.0.0.1:{port}", "--workers", str(workers),
+            "--timeout", "120",
+        ]
+    elif server == "uvicorn":
+        command = [
+            sys.executable, "-m", "uvicorn", "CipherNest.asgi:application",
+            "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers),
+        ]
+    else:
+        raise ValueError(f"Invalid server {server}")
+    return subprocess.Popen(
+        command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def wait_for_port(port: int, process: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Server exited during startup")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("Server did not start listening in time")
@@ -0,0 +1,155 @@
+"""
+Per-request memory accounting.
+
+``MemoryMiddleware`` attaches a MemoryTracker to the request thread and
+views wrap their pipeline stages (decode, embed, encode, extract, zip) in
+``stage()``. With ``MEMORY_TRACKING`` on, tracemalloc measures the peak
+Python allocation of each stage above the request's baseline; the RSS
+growth of the process is recorded either way.
+
+``MEMORY_BUDGET`` (bytes) is checked when a stage ends: the request fails
+with MemoryBudgetExceededError before its next stage, but the stage that
+went over the budget has already allocated the memory. It stops runaway
+requests from going on, it does not cap their peak.
+
+tracemalloc and RSS are process-wide, so with threaded workers the
+numbers of concurrent requests overlap. The traced peak is only reset
+while a single request is tracked, so overlapping requests are charged
+for each other's allocations rather than losing their own.
+"""
+
+import os
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Dict
+
+from django.conf import settings
+
+from utils.exceptions import MemoryBudgetExceededError
+from utils.metrics import metrics
+
+metrics.describe("request_peak_traced_bytes", "Peak traced allocation per request stage")
+metrics.describe("request_rss_delta_bytes", "RSS growth per request stage")
+metrics.describe("memory_budget_exceeded_total", "Requests failed by the memory budget")
+
+_local = threading.local()
+# Requests being traced; tracemalloc has a single, process-wide peak
+_traced_requests = 0
+_traced_lock = threading.Lock()
+_page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * _page_size
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+class MemoryTracker:
+    def __init__(self, budget: int = 0, trace: bool = False) -> None:
+        self.budget = budget
+        self.trace = trace
+        self.stages: Dict[str, Dict[str, int]] = {}
+        self.start_rss = rss_bytes()
+        self.start_traced = 0
+        self.peak_traced = 0
+        self.exceeded = False
+        if trace:
+            global _traced_requests
+            with _traced_lock:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                _traced_requests += 1
+            self.reset_peak()
+            self.start_traced = tracemalloc.get_traced_memory()[0]
+
+    @staticmethod
+    def reset_peak() -> None:
+        # Resetting under another request's stage would hide that request's peak
+        with _traced_lock:
+            if _traced_requests == 1:
+                tracemalloc.reset_peak()
+
+    def _traced_peak(self) -> int:
+        if not self.trace:
+            return 0
+        return max(0, tracemalloc.get_traced_memory()[1] - self.start_traced)
+
+    @contextmanager
+    def stage(self, name: str):
+        rss_before = rss_bytes()
+        if self.trace:
+            self.reset_peak()
+        yield
+        peak = self._traced_peak()
+        self.peak_traced = max(self.peak_traced, peak)
+        self.stages[name] = {
+            "peak_traced": peak,
+            "rss_delta": rss_bytes() - rss_before,
+        }
+        self.check()
+
+    def usage(self) -> int:
+        # Traced allocations are precise; RSS growth is the fallback
+        if self.trace:
+            return max(self.peak_traced, self._traced_peak())
+        return rss_bytes() - self.start_rss
+
+    def check(self) -> None:
+        if self.budget and self.usage() > self.budget:
+            self.exceeded = True
+            raise MemoryBudgetExceededError()
+
+    def finish(self, view: str) -> None:
+        request_peak = max(self.peak_traced, self._traced_peak())
+        if self.trace:
+            global _traced_requests
+            with _traced_lock:
+                _traced_requests -= 1
+        stages = dict(self.stages)
+        stages["total"] = {
+            "peak_traced": request_peak,
+            "rss_delta": rss_bytes() - self.start_rss,
+        }
+        for name, usage in stages.items():
+            labels = {"view": view, "stage": name}
+            if self.trace:
+                metrics.observe("request_peak_traced_bytes", usage["peak_traced"], labels)
+            metrics.observe("request_rss_delta_bytes", usage["rss_delta"], labels)
+        if self.exceeded:
+            metrics.inc("memory_budget_exceeded_total", {"view": view})
+
+
+def current_tracker() -> MemoryTracker:
+    return getattr(_local, "tracker", None)
+
+
+def stage(name: str):
+    """Account the wrapped block to pipeline stage ``name`` of the current request."""
+    tracker = current_tracker()
+    if tracker is None:
+        return nullcontext()
+    return tracker.stage(name)
+
+
+class MemoryMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.MEMORY_TRACKING and not settings.MEMORY_BUDGET:
+            return self.get_response(request)
+
+        tracker = MemoryTracker(
+            budget=settings.MEMORY_BUDGET, trace=settings.MEMORY_TRACKING
+        )
+        _local.tracker = tracker
+        try:
+            return self.get_response(request)
+        finally:
+            _local.tracker = None
+            view = getattr(request.resolver_match, "url_name", None) or "unknown"
+            tracker.finish(view)
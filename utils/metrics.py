@@ -0,0 +1,121 @@
+"""
+In-process metrics in the Prometheus text format.
+
+Every worker process keeps its own values; scrape each worker or
+aggregate them in the collector.
+"""
+
+import copy
+import threading
+from typing import Dict, Tuple
+
+from django.http import HttpResponse
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
+
+PREFIX = "ciphernest_"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Summary:
+    def __init__(self) -> None:
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauges: Dict[str, Dict[Labels, float]] = {}
+        self.summaries: Dict[str, Dict[Labels, Summary]] = {}
+        self.help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _labels(labels: dict) -> Labels:
+        return tuple(sorted((labels or {}).items()))
+
+    def describe(self, name: str, help: str) -> None:
+        self.help[name] = help
+
+    def inc(self, name: str, labels: dict = None, value: float = 1) -> None:
+        key = self._labels(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, labels: dict = None) -> None:
+        with self._lock:
+            self.gauges.setdefault(name, {})[self._labels(labels)] = value
+
+    def observe(self, name: str, value: float, labels: dict = None) -> None:
+        key = self._labels(labels)
+        with self._lock:
+            self.summaries.setdefault(name, {}).setdefault(key, Summary()).observe(value)
+
+    def value(self, name: str, labels: dict = None):
+        key = self._labels(labels)
+        with self._lock:
+            for kind in (self.counters, self.gauges, self.summaries):
+                if key in kind.get(name, {}):
+                    value = kind[name][key]
+                    # A snapshot: observe() keeps updating the stored summary
+                    return copy.copy(value) if isinstance(value, Summary) else value
+        return None
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.summaries.clear()
+
+    @staticmethod
+    def _format(name: str, labels: Labels, value: float) -> str:
+        if labels:
+            pairs = ",".join(f'{key}="{label}"' for key, label in labels)
+            return f"{PREFIX}{name}{{{pairs}}} {value}\n"
+        return f"{PREFIX}{name} {value}\n"
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for kind, type_name in ((self.counters, "counter"), (self.gauges, "gauge")):
+                for name, series in sorted(kind.items()):
+                    if name in self.help:
+                        lines.append(f"# HELP {PREFIX}{name} {self.help[name]}\n")
+                    lines.append(f"# TYPE {PREFIX}{name} {type_name}\n")
+                    for labels, value in sorted(series.items()):
+                        lines.append(self._format(name, labels, value))
+            for name, series in sorted(self.summaries.items()):
+                if name in self.help:
+                    lines.append(f"# HELP {PREFIX}{name} {self.help[name]}\n")
+                lines.append(f"# TYPE {PREFIX}{name} summary\n")
+                for labels, summary in sorted(series.items()):
+                    lines.append(self._format(f"{name}_count", labels, summary.count))
+                    lines.append(self._format(f"{name}_sum", labels, summary.sum))
+                # A summary has no max sample; it is a gauge family of its own
+                lines.append(f"# HELP {PREFIX}{name}_max Largest observed {name}\n")
+                lines.append(f"# TYPE {PREFIX}{name}_max gauge\n")
+                for labels, summary in sorted(series.items()):
+                    lines.append(self._format(f"{name}_max", labels, summary.max))
+        return "".join(lines)
+
+
+metrics = Metrics()
+
+
+class MetricsView(APIView):
+    # Request volumes, timings and memory figures are for operators only
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(
+            metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
@@ -0,0 +1,177 @@
+import struct
+
+
+class PcmFormat:
+    def __init__(
+        self,
+        data_offset: int,
+        data_length: int,
+        sample_width: int,
+        channels: int,
+        frame_rate: int,
+        byteorder: str = "little",
+    ) -> None:
+        self.data_offset = data_offset
+        self.data_length = data_length
+        self.sample_width = sample_width
+        self.channels = channels
+        self.frame_rate = frame_rate
+        self.byteorder = byteorder
+
+    @property
+    def total_samples(self) -> int:
+        return self.data_length // self.sample_width
+
+    @property
+    def data_end(self) -> int:
+        return self.data_offset + self.data_length
+
+
+PCM_FORMATS = ("wav", "aiff")
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def parse_wav(buffer, total_length: int = None) -> PcmFormat:
+    if len(buffer) < 12 or buffer[0:4] != b"RIFF" or buffer[8:12] != b"WAVE":
+        raise ValueError("Invalid WAV file: RIFF/WAVE signature not found")
+
+    total_length = len(buffer) if total_length is None else total_length
+    fmt = None
+    index = 12
+    while index + 8 <= len(buffer):
+        chunk_id = bytes(buffer[index : index + 4])
+        (chunk_size,) = struct.unpack("<I", buffer[index + 4 : index + 8])
+        body = index + 8
+        if chunk_id == b"fmt ":
+            format_tag, channels, frame_rate = struct.unpack(
+                "<HHI", buffer[body : body + 8]
+            )
+            (bits_per_sample,) = struct.unpack("<H", buffer[body + 14 : body + 16])
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 26:
+                (format_tag,) = struct.unpack("<H", buffer[body + 24 : body + 26])
+            if format_tag != WAVE_FORMAT_PCM:
+                raise ValueError(f"Unsupported WAV format tag {format_tag}")
+            fmt = (channels, frame_rate, (bits_per_sample + 7) // 8)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("Invalid WAV file: data chunk before fmt chunk")
+            channels, frame_rate, sample_width = fmt
+            data_length = min(chunk_size, total_length - body)
+            data_length -= data_length % sample_width
+            return PcmFormat(
+                data_offset=body,
+                data_length=data_length,
+                sample_width=sample_width,
+                channels=channels,
+                frame_rate=frame_rate,
+            )
+        index = body + chunk_size + (chunk_size & 1)
+
+    raise ValueError("Invalid WAV file: data chunk not found")
+
+
+def _extended_to_int(data: bytes) -> int:
+    # 80-bit IEEE 754 extended precision, as used for the AIFF sample rate
+    exponent, mantissa = struct.unpack(">HQ", data)
+    sign = -1 if exponent & 0x8000 else 1
+    exponent = (exponent & 0x7FFF) - 16383 - 63
+    return sign * int(mantissa * 2.0**exponent)
+
+
+def parse_aiff(buffer, total_length: int = None) -> PcmFormat:
+    if len(buffer) < 12 or buffer[0:4] != b"FORM" or buffer[8:12] not in (b"AIFF", b"AIFC"):
+        raise ValueError("Invalid AIFF file: FORM/AIFF signature not found")
+
+    total_length = len(buffer) if total_length is None else total_length
+    comm = None
+    byteorder = "big"
+    index = 12
+    while index + 8 <= len(buffer):
+        chunk_id = bytes(buffer[index : index + 4])
+        (chunk_size,) = struct.unpack(">I", buffer[index + 4 : index + 8])
+        body = index + 8
+        if chunk_id == b"COMM":
+            channels, _, bits_per_sample = struct.unpack(">HIH", buffer[body : body + 8])
+            frame_rate = _extended_to_int(bytes(buffer[body + 8 : body + 18]))
+            if buffer[8:12] == b"AIFC":
+                compression = bytes(buffer[body + 18 : body + 22])
+                if compression == b"sowt":
+                    byteorder = "little"
+                elif compression != b"NONE":
+                    raise ValueError(f"Unsupported AIFF-C compression {compression!r}")
+            comm = (channels, frame_rate, (bits_per_sample + 7) // 8)
+        elif chunk_id == b"SSND":
+            if comm is None:
+                raise ValueError("Invalid AIFF file: SSND chunk before COMM chunk")
+            channels, frame_rate, sample_width = comm
+            (offset,) = struct.unpack(">I", buffer[body : body + 4])
+            data_offset = body + 8 + offset
+            data_length = min(chunk_size - 8 - offset, total_length - data_offset)
+            data_length -= data_length % sample_width
+            return PcmFormat(
+                data_offset=data_offset,
+                data_length=data_length,
+                sample_width=sample_width,
+                channels=channels,
+                frame_rate=frame_rate,
+                byteorder=byteorder,
+            )
+        index = body + chunk_size + (chunk_size & 1)
+
+    raise ValueError("Invalid AIFF file: SSND chunk not found")
+
+
+def parse_pcm(buffer, format: str, total_length: int = None) -> PcmFormat:
+    """
+    Locate the sample data of a WAV/AIFF file.
+
+    ``buffer`` may be only a prefix of the file, as long as it reaches the
+    data chunk header; ``total_length`` is then the size of the whole file.
+    """
+    if format == "wav":
+        return parse_wav(buffer, total_length)
+    if format == "aiff":
+        return parse_aiff(buffer, total_length)
+    raise ValueError(f"Unsupported PCM container {format}")
+
+
+def set_chunk_sizes(buffer: bytearray, format: str) -> None:
+    """
+    Fill in the container and data chunk sizes of a WAV/AIFF file.
+
+    A muxer writing to a pipe cannot seek back to them, so they are left as
+    placeholders; the data is taken to run to the end of ``buffer``.
+    """
+    if format == "wav":
+        byteorder, container, data_chunk = "<", b"RIFF", b"data"
+    elif format == "aiff":
+        byteorder, container, data_chunk = ">", b"FORM", b"SSND"
+    else:
+        raise ValueError(f"Unsupported PCM container {format}")
+    if buffer[0:4] != container:
+        raise ValueError(f"Invalid {format.upper()} file: {container!r} not found")
+
+    struct.pack_into(f"{byteorder}I", buffer, 4, len(buffer) - 8)
+    comm = None
+    index = 12
+    while index + 8 <= len(buffer):
+        chunk_id = bytes(buffer[index : index + 4])
+        body = index + 8
+        if chunk_id == data_chunk:
+            struct.pack_into(f"{byteorder}I", buffer, index + 4, len(buffer) - body)
+            if comm is not None:
+                # AIFF also counts the sample frames in the COMM chunk
+                channels, _, bits_per_sample = struct.unpack(">HIH", buffer[comm : comm + 8])
+                (offset,) = struct.unpack(">I", buffer[body : body + 4])
+                frame_size = channels * ((bits_per_sample + 7) // 8)
+                frames = (len(buffer) - body - 8 - offset) // frame_size
+                struct.pack_into(">I", buffer, comm + 2, frames)
+            return
+        if chunk_id == b"COMM":
+            comm = body
+        (chunk_size,) = struct.unpack(f"{byteorder}I", buffer[index + 4 : index + 8])
+        index = body + chunk_size + (chunk_size & 1)
+
+    raise ValueError(f"Invalid {format.upper()} file: data chunk not found")
@@ -0,0 +1,88 @@
+"""
+Staged pipelines: a source and a chain of transform stages, each running
+in its own thread and connected by bounded queues.
+
+Iterating a Pipeline yields the output of the last stage while the
+earlier stages keep working ahead, at most ``queue_size`` items per
+queue. File and socket I/O, zlib and AES release the GIL, so the stages
+overlap with whatever the consumer is doing. An exception in any stage is
+re-raised to the consumer, and a consumer that stops early (a closed
+response) stops every stage.
+"""
+
+import queue
+import threading
+from typing import Callable, Iterable, Iterator
+
+_DONE = object()
+PUT_TIMEOUT = 0.1
+
+
+class _Failure:
+    def __init__(self, exception: BaseException) -> None:
+        self.exception = exception
+
+
+class PipelineCancelled(Exception):
+    pass
+
+
+class Pipeline:
+    def __init__(
+        self,
+        source: Iterable,
+        *stages: Callable[[Iterator], Iterator],
+        queue_size: int = 4,
+    ) -> None:
+        self.source = source
+        self.stages = stages
+        self.queue_size = queue_size
+        self.cancelled = threading.Event()
+        self.threads = []
+
+    def _put(self, output: queue.Queue, item) -> None:
+        while not self.cancelled.is_set():
+            try:
+                output.put(item, timeout=PUT_TIMEOUT)
+                return
+            except queue.Full:
+                pass
+        raise PipelineCancelled()
+
+    def _drain(self, input: queue.Queue) -> Iterator:
+        while True:
+            item = input.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.exception
+            yield item
+
+    def _run(self, items: Callable[[], Iterable], output: queue.Queue) -> None:
+        try:
+            for item in items():
+                self._put(output, item)
+            self._put(output, _DONE)
+        except PipelineCancelled:
+            pass
+        except BaseException as e:
+            try:
+                self._put(output, _Failure(e))
+            except PipelineCancelled:
+                pass
+
+    def _start(self, items: Callable[[], Iterable], output: queue.Queue) -> None:
+        thread = threading.Thread(target=self._run, args=(items, output), daemon=True)
+        self.threads.append(thread)
+        thread.start()
+
+    def __iter__(self) -> Iterator:
+        output = queue.Queue(self.queue_size)
+        self._start(lambda: self.source, output)
+        for stage in self.stages:
+            input, output = output, queue.Queue(self.queue_size)
+            self._start(lambda stage=stage, input=input: stage(self._drain(input)), output)
+        try:
+            yield from self._drain(output)
+        finally:
+            self.cancelled.set()
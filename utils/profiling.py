@@ -0,0 +1,186 @@
+"""
+Opt-in sampling profiler for requests.
+
+With ``PROFILING_ENABLED`` set, a request is profiled when it is picked at
+``PROFILING_SAMPLE_RATE`` or carries the ``X-Profile`` header, which only
+counts from a staff user or when it holds ``PROFILING_SECRET``. A helper
+thread records the stack of the request thread every
+``PROFILING_INTERVAL`` seconds, so the view itself runs uninstrumented,
+and the stacks are written to ``PROFILING_DIR`` as collapsed stacks
+(flamegraph.pl, speedscope) or speedscope JSON, keeping the newest
+``PROFILING_MAX_FILES``.
+"""
+
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+
+PROFILE_HEADER = "X-Profile"
+
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.stacks = Counter()
+        self.thread_id = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self.thread_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(
+            f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+    def speedscope(self, name: str) -> dict:
+        frames = []
+        indexes = {}
+        samples = []
+        weights = []
+        for stack, count in self.stacks.items():
+            sample = []
+            for frame in stack:
+                if frame not in indexes:
+                    indexes[frame] = len(frames)
+                    frames.append({"name": frame})
+                sample.append(indexes[frame])
+            samples.append(sample)
+            weights.append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            ],
+        }
+
+
+def request_tags(request) -> dict:
+    """Cover format, quality and payload size of an upload request."""
+    files = request.FILES
+    cover = files.get("cover_file") or files.get("embedded_file")
+    cover_format = "none"
+    if cover:
+        cover_format = os.path.splitext(cover.name)[1][1:].lower() or "unknown"
+    return {
+        "format": cover_format,
+        "quality": request.POST.get("output_quality") or "none",
+        "payload": sum(file.size for file in files.getlist("secret_files")),
+    }
+
+
+def may_request_profile(request) -> bool:
+    value = request.headers.get(PROFILE_HEADER)
+    if not value:
+        return False
+    user = getattr(request, "user", None)
+    if user is not None and user.is_staff:
+        return True
+    secret = settings.PROFILING_SECRET
+    return bool(secret) and hmac.compare_digest(value.encode(), secret.encode())
+
+
+def should_profile(request) -> bool:
+    if not settings.PROFILING_ENABLED:
+        return False
+    if may_request_profile(request):
+        return True
+    return random.random() < settings.PROFILING_SAMPLE_RATE
+
+
+def rotate(directory: str, keep: int) -> None:
+    """Delete the oldest files of ``directory`` beyond the newest ``keep``."""
+    entries = []
+    with os.scandir(directory) as scan:
+        for entry in scan:
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except OSError:
+                pass
+    entries.sort(reverse=True)
+    for _, path in entries[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not should_profile(request):
+            return self.get_response(request)
+
+        profiler = SamplingProfiler(settings.PROFILING_INTERVAL)
+        start_time = time.perf_counter()
+        profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+        duration = time.perf_counter() - start_time
+
+        path = self.write_profile(profiler, request, duration)
+        response["X-Profile-File"] = os.path.basename(path)
+        return response
+
+    def write_profile(self, profiler: SamplingProfiler, request, duration: float) -> str:
+        tags = request_tags(request)
+        view = request.path.strip("/").replace("/", "-") or "root"
+        name = (
+            f"{time.strftime('%Y%m%dT%H%M%S')}-{view}-{tags['format']}-"
+            f"{tags['quality']}-{tags['payload']}B-{int(duration * 1000)}ms-"
+            f"{uuid.uuid4().hex[:6]}"
+        )
+        os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+        if settings.PROFILING_FORMAT == "speedscope":
+            path = os.path.join(settings.PROFILING_DIR, f"{name}.speedscope.json")
+            with open(path, "w") as file:
+                json.dump(profiler.speedscope(name), file)
+        else:
+            path = os.path.join(settings.PROFILING_DIR, f"{name}.folded")
+            with open(path, "w") as file:
+                file.write(profiler.collapsed())
+        rotate(settings.PROFILING_DIR, settings.PROFILING_MAX_FILES)
+        return path
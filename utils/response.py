@@ -14,13 +14,16 @@ def custom_exception_handler(exc: Any, context: Any = None):
     if isinstance(exc, BaseCustomException) or issubclass(
         type(exc), BaseCustomException
     ):
-        return Response(
+        response = Response(
             {
                 "code": exc.code,
                 "message": exc.message,
             },
             status=exc.status_code,
         )
+        if getattr(exc, "retry_after", None):
+            response["Retry-After"] = str(exc.retry_after)
+        return response
 
     if isinstance(exc, ValidationError):
         return Response(
@@ -0,0 +1,141 @@
+"""
+Cost-based admission control.
+
+Every upload gets an up-front cost estimate, in milliseconds of worker
+time, from its size, quality, secret file count and password. Requests
+cheaper than ``SCHEDULER_HEAVY_COST`` run in the light lane, the rest in
+the heavy lane; each lane runs a bounded number of requests at once and
+queues a bounded number more. A request arriving at a full lane fails
+with ServerBusyError (429 with Retry-After), so capacity checks keep
+their own slots while an embed storm fills the heavy lane.
+
+Lanes are per process: they only separate work when a worker serves
+several requests at once (gthread workers, uvicorn).
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import setting_changed
+
+from utils.exceptions import ServerBusyError
+from utils.metrics import metrics
+
+MIB = 1024 * 1024
+# Rough per-request costs in milliseconds, measured on the bytes engine
+DECODE_COST_PER_MIB = 10
+EMBED_COST_PER_MIB = 4
+PBKDF2_COST = 50
+
+metrics.describe("scheduler_rejected_total", "Requests rejected by a full lane")
+metrics.describe("scheduler_wait_seconds", "Time spent queued for a lane")
+
+
+def estimate_cost(
+    upload_size: int,
+    payload_size: int = 0,
+    bits_per_sample: int = 2,
+    file_count: int = 0,
+    encrypted: bool = False,
+) -> float:
+    """Estimated worker time of a request, in milliseconds."""
+    cost = upload_size / MIB * DECODE_COST_PER_MIB
+    # Fewer bits per sample spread the payload over more samples
+    cost += payload_size / MIB * (8 / bits_per_sample) * EMBED_COST_PER_MIB
+    if encrypted:
+        # One key derivation per secret file
+        cost += max(file_count, 1) * PBKDF2_COST
+    return cost
+
+
+class Lane:
+    def __init__(self, name: str, workers: int, queue_size: int) -> None:
+        self.name = name
+        self.workers = workers
+        self.limit = workers + queue_size
+        self.pending = 0
+        self.average_duration = 1.0
+        self._slots = threading.Semaphore(workers)
+        self._lock = threading.Lock()
+
+    def retry_after(self) -> int:
+        waiting = max(self.pending - self.workers, 0) + 1
+        return max(1, math.ceil(self.average_duration * waiting / max(self.workers, 1)))
+
+    @contextmanager
+    def admit(self):
+        with self._lock:
+            if self.pending >= self.limit:
+                metrics.inc("scheduler_rejected_total", {"lane": self.name})
+                raise ServerBusyError(retry_after=self.retry_after())
+            self.pending += 1
+        try:
+            queued_at = time.perf_counter()
+            with self._slots:
+                started_at = time.perf_counter()
+                metrics.observe(
+                    "scheduler_wait_seconds", started_at - queued_at, {"lane": self.name}
+                )
+                yield self
+                duration = time.perf_counter() - started_at
+            with self._lock:
+                self.average_duration = 0.8 * self.average_duration + 0.2 * duration
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+
+class Scheduler:
+    def __init__(
+        self,
+        light_workers: int,
+        light_queue: int,
+        heavy_workers: int,
+        heavy_queue: int,
+        heavy_cost: float,
+    ) -> None:
+        self.light = Lane("light", light_workers, light_queue)
+        self.heavy = Lane("heavy", heavy_workers, heavy_queue)
+        self.heavy_cost = heavy_cost
+
+    def lane(self, cost: float) -> Lane:
+        return self.heavy if cost >= self.heavy_cost else self.light
+
+    def admit(self, cost: float):
+        return self.lane(cost).admit()
+
+
+_scheduler = None
+_lock = threading.Lock()
+
+
+def get_scheduler() -> Scheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _lock:
+            if _scheduler is None:
+                _scheduler = Scheduler(
+                    light_workers=settings.SCHEDULER_LIGHT_WORKERS,
+                    light_queue=settings.SCHEDULER_LIGHT_QUEUE,
+                    heavy_workers=settings.SCHEDULER_HEAVY_WORKERS,
+                    heavy_queue=settings.SCHEDULER_HEAVY_QUEUE,
+                    heavy_cost=settings.SCHEDULER_HEAVY_COST,
+                )
+    return _scheduler
+
+
+def admit(cost: float):
+    """Run the wrapped block in the lane matching ``cost``."""
+    return get_scheduler().admit(cost)
+
+
+def _reset(setting, **kwargs):
+    global _scheduler
+    if setting.startswith("SCHEDULER_"):
+        _scheduler = None
+
+
+setting_changed.connect(_reset)
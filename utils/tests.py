@@ -1,7 +1,19 @@
+import array
+import math
 import os
+import shutil
+import socket
+import struct
+import tempfile
+import time
+import tracemalloc
+import unittest
+import zipfile
 from io import BytesIO
-from django.http import Http404
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.http import Http404, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
 from utils.constants import Code
 from utils.format import file_extension
 from rest_framework.test import APITestCase
@@ -13,7 +25,7 @@ from utils.response import custom_exception_handler, standard_response
 from unittest.mock import patch, MagicMock
 from lsb.models import ExtractedPayload
 from utils.exceptions import RequirePasswordError
-from utils.zip import Zip 
+from utils.zip import STORED_ENTROPY, Zip, sample_entropy
 from utils.exceptions import (
     BaseCustomException,
     RunOutOfFreeSpaceError,
@@ -21,8 +33,35 @@ from utils.exceptions import (
     RequirePasswordError,
     WrongPasswordError,
     DataCorruptedError,
+    ServerBusyError,
+    RequestCancelledError,
 )
 from utils.endec import EnDec 
+from utils.profiling import SamplingProfiler
+from utils.metrics import Metrics, metrics
+from utils.cancellation import (
+    SCOPE_KEY,
+    CancellableASGIHandler,
+    CancellationMiddleware,
+    DisconnectMonitor,
+    client_gone,
+)
+from lsb.cancel import CANCEL_CHUNK_SIZE, CancelToken, bind, cancel_scope, checkpoint, current_token
+from utils.scheduler import Lane, Scheduler, estimate_cost
+from utils.pipeline import Pipeline
+import threading
+from utils.audio import Cover, FfmpegCover, FlacCover, PcmCover, PcmFileCover, open_cover, open_cover_file, read_samples
+from utils.flac import FlacSamples, FlacStream, set_total_samples, write_verbatim_flac
+from utils.pcm import parse_pcm, parse_wav, set_chunk_sizes
+from utils import ffmpeg
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from utils.memory import MemoryTracker
+from testing.artifacts import TemporaryArtifactsMixin
+from testing.audio import make_wav
+from lsb.file import File
+from lsb.lsb import LSBSteganography
+from lsb.samples import LazySamples, PcmSamples, SampleBuffer
 
 class FileExtensionTest(TestCase):
     def test_valid_extension(self):
@@ -141,6 +180,7 @@ class ZipUtilTestCase(TestCase):
     @patch('utils.zip.File')
     def test_create_zip_with_user_password_and_compression(self, mock_file):
         response_data = MagicMock(spec=ExtractedPayload)
+        response_data.is_solid.return_value = False
         response_data.is_encrypted.return_value = True
         response_data.is_compressed.return_value = True
         response_data.extracted_files = [('file1.txt', b'file data 1')]
@@ -157,6 +197,7 @@ class ZipUtilTestCase(TestCase):
     @patch('utils.zip.File')
     def test_create_zip_with_user_password_no_password(self, mock_file):
         response_data = MagicMock(spec=ExtractedPayload)
+        response_data.is_solid.return_value = False
         response_data.is_encrypted.return_value = True
         response_data.is_compressed.return_value = False
         response_data.extracted_files = [('file1.txt', b'file data 1')]
@@ -169,6 +210,7 @@ class ZipUtilTestCase(TestCase):
     @patch('utils.zip.File')
     def test_create_zip_without_user_password_and_compression(self, mock_file):
         response_data = MagicMock(spec=ExtractedPayload)
+        response_data.is_solid.return_value = False
         response_data.is_encrypted.return_value = False
         response_data.is_compressed.return_value = False
         response_data.extracted_files = [('file1.txt', b'file data 1')]
@@ -181,6 +223,7 @@ class ZipUtilTestCase(TestCase):
     @patch('utils.zip.File')
     def test_create_zip_without_user_password_with_compression(self, mock_file):
         response_data = MagicMock(spec=ExtractedPayload)
+        response_data.is_solid.return_value = False
         response_data.is_encrypted.return_value = False
         response_data.is_compressed.return_value = True
         response_data.extracted_files = [('file1.txt', b'file data 1')]
@@ -194,6 +237,38 @@ class ZipUtilTestCase(TestCase):
 
         mock_file.decompress.assert_called_once_with(b'file data 1')
 
+    def test_create_zip_stores_incompressible_entries(self):
+        files = [
+            ('notes.txt', b'plain text compresses well ' * 2000),
+            ('photo.jpg', os.urandom(50000)),
+            ('empty.txt', b''),
+            ('résumé.txt', b'r\xc3\xa9sum\xc3\xa9'),
+        ] * 3
+        files = [(f'{i}-{name}', data) for i, (name, data) in enumerate(files)]
+        response_data = MagicMock(spec=ExtractedPayload)
+        response_data.is_solid.return_value = False
+        response_data.is_encrypted.return_value = False
+        response_data.is_compressed.return_value = False
+        response_data.extracted_files = files
+
+        result = Zip().create_zip(response_data)
+
+        with zipfile.ZipFile(result) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.namelist(), [name for name, _ in files])
+            for name, data in files:
+                self.assertEqual(archive.read(name), data)
+            types = {info.filename.split('-', 1)[1]: info.compress_type for info in archive.infolist()}
+        self.assertEqual(types['notes.txt'], zipfile.ZIP_DEFLATED)
+        self.assertEqual(types['photo.jpg'], zipfile.ZIP_STORED)
+        self.assertTrue(result.getvalue().startswith(b'PK\x03\x04'))
+        self.assertTrue(result.getvalue()[-22:].startswith(b'PK\x05\x06'))
+
+    def test_sample_entropy(self):
+        self.assertEqual(sample_entropy(b''), 0.0)
+        self.assertAlmostEqual(sample_entropy(b'ab' * 100), 1.0)
+        self.assertGreater(sample_entropy(os.urandom(1 << 20)), STORED_ENTROPY)
+
 
 class CustomExceptionTests(TestCase):
 
@@ -280,3 +355,738 @@ class EnDecTests(TestCase):
     def test_decrypt_invalid_data(self):
         with self.assertRaises(ValueError):  
             self.encryption_util.decrypt_data(self.passphrase, b"invalid_data")
+
+
+def make_aiff(frames: bytes, sample_width: int = 2, channels: int = 2) -> bytes:
+    # 44100 Hz as an 80-bit extended float
+    sample_rate = bytes.fromhex("400eac44000000000000")
+    comm = struct.pack(
+        ">HIH", channels, len(frames) // (sample_width * channels), sample_width * 8
+    ) + sample_rate
+    ssnd = struct.pack(">II", 0, 0) + frames
+    body = b"AIFF"
+    for chunk_id, chunk in ((b"COMM", comm), (b"SSND", ssnd)):
+        body += chunk_id + struct.pack(">I", len(chunk)) + chunk
+    return b"FORM" + struct.pack(">I", len(body)) + body
+
+
+class PcmTests(TestCase):
+    def test_parse_wav(self):
+        data = make_wav(bytes(600), sample_width=3)
+        pcm = parse_wav(data)
+        self.assertEqual(pcm.sample_width, 3)
+        self.assertEqual(pcm.channels, 2)
+        self.assertEqual(pcm.frame_rate, 44100)
+        self.assertEqual(pcm.total_samples, 200)
+        self.assertEqual(data[pcm.data_offset : pcm.data_end], bytes(600))
+
+    def test_parse_aiff(self):
+        pcm = parse_pcm(make_aiff(bytes(800)), "aiff")
+        self.assertEqual(pcm.byteorder, "big")
+        self.assertEqual(pcm.frame_rate, 44100)
+        self.assertEqual(pcm.total_samples, 400)
+
+    def test_parse_invalid(self):
+        with self.assertRaises(ValueError):
+            parse_wav(b"not a wav file")
+
+
+class AudioCoverTests(TestCase):
+    def test_pcm_cover_edits_only_low_bytes(self):
+        frames = bytes(range(256)) * 150
+        for format, make, width in (
+            ("wav", make_wav, 3),
+            ("wav", make_wav, 1),
+            ("aiff", make_aiff, 3),
+        ):
+            cover = open_cover(make(frames[: len(frames) - len(frames) % (2 * width)], width), format)
+            self.assertIsInstance(cover, PcmCover)
+            original = cover.samples.tobytes()
+            secret_files = [File(name="a.txt", size=5, data=b"hello")]
+            stego = LSBSteganography()
+            stego.embed(samples=cover.samples, secret_files=secret_files, quality="very_low")
+
+            edited = cover.samples.tobytes()
+            offset = cover.samples.offset
+            for i in range(width):
+                if i != offset:
+                    self.assertEqual(edited[i::width], original[i::width])
+
+            reopened = open_cover(cover.export().getvalue(), format)
+            payload = stego.extract_data(reopened.samples)
+            self.assertEqual(payload.extracted_files, [("a.txt", b"hello")])
+
+    def test_read_samples_reads_only_prefix(self):
+        frames = bytes(range(256)) * 8192
+        cover = open_cover(make_wav(frames), "wav")
+        stego = LSBSteganography()
+        secret_files = [File(name="a.txt", size=5, data=b"hello")]
+        stego.embed(samples=cover.samples, secret_files=secret_files, quality="medium")
+
+        file = BytesIO(cover.export().getvalue())
+        samples = read_samples(file, "wav")
+        self.assertEqual(len(samples), len(frames) // 2)
+        self.assertTrue(stego.get_header_blocks(samples=samples))
+        payload = stego.extract_data(samples)
+        self.assertEqual(payload.extracted_files, [("a.txt", b"hello")])
+        self.assertLess(samples.filled, len(frames) // 4)
+        self.assertLess(len(samples.raw), len(frames) // 2)
+
+    def test_pcm_samples_grow_with_reads(self):
+        data = bytes(range(256)) * 4096
+        # A data chunk that claims far more than the prefix ever read
+        samples = PcmSamples(BytesIO(data), 0, 500 * 1024 * 1024, 2, "little")
+        self.assertEqual(len(samples), 250 * 1024 * 1024)
+        self.assertEqual(len(samples.raw), 0)
+
+        self.assertEqual(samples[1000], data[2000])
+        self.assertEqual(len(samples.raw), PcmSamples.chunk_size)
+
+        samples[PcmSamples.chunk_size // 2] = 7
+        self.assertEqual(len(samples.raw), 2 * PcmSamples.chunk_size)
+        self.assertEqual(samples.raw[:2000], data[:2000])
+        self.assertEqual(samples[PcmSamples.chunk_size // 2], 7)
+
+        with self.assertRaises(IndexError):
+            samples[len(data)]
+
+    def test_covers_need_an_exporter(self):
+        class Incomplete(Cover):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete(SampleBuffer(bytearray(4), 2), "wav")
+
+    def test_lazy_samples_need_a_decoder(self):
+        class Incomplete(LazySamples):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete(0)
+
+
+def make_float_wav(samples, channels: int = 2) -> bytes:
+    # IEEE float WAV, which the native parser leaves to the decoder backends
+    frames = struct.pack(f"<{len(samples)}f", *samples)
+    fmt = struct.pack("<HHIIHH", 3, channels, 44100, 44100 * channels * 4, channels * 4, 32)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+    body += b"data" + struct.pack("<I", len(frames)) + frames
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+class FfmpegTests(TestCase):
+    def test_parse_stream_info(self):
+        for line, expected in (
+            ("Stream #0:0: Audio: flac, 44100 Hz, stereo, s32 (24 bit)\n", (44100, 2, 3)),
+            ("Stream #0:0: Audio: mp3 (mp3float), 48000 Hz, mono, fltp, 128 kb/s\n", (48000, 1, 2)),
+            ("Stream #0:0: Audio: pcm_u8, 8000 Hz, 6 channels, u8, 384 kb/s\n", (8000, 6, 1)),
+            ("Stream #0:0: Audio: flac, 96000 Hz, 5.1, s16\n", (96000, 6, 2)),
+        ):
+            info = ffmpeg.parse_stream_info(line)
+            self.assertEqual((info.frame_rate, info.channels, info.sample_width), expected)
+        with self.assertRaises(ffmpeg.FfmpegError):
+            ffmpeg.parse_stream_info("pipe:0: Invalid data found when processing input")
+
+    def test_set_chunk_sizes(self):
+        for format, make, sizes in (
+            ("wav", make_wav, b"\xff\xff\xff\xff"),
+            ("aiff", make_aiff, bytes(4)),
+        ):
+            data = make(bytes(range(256)) * 4)
+            broken = bytearray(data)
+            pcm = parse_pcm(data, format)
+            broken[4:8] = sizes
+            size_offset = pcm.data_offset - (12 if format == "aiff" else 4)
+            broken[size_offset : size_offset + 4] = sizes
+            if format == "aiff":
+                broken[22:26] = sizes
+            set_chunk_sizes(broken, format)
+            self.assertEqual(bytes(broken), data)
+
+    def test_falls_back_to_pydub(self):
+        cover = make_float_wav([0.5, -0.5] * 100)
+        with override_settings(FFMPEG_BINARY="/nonexistent/ffmpeg"), patch(
+            "utils.audio.PydubCover"
+        ) as pydub_cover:
+            self.assertIs(open_cover(cover, "wav"), pydub_cover.return_value)
+        with override_settings(AUDIO_BACKEND="pydub"), patch(
+            "utils.audio.PydubCover"
+        ) as pydub_cover, patch("utils.ffmpeg.run") as run:
+            self.assertIs(open_cover(cover, "wav"), pydub_cover.return_value)
+            run.assert_not_called()
+
+    def fake_ffmpeg(self, script):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "ffmpeg")
+        with open(path, "w") as binary:
+            binary.write("#!/bin/sh\n" + script + "\n")
+        os.chmod(path, 0o755)
+        return override_settings(FFMPEG_BINARY=path)
+
+    def test_encode_chunks_streams_the_output(self):
+        # Copying stdin to stdout stands in for an encoder
+        pcm = bytearray(write_verbatim_flac([0] * 20000, channels=2, sample_rate=44100))
+        set_total_samples(pcm, 0)
+        info = ffmpeg.StreamInfo(44100, 2, 2)
+        with self.fake_ffmpeg("cat"):
+            blocks = list(ffmpeg.encode_chunks(pcm, "flac", info, block_size=4096))
+        self.assertGreater(len(blocks), 2)
+        output = b"".join(blocks)
+        self.assertEqual(len(output), len(pcm))
+        self.assertEqual(FlacStream(output).streaminfo.total_samples, len(pcm) // 4)
+
+        with self.fake_ffmpeg("cat; exit 1"), self.assertRaises(ffmpeg.FfmpegError):
+            list(ffmpeg.encode_chunks(pcm, "ogg", info))
+
+    def test_closing_a_stream_kills_ffmpeg(self):
+        with self.fake_ffmpeg("cat; sleep 60"):
+            blocks = ffmpeg.stream([], bytes(1024))
+            self.assertEqual(next(blocks), bytes(1024))
+            started = time.monotonic()
+            blocks.close()
+        self.assertLess(time.monotonic() - started, 10)
+
+    @unittest.skipUnless(shutil.which(settings.FFMPEG_BINARY), "ffmpeg is not installed")
+    def test_float_wav_round_trip(self):
+        samples = [math.sin(i / 20) / 2 for i in range(20000)]
+        cover = open_cover(make_float_wav(samples), "wav")
+        self.assertIsInstance(cover, FfmpegCover)
+        self.assertEqual(cover.info.sample_width, 2)
+        self.assertEqual(len(cover.samples), len(samples))
+
+        stego = LSBSteganography()
+        secret_files = [File(name="a.txt", size=5, data=b"hello")]
+        stego.embed(samples=cover.samples, secret_files=secret_files, quality="medium")
+        exported = cover.export().getvalue()
+        # Re-encoded as 16-bit PCM, which the native parser reads back
+        reopened = open_cover(exported, "wav")
+        self.assertIsInstance(reopened, PcmCover)
+        self.assertEqual(reopened.samples.tobytes(), cover.samples.tobytes())
+        payload = stego.extract_data(reopened.samples)
+        self.assertEqual(payload.extracted_files, [("a.txt", b"hello")])
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+class FlacTests(TestCase):
+    def setUp(self):
+        # 4200 stereo frames encoded by libFLAC: one 4096-sample frame and a
+        # short final frame, LPC subframes with rice-coded residuals
+        with open(os.path.join(FIXTURES_DIR, "cover.flac"), "rb") as cover:
+            self.data = cover.read()
+        self.expected = []
+        for t in range(4200):
+            self.expected.append(int(3000 * math.sin(2 * math.pi * t / 50)) + (t * 7919) % 5 - 2)
+            self.expected.append(int(2000 * math.sin(2 * math.pi * t / 37)))
+
+    def test_decode(self):
+        samples = FlacSamples(FlacStream(self.data))
+        self.assertEqual(len(samples), 8400)
+        self.assertEqual(samples[10], self.expected[10])
+        self.assertEqual(len(samples.frames), 1)
+        self.assertEqual(list(samples.region(len(samples))), self.expected)
+
+    def test_embed_re_encodes_only_touched_frames(self):
+        cover = open_cover(self.data, "flac")
+        self.assertIsInstance(cover, FlacCover)
+        stego = LSBSteganography()
+        secret_files = [File(name="a.txt", size=5, data=b"hello")]
+        stego.embed(samples=cover.samples, secret_files=secret_files, quality="medium")
+        self.assertEqual(len(cover.samples.frames), 1)
+
+        output = cover.export().getvalue()
+        last_frame = FlacStream(self.data).decode_frame(
+            cover.samples.frames[0].end, 4096
+        )[0]
+        self.assertEqual(output[-last_frame.length :], self.data[-last_frame.length :])
+
+        reopened = FlacSamples(FlacStream(output))
+        decoded = list(reopened.region(len(reopened)))
+        self.assertEqual(decoded[1000:], self.expected[1000:])
+        payload = stego.extract_data(reopened)
+        self.assertEqual(payload.extracted_files, [("a.txt", b"hello")])
+
+    def test_write_verbatim_flac(self):
+        data = write_verbatim_flac(self.expected, channels=2, sample_rate=44100, block_size=1000)
+        samples = FlacSamples(FlacStream(data))
+        self.assertEqual(samples.stream.streaminfo.total_samples, 4200)
+        self.assertEqual(list(samples.region(len(samples))), self.expected)
+        self.assertEqual(len(samples.frames), 5)
+
+    def test_invalid_flac(self):
+        with self.assertRaises(ValueError):
+            FlacStream(b"not a flac file")
+
+    @patch("utils.audio.ffmpeg_enabled", return_value=True)
+    def test_long_flac_is_decoded_by_ffmpeg(self, _):
+        with patch("utils.audio.FfmpegCover") as ffmpeg_cover:
+            with override_settings(FLAC_NATIVE_MAX_SAMPLES=8400):
+                self.assertIsInstance(open_cover(self.data, "flac"), FlacCover)
+            with override_settings(FLAC_NATIVE_MAX_SAMPLES=8399):
+                self.assertIs(open_cover(self.data, "flac"), ffmpeg_cover.return_value)
+            # No total_samples in STREAMINFO: the length is only known after decoding
+            unsized = bytearray(self.data)
+            unsized[21] &= 0xF0
+            unsized[22:26] = bytes(4)
+            self.assertIs(open_cover(bytes(unsized), "flac"), ffmpeg_cover.return_value)
+
+    @patch("utils.audio.ffmpeg_enabled", return_value=True)
+    def test_read_samples_falls_back_past_the_native_limit(self, _):
+        decoded = MagicMock()
+        decoded.samples = array.array("i", self.expected)
+        with override_settings(FLAC_NATIVE_MAX_SAMPLES=4096):
+            with patch("utils.audio.decode_cover", return_value=decoded) as decode_cover:
+                samples = read_samples(BytesIO(self.data), "flac")
+                self.assertEqual(samples[10], self.expected[10])
+                self.assertEqual(list(samples.region(4096)[:4096]), self.expected[:4096])
+                decode_cover.assert_not_called()
+
+                self.assertEqual(samples[8000], self.expected[8000])
+                self.assertIs(samples.region(len(samples)), decoded.samples)
+                decode_cover.assert_called_once_with(self.data, "flac")
+
+
+class ProfilingTests(APITestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def post_cover(self, **headers):
+        cover_file = BytesIO(make_wav(bytes(40000)))
+        cover_file.name = "cover.wav"
+        secret_file = BytesIO(b"secret")
+        secret_file.name = "secret.txt"
+        return self.client.post(
+            reverse("cover-upload"),
+            {
+                "cover_file": cover_file,
+                "output_quality": "low",
+                "secret_files": [secret_file],
+            },
+            format="multipart",
+            **headers,
+        )
+
+    def test_profiles_requests_with_header(self):
+        with override_settings(
+            PROFILING_ENABLED=True,
+            PROFILING_SAMPLE_RATE=0,
+            PROFILING_DIR=self.tmpdir.name,
+            PROFILING_SECRET="s3cret",
+        ):
+            response = self.post_cover(HTTP_X_PROFILE="s3cret")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        filename = response["X-Profile-File"]
+        self.assertIn("covers-wav-low-6B-", filename)
+        self.assertTrue(filename.endswith(".folded"))
+        self.assertEqual(os.listdir(self.tmpdir.name), [filename])
+
+    def test_header_needs_staff_or_the_secret(self):
+        with override_settings(
+            PROFILING_ENABLED=True,
+            PROFILING_SAMPLE_RATE=0,
+            PROFILING_DIR=self.tmpdir.name,
+            PROFILING_SECRET="s3cret",
+        ):
+            for value in ("1", "wrong"):
+                response = self.post_cover(HTTP_X_PROFILE=value)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertNotIn("X-Profile-File", response)
+            self.assertEqual(os.listdir(self.tmpdir.name), [])
+
+            self.client.force_login(get_user_model().objects.create_user("ops", is_staff=True))
+            response = self.post_cover(HTTP_X_PROFILE="1")
+        self.assertIn("X-Profile-File", response)
+
+    def test_profiles_are_rotated(self):
+        for index in range(5):
+            path = os.path.join(self.tmpdir.name, f"old-{index}.folded")
+            with open(path, "w"):
+                pass
+            os.utime(path, (index, index))
+        with override_settings(
+            PROFILING_ENABLED=True,
+            PROFILING_SAMPLE_RATE=1,
+            PROFILING_DIR=self.tmpdir.name,
+            PROFILING_MAX_FILES=3,
+        ):
+            response = self.post_cover()
+        self.assertEqual(
+            sorted(os.listdir(self.tmpdir.name)),
+            sorted(["old-3.folded", "old-4.folded", response["X-Profile-File"]]),
+        )
+
+    def test_disabled_by_default(self):
+        with override_settings(PROFILING_DIR=self.tmpdir.name):
+            response = self.post_cover(HTTP_X_PROFILE="1")
+        self.assertNotIn("X-Profile-File", response)
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+
+    def test_speedscope_output(self):
+        profiler = SamplingProfiler(interval=0.001)
+        profiler.start()
+        deadline = time.time() + 0.05
+        while time.time() < deadline:
+            pass
+        profiler.stop()
+        self.assertTrue(profiler.stacks)
+        profile = profiler.speedscope("busy")
+        frames = profile["shared"]["frames"]
+        self.assertIn("test_speedscope_output", " ".join(frame["name"] for frame in frames))
+        self.assertEqual(len(profile["profiles"][0]["samples"]), len(profiler.stacks))
+
+
+class MemoryTests(TemporaryArtifactsMixin, APITestCase):
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.addCleanup(tracemalloc.stop)
+
+    def post_embed(self):
+        cover_file = BytesIO(make_wav(bytes(40000)))
+        cover_file.name = "cover.wav"
+        secret_file = BytesIO(b"secret")
+        secret_file.name = "secret.txt"
+        return self.client.post(
+            reverse("embed"),
+            {
+                "cover_file": cover_file,
+                "output_quality": "low",
+                "secret_files": [secret_file],
+            },
+            format="multipart",
+        )
+
+    def test_records_stage_metrics(self):
+        with override_settings(MEMORY_TRACKING=True):
+            response = self.post_embed()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for stage in ("decode", "embed", "encode", "total"):
+            summary = metrics.value(
+                "request_peak_traced_bytes", {"view": "embed", "stage": stage}
+            )
+            self.assertEqual(summary.count, 1)
+        decode = metrics.value(
+            "request_peak_traced_bytes", {"view": "embed", "stage": "decode"}
+        )
+        self.assertGreater(decode.max, 40000)
+
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        admin = get_user_model().objects.create_user("ops", is_staff=True)
+        self.client.force_authenticate(admin)
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(
+            'ciphernest_request_peak_traced_bytes_count{stage="decode",view="embed"} 1',
+            response.content.decode(),
+        )
+
+    def test_summary_max_is_a_gauge_family(self):
+        registry = Metrics()
+        registry.describe("wait_seconds", "Time spent waiting")
+        registry.observe("wait_seconds", 2.0, {"lane": "heavy"})
+        snapshot = registry.value("wait_seconds", {"lane": "heavy"})
+        registry.observe("wait_seconds", 5.0, {"lane": "heavy"})
+        self.assertEqual((snapshot.count, snapshot.max), (1, 2.0))
+
+        lines = registry.render().splitlines()
+        summary = lines.index("# TYPE ciphernest_wait_seconds summary")
+        gauge = lines.index("# TYPE ciphernest_wait_seconds_max gauge")
+        total = lines.index('ciphernest_wait_seconds_sum{lane="heavy"} 7.0')
+        self.assertLess(summary, total)
+        self.assertLess(total, gauge)
+        self.assertEqual(lines[gauge + 1], 'ciphernest_wait_seconds_max{lane="heavy"} 5.0')
+
+    def test_overlapping_requests_keep_their_peaks(self):
+        first = MemoryTracker(trace=True)
+        with first.stage("decode"):
+            data = bytearray(1 << 20)
+            del data
+            second = MemoryTracker(trace=True)
+            with second.stage("decode"):
+                pass
+            second.finish("other")
+        first.finish("embed")
+        self.assertGreaterEqual(first.stages["decode"]["peak_traced"], 1 << 20)
+
+    def test_budget_exceeded(self):
+        with override_settings(MEMORY_TRACKING=True, MEMORY_BUDGET=1024):
+            response = self.post_embed()
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(response.json()["code"], Code.MEMORY_BUDGET_EXCEEDED.value)
+        self.assertEqual(
+            metrics.value("memory_budget_exceeded_total", {"view": "embed"}), 1
+        )
+
+    def test_disabled_by_default(self):
+        self.assertEqual(self.post_embed().status_code, status.HTTP_200_OK)
+        self.assertIsNone(
+            metrics.value("request_rss_delta_bytes", {"view": "embed", "stage": "total"})
+        )
+
+
+class SchedulerTests(TemporaryArtifactsMixin, APITestCase):
+    def upload(self, name):
+        upload = BytesIO(make_wav(bytes(40000)) if name.endswith(".wav") else b"secret")
+        upload.name = name
+        return upload
+
+    def test_estimate_cost(self):
+        scheduler = Scheduler(1, 1, 1, 1, heavy_cost=200)
+        light = estimate_cost(upload_size=10 * 1024 * 1024)
+        heavy = estimate_cost(
+            upload_size=10 * 1024 * 1024,
+            payload_size=1024 * 1024,
+            bits_per_sample=1,
+            file_count=3,
+            encrypted=True,
+        )
+        self.assertIs(scheduler.lane(light), scheduler.light)
+        self.assertIs(scheduler.lane(heavy), scheduler.heavy)
+        self.assertGreater(
+            estimate_cost(0, 1024 * 1024, bits_per_sample=1),
+            estimate_cost(0, 1024 * 1024, bits_per_sample=8),
+        )
+
+    def test_lane_rejects_when_full(self):
+        lane = Lane("test", workers=1, queue_size=0)
+        entered = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with lane.admit():
+                entered.set()
+                release.wait()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        entered.wait()
+        with self.assertRaises(ServerBusyError) as context:
+            with lane.admit():
+                pass
+        self.assertGreaterEqual(context.exception.retry_after, 1)
+        release.set()
+        thread.join()
+        with lane.admit():
+            self.assertEqual(lane.pending, 1)
+
+    def test_full_heavy_lane_returns_429_but_keeps_light_lane(self):
+        with override_settings(
+            SCHEDULER_HEAVY_WORKERS=0, SCHEDULER_HEAVY_QUEUE=0, SCHEDULER_HEAVY_COST=40
+        ):
+            response = self.client.post(
+                reverse("embed"),
+                {
+                    "cover_file": self.upload("cover.wav"),
+                    "output_quality": "low",
+                    "secret_files": [self.upload("secret.txt")],
+                    "password": "password",
+                },
+                format="multipart",
+            )
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertEqual(response.json()["code"], Code.SERVER_BUSY.value)
+            self.assertEqual(response["Retry-After"], "1")
+
+            response = self.client.post(
+                reverse("cover-upload"),
+                {"cover_file": self.upload("cover.wav"), "output_quality": "low"},
+                format="multipart",
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class PipelineTests(TestCase):
+    def test_stages_preserve_order(self):
+        def double(items):
+            for item in items:
+                yield item * 2
+
+        def label(items):
+            for item in items:
+                yield f"#{item}"
+
+        pipeline = Pipeline(range(100), double, label, queue_size=2)
+        self.assertEqual(list(pipeline), [f"#{i * 2}" for i in range(100)])
+
+    def test_stage_error_reaches_consumer(self):
+        def fail(items):
+            for item in items:
+                if item == 3:
+                    raise ValueError("bad item")
+                yield item
+
+        with self.assertRaises(ValueError):
+            list(Pipeline(range(10), fail))
+
+    def test_consumer_stop_cancels_stages(self):
+        produced = []
+
+        def source():
+            for i in range(1000):
+                produced.append(i)
+                yield i
+
+        pipeline = Pipeline(source(), queue_size=2)
+        iterator = iter(pipeline)
+        self.assertEqual(next(iterator), 0)
+        iterator.close()
+        for thread in pipeline.threads:
+            thread.join(timeout=1)
+            self.assertFalse(thread.is_alive())
+        self.assertLess(len(produced), 10)
+
+    def test_pcm_file_cover_streams_embedded_cover(self):
+        frames = bytes(range(256)) * 8192
+        data = make_wav(frames)
+        cover = open_cover_file(BytesIO(data), "wav")
+        self.assertIsInstance(cover, PcmFileCover)
+        stego = LSBSteganography()
+        secret_files = [File(name="a.txt", size=5, data=b"hello")]
+        stego.embed(samples=cover.samples, secret_files=secret_files, quality="medium")
+        self.assertLess(cover.samples.filled, len(frames) // 4)
+        self.assertLess(len(cover.samples.raw), len(frames) // 2)
+
+        output = b"".join(cover.chunks(chunk_size=4096))
+        self.assertEqual(len(output), cover.content_length())
+        self.assertEqual(output[:44], data[:44])
+        self.assertEqual(output[44 + cover.samples.filled :], data[44 + cover.samples.filled :])
+        payload = stego.extract_data(open_cover(output, "wav").samples)
+        self.assertEqual(payload.extracted_files, [("a.txt", b"hello")])
+
+
+class CancellationTests(TemporaryArtifactsMixin, APITestCase):
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_checkpoint_follows_the_token_into_threads(self):
+        checkpoint()
+        token = CancelToken()
+        with cancel_scope(token):
+            checked = bind(checkpoint)
+        token.cancel()
+        checkpoint()
+        thread_errors = []
+
+        def run():
+            try:
+                checked()
+            except RequestCancelledError as e:
+                thread_errors.append(e)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        self.assertEqual(len(thread_errors), 1)
+
+    def test_embed_stops_between_chunks(self):
+        stego = LSBSteganography(engine="bytes")
+        samples = array.array("h", bytes(2 * 3 * CANCEL_CHUNK_SIZE))
+        token = CancelToken()
+        embed = stego.engine.embed
+
+        def embed_and_cancel(*args):
+            token.cancel()
+            return embed(*args)
+
+        with patch.object(stego.engine, "embed", side_effect=embed_and_cancel) as mock_embed:
+            with cancel_scope(token), self.assertRaises(RequestCancelledError):
+                stego.embed_data(samples, bytes(3 * CANCEL_CHUNK_SIZE), 8)
+        self.assertEqual(mock_embed.call_count, 1)
+
+    def test_monitor_detects_disconnect(self):
+        server, client = socket.socketpair()
+        self.addCleanup(server.close)
+        monitor = DisconnectMonitor(interval=60)
+        token = CancelToken()
+        monitor.watch(token, server)
+        client.sendall(b"body")
+        monitor.poll()
+        self.assertFalse(token.cancelled)
+
+        client.close()
+        server.recv(4)
+        monitor.poll()
+        self.assertTrue(token.cancelled)
+        self.assertEqual(monitor.clients, {})
+
+    def test_monitor_skips_wrapped_sockets(self):
+        tls_socket = MagicMock()
+        tls_socket.recv.side_effect = ValueError("non-zero flags not allowed")
+        self.assertFalse(client_gone(tls_socket))
+        monitor = DisconnectMonitor(interval=60)
+        self.assertFalse(monitor.watch(CancelToken(), tls_socket))
+        self.assertEqual(monitor.clients, {})
+
+    def test_monitor_survives_poll_errors(self):
+        class Stop(BaseException):
+            pass
+
+        monitor = DisconnectMonitor(interval=0)
+        with patch.object(monitor, "poll", side_effect=[OSError("bad socket"), Stop()]):
+            with self.assertLogs("utils.cancellation", "ERROR"), self.assertRaises(Stop):
+                monitor._run()
+
+    def test_abandoned_embed_returns_cancelled(self):
+        def disconnect(*args, **kwargs):
+            current_token().cancel()
+            checkpoint()
+
+        cover_file = BytesIO(make_wav(bytes(40000)))
+        cover_file.name = "cover.wav"
+        secret_file = BytesIO(b"secret")
+        secret_file.name = "secret.txt"
+        with patch.object(LSBSteganography, "prepare_payloads", side_effect=disconnect):
+            response = self.client.post(
+                reverse("embed"),
+                {"cover_file": cover_file, "output_quality": "low", "secret_files": [secret_file]},
+                format="multipart",
+            )
+        self.assertEqual(response.status_code, 499)
+        self.assertEqual(response.json()["code"], Code.REQUEST_CANCELLED.value)
+        labels = {"view": "embed", "outcome": "aborted"}
+        self.assertEqual(metrics.value("requests_cancelled_total", labels), 1)
+        self.assertEqual(metrics.value("cancelled_work_seconds", labels).count, 1)
+
+    def test_streaming_response_stops_at_next_chunk(self):
+        tokens = []
+
+        def get_response(request):
+            tokens.append(current_token())
+            return StreamingHttpResponse(iter([b"a", b"b", b"c"]))
+
+        request = RequestFactory().get("/")
+        response = CancellationMiddleware(get_response)(request)
+        chunks = iter(response.streaming_content)
+        self.assertEqual(next(chunks), b"a")
+        tokens[0].cancel()
+        self.assertEqual(list(chunks), [])
+
+    def test_asgi_disconnect_cancels_token(self):
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "path": reverse("metrics"),
+            "query_string": b"",
+            "headers": [],
+        }
+        messages = [
+            {"type": "http.request", "body": b"", "more_body": False},
+            {"type": "http.disconnect"},
+        ]
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            pass
+
+        async_to_sync(CancellableASGIHandler())(scope, receive, send)
+        self.assertTrue(scope[SCOPE_KEY].cancelled)
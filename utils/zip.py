@@ -1,36 +1,222 @@
-from typing import Optional
+"""
+Zip archives of extracted payloads.
+
+Each entry is decrypted, decompressed and deflated on its own pool thread
+(zlib and cryptography release the GIL), then the finished entries are
+written in header order. Entries whose sampled entropy says deflate would
+gain next to nothing (JPEGs, MP4s, archives) are stored as they are.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+import math
+import os
+import struct
+import time
 import zipfile
+import zlib
 import io
 
 from utils.exceptions import RequirePasswordError
+from lsb.cancel import bind, checkpoint
 from lsb.file import File
+from lsb.config import get_setting
 from lsb.models import ExtractedPayload
-from CipherNest.settings import SECRET_KEY
+
+ENTROPY_SAMPLE_SIZE = 4096
+ENTROPY_SAMPLES = 3
+# Bits per byte above which deflating is not worth the time
+STORED_ENTROPY = 7.5
+DEFLATE_LEVEL = 6
+MAX_WORKERS = min(8, os.cpu_count() or 1)
+
+# Records of the zip format (PKWARE APPNOTE 4.3.7, 4.3.12 and 4.3.16),
+# packed here because the entries arrive already compressed
+LOCAL_FILE_HEADER = struct.Struct(
+    "<4s"  # signature
+    "H"  # version needed to extract
+    "H"  # general purpose flags
+    "H"  # compression method
+    "H"  # modification time
+    "H"  # modification date
+    "I"  # CRC-32
+    "I"  # compressed size
+    "I"  # uncompressed size
+    "H"  # filename length
+    "H"  # extra field length
+)
+CENTRAL_DIRECTORY_HEADER = struct.Struct(
+    "<4s"  # signature
+    "H"  # version made by (high byte: host system)
+    "H"  # version needed to extract
+    "H"  # general purpose flags
+    "H"  # compression method
+    "H"  # modification time
+    "H"  # modification date
+    "I"  # CRC-32
+    "I"  # compressed size
+    "I"  # uncompressed size
+    "H"  # filename length
+    "H"  # extra field length
+    "H"  # comment length
+    "H"  # disk number start
+    "H"  # internal attributes
+    "I"  # external attributes
+    "I"  # offset of the local header
+)
+END_OF_CENTRAL_DIRECTORY = struct.Struct(
+    "<4s"  # signature
+    "H"  # number of this disk
+    "H"  # disk where the central directory starts
+    "H"  # entries on this disk
+    "H"  # entries in total
+    "I"  # central directory size
+    "I"  # central directory offset
+    "H"  # comment length
+)
+LOCAL_FILE_SIGNATURE = b"PK\x03\x04"
+CENTRAL_DIRECTORY_SIGNATURE = b"PK\x01\x02"
+END_OF_CENTRAL_DIRECTORY_SIGNATURE = b"PK\x05\x06"
+# 2.0: deflate
+VERSION_NEEDED = 20
+# Bit 11: the filename is UTF-8
+UTF8_FLAG = 0x800
+# Covers are far smaller, so archives never need ZIP64 records
+MAX_OFFSET = 0xFFFFFFFF
+MAX_ENTRIES = 0xFFFF
+
+def sample_entropy(data) -> float:
+    """Shannon entropy, in bits per byte, of a few slices spread over ``data``."""
+    if len(data) <= ENTROPY_SAMPLE_SIZE * ENTROPY_SAMPLES:
+        sample = bytes(data)
+    else:
+        step = (len(data) - ENTROPY_SAMPLE_SIZE) // (ENTROPY_SAMPLES - 1)
+        sample = b"".join(
+            data[i * step : i * step + ENTROPY_SAMPLE_SIZE] for i in range(ENTROPY_SAMPLES)
+        )
+    if not sample:
+        return 0.0
+    entropy = 0.0
+    for count in map(sample.count, range(256)):
+        if count:
+            p = count / len(sample)
+            entropy -= p * math.log2(p)
+    return entropy
+
+
+def compress_entry(filename: str, data: bytes) -> Tuple[zipfile.ZipInfo, bytes]:
+    zip_info = zipfile.ZipInfo(filename, time.localtime(time.time())[:6])
+    zip_info.file_size = len(data)
+    zip_info.CRC = zlib.crc32(data)
+    zip_info.compress_type = zipfile.ZIP_STORED
+    body = data
+    if data and sample_entropy(data) < STORED_ENTROPY:
+        compressor = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+        deflated = compressor.compress(data) + compressor.flush()
+        if len(deflated) < len(data):
+            zip_info.compress_type = zipfile.ZIP_DEFLATED
+            body = deflated
+    zip_info.compress_size = len(body)
+    return zip_info, body
+
+
+def write_zip(entries: List[Tuple[zipfile.ZipInfo, bytes]], output) -> None:
+    """Write already compressed entries and their central directory to ``output``."""
+    if len(entries) > MAX_ENTRIES:
+        raise zipfile.LargeZipFile("Archive would require ZIP64 extensions")
+    central_directory = []
+    offset = 0
+    for zip_info, body in entries:
+        try:
+            filename, flags = zip_info.filename.encode("ascii"), zip_info.flag_bits
+        except UnicodeEncodeError:
+            filename, flags = zip_info.filename.encode("utf-8"), zip_info.flag_bits | UTF8_FLAG
+        year, month, day, hour, minute, second = zip_info.date_time
+        dos_date = (year - 1980) << 9 | month << 5 | day
+        dos_time = hour << 11 | minute << 5 | second // 2
+        fields = (
+            VERSION_NEEDED,
+            flags,
+            zip_info.compress_type,
+            dos_time,
+            dos_date,
+            zip_info.CRC,
+            zip_info.compress_size,
+            zip_info.file_size,
+            len(filename),
+            0,
+        )
+        header = LOCAL_FILE_HEADER.pack(LOCAL_FILE_SIGNATURE, *fields) + filename
+        central_directory.append(
+            CENTRAL_DIRECTORY_HEADER.pack(
+                CENTRAL_DIRECTORY_SIGNATURE,
+                zip_info.create_system << 8 | VERSION_NEEDED,
+                *fields,
+                0,
+                0,
+                0,
+                zip_info.external_attr,
+                offset,
+            )
+            + filename
+        )
+        output.write(header)
+        output.write(body)
+        offset += len(header) + len(body)
+        if offset > MAX_OFFSET:
+            raise zipfile.LargeZipFile("Archive would require ZIP64 extensions")
+
+    directory = b"".join(central_directory)
+    output.write(directory)
+    output.write(
+        END_OF_CENTRAL_DIRECTORY.pack(
+            END_OF_CENTRAL_DIRECTORY_SIGNATURE,
+            0,
+            0,
+            len(entries),
+            len(entries),
+            len(directory),
+            offset,
+            0,
+        )
+    )
 
 class Zip:
     def create_zip(self, response_data: ExtractedPayload, password: Optional[str] = None) -> io.BytesIO:
         use_user_password = response_data.is_encrypted()
         use_compression = response_data.is_compressed()
+        # Solid payloads are decrypted and decompressed as a whole by the extraction
+        solid = response_data.is_solid()
 
         if use_user_password:
             if not password:
                 raise RequirePasswordError()
 
-        zip_buffer = io.BytesIO()
+        def prepare(entry):
+            checkpoint()
+            filename, filedata = entry
+            if solid:
+                data = filedata
+            elif use_user_password and use_compression:
+                data = File.decompress_decrypt(password or get_setting("SECRET_KEY"), filedata)
+            elif use_user_password:
+                data = File.decrypt(password or get_setting("SECRET_KEY"), filedata)
+            elif use_compression:
+                data = File.decompress(filedata)
+            else:
+                data = filedata
+            return compress_entry(filename, bytes(data))
 
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for filename, filedata in response_data.extracted_files:
-                zip_info = zipfile.ZipInfo(filename)
-                if use_user_password and use_compression:
-                    zip_file.writestr(zip_info, File.decompress_decrypt(password or SECRET_KEY, filedata))
-                elif use_user_password:
-                    zip_file.writestr(zip_info, File.decrypt(password or SECRET_KEY, filedata))
-                elif use_compression:
-                    zip_file.writestr(zip_info, File.decompress(filedata))
-                else:
-                    zip_file.writestr(zip_info, filedata)
-        
+        files = response_data.extracted_files
+        if len(files) > 1:
+            with ThreadPoolExecutor(max_workers=min(len(files), MAX_WORKERS)) as pool:
+                entries = list(pool.map(bind(prepare), files))
+        else:
+            entries = [prepare(entry) for entry in files]
+        checkpoint()
+
+        zip_buffer = io.BytesIO()
+        write_zip(entries, zip_buffer)
         zip_buffer.seek(0)
 
         return zip_buffer
-